@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+"""Compares the throughput (requests per second) and p99 latency of the available transports
+
+A local HTTP/1.1 keep-alive server emulating the internalusers endpoint is started on a random port,
+then every installed transport is used to run check_user_exists concurrently against it.
+HTTP/2 is only negotiated over TLS, so against this plain HTTP server the httpx transport uses HTTP/1.1.
+Point SEARCHGUARD_API_URL at a real (TLS) cluster and pass --no-server to measure HTTP/2 multiplexing.
+
+Usage: python benchmarks/transport_benchmark.py [--requests 2000] [--concurrency 16] [--no-server]
+"""
+
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+import searchguard.settings as settings
+from searchguard import transport
+from searchguard.internalusers import check_user_exists
+
+BODY = json.dumps({'benchuser': {'hash': '', 'roles': ['benchrole']}}).encode('utf-8')
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def _percentile(samples, percentile):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100.0))]
+
+
+def run(name, total, concurrency):
+    try:
+        transport.set_transport(name)
+    except ImportError as e:
+        print('{:<10} skipped ({})'.format(name, e))
+        return
+
+    def timed_call(_):
+        start = time.time()
+        check_user_exists('benchuser')
+        return time.time() - start
+
+    # Warm up the connection pools before measuring
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(timed_call, range(concurrency)))
+
+        start = time.time()
+        latencies = list(executor.map(timed_call, range(total)))
+        elapsed = time.time() - start
+
+    print('{:<10} {:>10.0f} req/s   p50 {:>7.2f} ms   p99 {:>7.2f} ms'.format(
+        name, total / elapsed, _percentile(latencies, 50) * 1000, _percentile(latencies, 99) * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--no-server', action='store_true', help='use SEARCHGUARD_API_URL instead of a local server')
+    args = parser.parse_args()
+
+    if not args.no_server:
+        server = _Server(('127.0.0.1', 0), _Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        settings.SEARCHGUARD_API_URL = 'http://127.0.0.1:{}'.format(server.server_address[1])
+
+    for name in sorted(transport.TRANSPORTS):
+        run(name, args.requests, args.concurrency)
+
+
+if __name__ == '__main__':
+    main()
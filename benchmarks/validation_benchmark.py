@@ -0,0 +1,31 @@
+#!/usr/bin/python3
+"""Measures how many role and user bodies per second the compiled validators check
+
+    python benchmarks/validation_benchmark.py
+"""
+
+import time
+from searchguard.validation import Validator
+
+
+def main():
+    validator = Validator('6')
+    bodies = {
+        'internalusers': {'user{}'.format(i): {'hash': '$2a$12$abcdef', 'roles': ['admin', 'readall'],
+                                               'attributes': {'customer': str(i)}} for i in range(100000)},
+        'roles': {'role{}'.format(i): {'cluster': ['indices:data/read/mget', 'indices:data/read/msearch'],
+                                       'indices': {'logs-{}-*'.format(i): {'*': ['READ', 'SEARCH']}}}
+                  for i in range(100000)},
+        'rolesmapping': {'role{}'.format(i): {'users': ['user{}'.format(i)], 'backendroles': [], 'hosts': []}
+                         for i in range(100000)},
+    }
+
+    for resource, records in bodies.items():
+        started = time.time()
+        invalid = validator.validate_batch(resource, records)
+        elapsed = time.time() - started
+        print('{:<14} {:>10.0f} records/s ({} invalid)'.format(resource, len(records) / elapsed, len(invalid)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+#!/usr/bin/python3
+
+import gzip
+import hashlib
+import io
+import json
+import os
+import time
+import searchguard.existence as existence
+import searchguard.priority as priority
+import searchguard.settings as settings
+import searchguard.transport as transport
+from searchguard.concurrency import run_bounded
+from searchguard.exceptions import BackupException
+from searchguard.fingerprints import METADATA_KEYS
+from searchguard.internalusers import check_user_exists, iter_users, password_generator
+from searchguard.roles import iter_roles
+from searchguard.rolesmapping import iter_rolemappings
+
+
+FORMAT = 1
+MANIFEST = 'manifest.json'
+CHECKPOINT = 'restore.checkpoint'
+READ_CHUNK_SIZE = 64 * 1024
+RESOURCES = ('roles', 'rolesmapping', 'internalusers')
+# A role mapping can only be created for an existing role, users do not depend on anything
+RESTORE_PHASES = (('roles', 'internalusers'), ('rolesmapping',))
+# Returned by _restore_entry for existing users that would only have got a new password
+_KEPT = object()
+
+
+class _HashingFile(object):
+    """File wrapper computing the sha256 of everything written through it"""
+
+    def __init__(self, fh):
+        self.fh = fh
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.fh.write(data)
+
+    def flush(self):
+        self.fh.flush()
+
+
+def _iterate(resource):
+    """Private function streaming all entries of a resource from the API"""
+    return {'roles': iter_roles, 'rolesmapping': iter_rolemappings, 'internalusers': iter_users}[resource]()
+
+
+def _write_atomically(path, data):
+    temporary = '{}.tmp'.format(path)
+    with open(temporary, 'wb') as fh:
+        fh.write(data)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(temporary, path)
+
+
+def backup(directory, on_entry=None):
+    """Streams the roles, role mappings and users to a backup directory and returns its manifest
+    Every resource is written to its own gzip compressed JSON lines file while it is being downloaded,
+    so memory use does not depend on the size of the configuration. The manifest with the sha256 of
+    every file is written last: a directory without manifest is an incomplete backup.
+    Requests are sent with the batch priority class.
+
+    :param str directory: directory to write to, created when missing
+    :param on_entry: optional callback(resource, name), called for every written entry
+    :raises: ListRolesException, ViewAllRoleMappingException, ListUsersException
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    manifest_path = os.path.join(directory, MANIFEST)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    manifest = {'format': FORMAT, 'created': time.time(), 'resources': {}}
+    with priority.priority(priority.BATCH):
+        for resource in RESOURCES:
+            filename = '{}.jsonl.gz'.format(resource)
+            path = os.path.join(directory, filename)
+            temporary = '{}.tmp'.format(path)
+            entries = 0
+            with open(temporary, 'wb') as fh:
+                hashing = _HashingFile(fh)
+                with gzip.GzipFile(filename='', mode='wb', fileobj=hashing, mtime=0) as compressed:
+                    for name, body in _iterate(resource):
+                        record = json.dumps({'name': name, 'body': body}, sort_keys=True, separators=(',', ':'))
+                        compressed.write(record.encode('utf-8') + b'\n')
+                        entries += 1
+                        if on_entry is not None:
+                            on_entry(resource, name)
+                fh.flush()
+                os.fsync(fh.fileno())
+            os.replace(temporary, path)
+            manifest['resources'][resource] = {'file': filename, 'entries': entries,
+                                               'bytes': hashing.size, 'sha256': hashing.sha256.hexdigest()}
+
+    _write_atomically(manifest_path, json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+
+def verify(directory):
+    """Checks the files of a backup against the checksums in its manifest and returns the manifest
+
+    :raises: BackupException when the backup is incomplete or a file is damaged
+    """
+    try:
+        with open(os.path.join(directory, MANIFEST), 'rb') as fh:
+            manifest = json.loads(fh.read().decode('utf-8'))
+    except (IOError, OSError, ValueError) as e:
+        raise BackupException('No valid manifest in {}, the backup is incomplete: {}'.format(directory, e))
+    if manifest.get('format') != FORMAT:
+        raise BackupException('Unsupported backup format {}'.format(manifest.get('format')))
+
+    for resource in RESOURCES:
+        if resource not in manifest['resources']:
+            raise BackupException('The backup has no {}'.format(resource))
+        meta = manifest['resources'][resource]
+        sha256 = hashlib.sha256()
+        try:
+            with open(os.path.join(directory, meta['file']), 'rb') as fh:
+                for chunk in iter(lambda: fh.read(READ_CHUNK_SIZE), b''):
+                    sha256.update(chunk)
+        except (IOError, OSError) as e:
+            raise BackupException('Cannot read the {} of the backup: {}'.format(resource, e))
+        if sha256.hexdigest() != meta['sha256']:
+            raise BackupException('Checksum mismatch for the {} of the backup, the file is damaged'.format(resource))
+    return manifest
+
+
+def iter_backup(directory, resource):
+    """Yields (name, body) for every entry of a resource in a backup, one at a time
+
+    :param str directory: backup directory
+    :param str resource: roles, rolesmapping or internalusers
+    """
+    path = os.path.join(directory, '{}.jsonl.gz'.format(resource))
+    with gzip.open(path, 'rb') as compressed:
+        for line in io.TextIOWrapper(compressed, encoding='utf-8'):
+            if line.strip():
+                record = json.loads(line)
+                yield record['name'], record['body']
+
+
+class RestoreResult(object):
+    """Result of a restore
+
+    :ivar dict restored: resource -> number of entries written
+    :ivar int skipped: entries not written because the checkpoint lists them, they are static or they are
+        existing users backed up without password hash
+    :ivar dict failed: (resource, name) -> exception
+    :ivar dict passwords: username -> generated password of the users written by this run
+    """
+
+    def __init__(self):
+        self.restored = {resource: 0 for resource in RESOURCES}
+        self.skipped = 0
+        self.failed = dict()
+        self.passwords = dict()
+
+    @property
+    def ok(self):
+        return not self.failed
+
+    def __repr__(self):
+        return '<RestoreResult restored={} skipped={} failed={}>'.format(
+            sum(self.restored.values()), self.skipped, len(self.failed))
+
+
+def _read_checkpoint(path):
+    """Private function returning the (resource, name) pairs restored by earlier runs"""
+    done = set()
+    try:
+        with open(path) as fh:
+            for line in fh:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # The last line of an interrupted run may be cut off
+                    continue
+                done.add((record[0], record[1]))
+    except (IOError, OSError):
+        pass
+    return done
+
+
+def _restore_entry(item, reset_passwords):
+    """Private function writing one entry with a PUT, which creates it or replaces its current version
+    Returns the generated password of a user backed up without password hash, _KEPT when such a user
+    exists and reset_passwords is not set.
+    """
+    resource, name, body = item
+    body = {key: value for key, value in body.items() if key not in METADATA_KEYS}
+    password = None
+    if resource == 'internalusers' and not body.get('hash'):
+        # The API does not return password hashes (anymore), such users can only be written with a new password
+        if not reset_passwords and check_user_exists(name):
+            return _KEPT
+        body.pop('hash', None)
+        body['password'] = password = password_generator()
+
+    response = transport.send('put', '{}/{}'.format(resource, name), data=json.dumps(body), headers=settings.HEADER)
+    if response.status_code not in (200, 201):
+        raise BackupException('Error restoring {} {}. status: {} - body: {}'.format(resource, name,
+                                                                                    response.status_code, response.text))
+
+    existence_filter = existence.get_filter()
+    if existence_filter is not None:
+        existence_filter.add(resource, name)
+    return password
+
+
+def restore(directory, concurrency=8, checkpoint=None, on_entry=None, reset_passwords=False, on_password=None):
+    """Restores a backup: roles and users first, then the role mappings, each with bounded concurrency
+    The backup is verified before anything is written. Every written entry is appended to the checkpoint
+    file, so an interrupted restore resumes where it stopped when it is run again. The checkpoint is
+    removed when everything was restored. Mappings of roles that failed to restore are not attempted.
+    Entries replace the current version on the cluster, static (built-in) entries are skipped.
+    Requests are sent with the batch priority class.
+    Users backed up without password hash can only be written with a new password: existing ones are
+    kept as they are unless reset_passwords is set, missing ones are created with a generated password.
+    Generated passwords are only in the result and passed to on_password, never written to the
+    checkpoint, so use on_password to keep them when the restore may be interrupted.
+
+    :param str directory: backup directory
+    :param concurrency: number of parallel requests or an AdaptiveLimiter
+    :param str checkpoint: path of the checkpoint file (default: restore.checkpoint in the backup directory)
+    :param on_entry: optional callback(resource, name, error), called for every attempted entry
+    :param bool reset_passwords: give existing users without password hash in the backup a new password
+    :param on_password: optional callback(username, password), called for every written generated password
+    :returns RestoreResult:
+    :raises: BackupException when the backup is incomplete or damaged
+    """
+    verify(directory)
+    checkpoint = checkpoint or os.path.join(directory, CHECKPOINT)
+    done = _read_checkpoint(checkpoint)
+    result = RestoreResult()
+
+    def entries(phase):
+        for resource in phase:
+            for name, body in iter_backup(directory, resource):
+                if (resource, name) in done or body.get('static'):
+                    result.skipped += 1
+                elif resource == 'rolesmapping' and ('roles', name) in result.failed:
+                    result.failed[(resource, name)] = BackupException('Role {} was not restored'.format(name))
+                else:
+                    yield resource, name, body
+
+    log = os.fdopen(os.open(checkpoint, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600), 'a')
+    with priority.priority(priority.BATCH), log:
+        for phase in RESTORE_PHASES:
+            for outcome in run_bounded(lambda item: _restore_entry(item, reset_passwords), entries(phase),
+                                       concurrency):
+                resource, name, _ = outcome.item
+                if outcome.error is not None:
+                    result.failed[(resource, name)] = outcome.error
+                elif outcome.result is _KEPT:
+                    result.skipped += 1
+                else:
+                    result.restored[resource] += 1
+                    if outcome.result is not None:
+                        result.passwords[name] = outcome.result
+                        if on_password is not None:
+                            on_password(name, outcome.result)
+                    log.write(json.dumps([resource, name]) + '\n')
+                    log.flush()
+                if on_entry is not None:
+                    on_entry(resource, name, outcome.error)
+
+    if result.ok:
+        os.remove(checkpoint)
+    return result
@@ -0,0 +1,152 @@
+#!/usr/bin/python3
+
+import math
+import threading
+import time
+import searchguard.transport as transport
+from searchguard.concurrency import run_bounded
+
+
+PER_NAME = 'per_name'
+BULK = 'bulk'
+
+
+class CostModel(object):
+    """Estimates what reading a batch of resources costs with a GET per name or with one bulk GET
+    A GET per name costs about one round trip, concurrent GETs run in rounds of the concurrency. The bulk
+    GET costs a round trip plus the transfer and parse time of the whole listing, which is learned from
+    the observed size and latency of earlier bulk reads.
+
+    :param float initial_latency: round trip time assumed before any GET is observed
+    :param float smoothing: weight of a new observation in the moving averages
+    """
+
+    def __init__(self, initial_latency=0.05, smoothing=0.3):
+        self.latency = initial_latency
+        self.smoothing = smoothing
+        self.bulk_bytes = None
+        self.seconds_per_byte = None
+        self._lock = threading.Lock()
+
+    def _average(self, current, value):
+        return value if current is None else current + self.smoothing * (value - current)
+
+    def observe_get(self, latency):
+        with self._lock:
+            self.latency = self._average(self.latency, latency)
+
+    def observe_bulk(self, latency, size):
+        """Records a bulk read of a size bytes (characters) body that took latency seconds"""
+        with self._lock:
+            self.bulk_bytes = size
+            if size:
+                self.seconds_per_byte = self._average(self.seconds_per_byte, max(latency - self.latency, 0) / size)
+
+    def estimate(self, count, concurrency):
+        """Returns the estimated seconds {per_name: ..., bulk: ...} to read count names, bulk is None while
+        no bulk read was observed
+        """
+        with self._lock:
+            per_name = math.ceil(count / float(concurrency)) * self.latency
+            bulk = None
+            if self.bulk_bytes is not None and self.seconds_per_byte is not None:
+                bulk = self.latency + self.bulk_bytes * self.seconds_per_byte
+        return {PER_NAME: per_name, BULK: bulk}
+
+    def choose(self, count, concurrency):
+        """Returns the cheapest strategy and the estimates
+        Without a bulk observation the bulk read is chosen once more than one round of GETs is needed,
+        as it costs at least one round trip as well.
+        """
+        estimates = self.estimate(count, concurrency)
+        if estimates[BULK] is None:
+            return (BULK if count > concurrency else PER_NAME), estimates
+        return (BULK if estimates[BULK] < estimates[PER_NAME] else PER_NAME), estimates
+
+
+class BatchReadResult(object):
+    """Result of view_users and view_roles
+
+    :ivar dict found: name -> properties of every requested name that exists
+    :ivar list missing: requested names that do not exist
+    :ivar str strategy: per_name (concurrent GET per name) or bulk (one GET of the whole listing)
+    :ivar dict estimates: the estimated seconds of both strategies (bulk is None before it was observed)
+    :ivar float elapsed: seconds the read took
+    """
+
+    def __init__(self, strategy, estimates):
+        self.found = {}
+        self.missing = []
+        self.strategy = strategy
+        self.estimates = estimates
+        self.elapsed = None
+
+    def __repr__(self):
+        return '<BatchReadResult strategy={} found={} missing={}>'.format(
+            self.strategy, len(self.found), len(self.missing))
+
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def get_cost_model(resource):
+    """Returns the CostModel of a resource type (internalusers or roles)"""
+    with _models_lock:
+        return _models.setdefault(resource, CostModel())
+
+
+def read_batch(resource, names, exception, concurrency=8, strategy=None, on_listing=None):
+    """Reads the resources with the given names, choosing the cheapest strategy with the cost model
+
+    :param str resource: internalusers or roles
+    :param names: iterable of names
+    :param exception: SearchGuardException subclass raised when a read fails
+    :param int concurrency: number of parallel GETs for the per_name strategy
+    :param str strategy: force per_name or bulk instead of choosing
+    :param on_listing: optional callback(dict) receiving the complete listing of a bulk read
+    :returns BatchReadResult:
+    :raises: exception
+    """
+    names = sorted(set(names))
+    model = get_cost_model(resource)
+    chosen, estimates = model.choose(len(names), concurrency)
+    result = BatchReadResult(strategy or chosen, estimates)
+    started = time.time()
+
+    if names and result.strategy == BULK:
+        response = transport.send('get', '{}/'.format(resource))
+        if response.status_code != 200:
+            raise exception('Error reading {} - status: {} - msg: {}'.format(resource, response.status_code,
+                                                                             response.text))
+        listing = transport.parse_json(response)
+        model.observe_bulk(time.time() - started, len(response.text))
+        if on_listing is not None:
+            on_listing(listing)
+        for name in names:
+            if name in listing:
+                result.found[name] = listing[name]
+            else:
+                result.missing.append(name)
+    elif names:
+        def read(name):
+            request_started = time.time()
+            response = transport.send('get', '{}/{}'.format(resource, name), hedge=True)
+            model.observe_get(time.time() - request_started)
+            if response.status_code == 404:
+                return None
+            if response.status_code != 200:
+                raise exception('Error reading {} {} - msg: {}'.format(resource, name, response.text))
+            return transport.parse_json(response)[name]
+
+        for outcome in run_bounded(read, names, concurrency):
+            if outcome.error is not None:
+                raise outcome.error
+            if outcome.result is None:
+                result.missing.append(outcome.item)
+            else:
+                result.found[outcome.item] = outcome.result
+        result.missing.sort()
+
+    result.elapsed = time.time() - started
+    return result
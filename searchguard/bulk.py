@@ -0,0 +1,206 @@
+#!/usr/bin/python3
+
+import json
+import time
+import searchguard.settings as settings
+import searchguard.transport as transport
+import searchguard.existence as existence
+import searchguard.fingerprints as fingerprints
+from searchguard.internalusers import password_generator
+
+
+PUT = 'put'
+UPDATE = 'update'
+DELETE = 'delete'
+
+# JSON Patch operation per kind of write: add creates or overwrites an entity, replace and remove need one
+PATCH_OPS = {PUT: 'add', UPDATE: 'replace', DELETE: 'remove'}
+
+# Status codes of clusters without PATCH support on the resource endpoints
+PATCH_UNSUPPORTED = (405, 501)
+# Status codes of a chunk rejected because of some of its entities, it is split to isolate them
+ENTITY_ERRORS = (400, 404, 409)
+# Overloaded cluster: the chunk is sent again after OVERLOAD_DELAY seconds, doubling up to OVERLOAD_RETRIES times
+OVERLOADED = 429
+OVERLOAD_RETRIES = 5
+OVERLOAD_DELAY = 0.5
+
+
+class BulkResult(object):
+    """Result of BulkWriter.flush
+
+    :ivar list succeeded: names of the entities that were written
+    :ivar dict failed: name -> error message for every entity that could not be written
+    :ivar dict passwords: username -> generated password for put users without password or hash
+    :ivar int requests: number of API requests used
+    :ivar bool patched: False when the cluster did not support PATCH and per-entity calls were used
+    """
+
+    def __init__(self):
+        self.succeeded = []
+        self.failed = {}
+        self.passwords = {}
+        self.requests = 0
+        self.patched = True
+
+    @property
+    def ok(self):
+        return not self.failed
+
+    def __repr__(self):
+        return '<BulkResult succeeded={} failed={} requests={}{}>'.format(
+            len(self.succeeded), len(self.failed), self.requests, '' if self.patched else ' per-entity')
+
+
+def _retry_after(response, default):
+    """Private function returning the seconds of a Retry-After header, or default when there is none"""
+    try:
+        return float(response.headers['Retry-After'])
+    except (KeyError, TypeError, ValueError):
+        return default
+
+
+def _pointer(name):
+    """Private function returning the JSON Pointer of an entity, escaping ~ and / in its name"""
+    return '/' + name.replace('~', '~0').replace('/', '~1')
+
+
+class BulkWriter(object):
+    """Collects puts, updates and deletes of internal users or roles and writes them with chunked
+    multi-operation PATCH requests on the resource endpoint, so a chunk costs one request and one security
+    config reload instead of two requests per entity.
+    A PATCH is applied atomically: when a chunk is rejected because of its entities (400, 404, 409) it is
+    split in halves until the failing entities are isolated, the other entities of the chunk are still
+    written. A chunk answered with 429 is sent again with exponential backoff (honouring Retry-After),
+    any other error (401, 403, 5xx) fails the whole chunk without further requests. Clusters that do not
+    support PATCH (405 or 501) are written with a PUT or DELETE per entity instead.
+
+    A put is an upsert like the PUT of the API: it creates the entity or replaces an existing one, without
+    telling which. An update and a delete fail when the entity does not exist
+    (except for updates on clusters without PATCH support, where the PUT creates it). No existence
+    checks are sent.
+
+    :param str resource: internalusers or roles
+    :param int chunk_size: maximum number of operations per PATCH request
+    """
+
+    def __init__(self, resource, chunk_size=None):
+        self.resource = resource
+        self.chunk_size = chunk_size or settings.SEARCHGUARD_BULK_CHUNK_SIZE
+        self._operations = []
+        self._passwords = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.result = self.flush()
+
+    def put(self, name, properties=None):
+        """Queues creating or replacing an entity. Users without password or hash get a generated password"""
+        properties = dict(properties or {})
+        if self.resource == 'internalusers' and 'password' not in properties and 'hash' not in properties:
+            properties['password'] = self._passwords[name] = password_generator()
+        self._operations.append((PUT, name, properties))
+
+    def update(self, name, properties):
+        """Queues the replacement of an existing entity with properties"""
+        self._operations.append((UPDATE, name, properties))
+
+    def delete(self, name):
+        """Queues the deletion of an existing entity"""
+        self._operations.append((DELETE, name, None))
+
+    def flush(self):
+        """Writes all queued operations and returns a BulkResult
+        Failures of single entities do not raise, they are collected in BulkResult.failed.
+        """
+        operations, self._operations = self._operations, []
+        passwords, self._passwords = self._passwords, {}
+
+        result = BulkResult()
+        for start in range(0, len(operations), self.chunk_size):
+            chunk = operations[start:start + self.chunk_size]
+            if result.patched:
+                self._patch(chunk, result)
+            else:
+                self._write_each(chunk, result)
+
+        result.passwords = {name: password for name, password in passwords.items() if name in result.succeeded}
+        return result
+
+    def _patch(self, chunk, result):
+        body = [{'op': PATCH_OPS[kind], 'path': _pointer(name)} for kind, name, _ in chunk]
+        for operation, (kind, _, properties) in zip(body, chunk):
+            if kind != DELETE:
+                operation['value'] = properties
+
+        for attempt in range(OVERLOAD_RETRIES + 1):
+            response = transport.send('patch', self.resource, data=json.dumps(body), headers=settings.HEADER)
+            result.requests += 1
+            if response.status_code != OVERLOADED or attempt == OVERLOAD_RETRIES:
+                break
+            time.sleep(_retry_after(response, OVERLOAD_DELAY * 2 ** attempt))
+
+        if response.status_code in PATCH_UNSUPPORTED:
+            result.patched = False
+            self._write_each(chunk, result)
+        elif response.status_code in (200, 201):
+            for operation in chunk:
+                self._succeeded(operation, result)
+        elif response.status_code in ENTITY_ERRORS and len(chunk) > 1:
+            # The chunk was rejected as a whole, isolate the failing operations
+            half = len(chunk) // 2
+            self._patch(chunk[:half], result)
+            self._patch(chunk[half:], result)
+        else:
+            # Splitting does not help against authorization errors, overload or server errors
+            for _, name, _ in chunk:
+                result.failed[name] = 'status: {} - msg: {}'.format(response.status_code, response.text)
+
+    def _write_each(self, chunk, result):
+        for operation in chunk:
+            kind, name, properties = operation
+            path = '{}/{}'.format(self.resource, name)
+            if kind == DELETE:
+                response = transport.send('delete', path)
+            else:
+                response = transport.send('put', path, data=json.dumps(properties), headers=settings.HEADER)
+            result.requests += 1
+
+            if response.status_code in (200, 201):
+                self._succeeded(operation, result)
+            else:
+                result.failed[name] = 'status: {} - msg: {}'.format(response.status_code, response.text)
+
+    def _succeeded(self, operation, result):
+        kind, name, properties = operation
+        result.succeeded.append(name)
+
+        existence_filter = existence.get_filter()
+        if existence_filter is not None and kind != DELETE:
+            existence_filter.add(self.resource, name)
+
+        cache = fingerprints.get_cache()
+        if cache is not None and self.resource == 'roles':
+            if kind == DELETE:
+                cache.discard('roles', name)
+            else:
+                cache.set('roles', name, properties)
+
+
+def bulk_users(chunk_size=None):
+    """Returns a BulkWriter for Search Guard internal users, use it as context manager or call flush
+
+    :param int chunk_size: maximum number of operations per request (default SEARCHGUARD_BULK_CHUNK_SIZE)
+    """
+    return BulkWriter('internalusers', chunk_size)
+
+
+def bulk_roles(chunk_size=None):
+    """Returns a BulkWriter for Search Guard roles, use it as context manager or call flush
+
+    :param int chunk_size: maximum number of operations per request (default SEARCHGUARD_BULK_CHUNK_SIZE)
+    """
+    return BulkWriter('roles', chunk_size)
@@ -0,0 +1,175 @@
+#!/usr/bin/python3
+
+import threading
+import time
+from collections import deque
+from searchguard.exceptions import CircuitOpenException
+
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker(object):
+    """Tracks the outcome of requests to one Search Guard endpoint and fails fast while it is unhealthy
+
+    The circuit opens when at least min_requests requests were made within the last window seconds and
+    the failure rate reached failure_rate. After cooldown seconds a limited number of trial requests is
+    let through (half-open), a successful trial closes the circuit, a failed one opens it again.
+
+    :param str name: name of the endpoint, passed to the listeners
+    :param float failure_rate: fraction of failed requests (0-1) that opens the circuit
+    :param int min_requests: minimum number of requests in the window before the circuit can open
+    :param float window: length of the rolling window in seconds
+    :param float cooldown: seconds the circuit stays open before allowing trial requests
+    :param int half_open_requests: number of concurrent trial requests allowed in the half-open state
+    """
+
+    def __init__(self, name, failure_rate=0.5, min_requests=10, window=30, cooldown=30, half_open_requests=1):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.window = window
+        self.cooldown = cooldown
+        self.half_open_requests = half_open_requests
+
+        self._lock = threading.RLock()
+        self._state = CLOSED
+        self._outcomes = deque()
+        self._opened_at = None
+        self._trials = 0
+        self._listeners = []
+
+    @property
+    def state(self):
+        with self._lock:
+            self._maybe_half_open(time.time())
+            return self._state
+
+    def add_listener(self, callback):
+        """Registers callback(name, old_state, new_state), called on every state change"""
+        self._listeners.append(callback)
+
+    def before_request(self):
+        """Reserves a request slot, raises CircuitOpenException when the circuit does not allow requests"""
+        with self._lock:
+            self._maybe_half_open(time.time())
+
+            if self._state == OPEN:
+                raise CircuitOpenException('Circuit for {} is open, failing fast'.format(self.name))
+            if self._state == HALF_OPEN:
+                if self._trials >= self.half_open_requests:
+                    raise CircuitOpenException('Circuit for {} is half-open, trial request in progress'.format(self.name))
+                self._trials += 1
+
+    def cancel_request(self):
+        """Gives back the slot reserved by before_request for a request whose outcome does not count"""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._trials = max(0, self._trials - 1)
+
+    def record_success(self):
+        self._record(True)
+
+    def record_failure(self):
+        self._record(False)
+
+    def reset(self):
+        """Closes the circuit and forgets all recorded outcomes"""
+        with self._lock:
+            self._outcomes.clear()
+            self._set_state(CLOSED)
+
+    def _record(self, success):
+        now = time.time()
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._trials = max(0, self._trials - 1)
+                if success:
+                    self._outcomes.clear()
+                    self._set_state(CLOSED)
+                else:
+                    self._open(now)
+                return
+
+            if self._state == OPEN:
+                # Late result of a request started before the circuit opened
+                return
+
+            self._outcomes.append((now, success))
+            while self._outcomes and self._outcomes[0][0] < now - self.window:
+                self._outcomes.popleft()
+
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            if len(self._outcomes) >= self.min_requests and failures >= self.failure_rate * len(self._outcomes):
+                self._open(now)
+
+    def _open(self, now):
+        self._opened_at = now
+        self._trials = 0
+        self._outcomes.clear()
+        self._set_state(OPEN)
+
+    def _maybe_half_open(self, now):
+        if self._state == OPEN and now - self._opened_at >= self.cooldown:
+            self._set_state(HALF_OPEN)
+
+    def _set_state(self, state):
+        previous, self._state = self._state, state
+        if previous != state:
+            for listener in self._listeners:
+                listener(self.name, previous, state)
+
+
+_options = None
+_listeners = []
+_breakers = {}
+_registry_lock = threading.Lock()
+
+
+def enable(**options):
+    """Enables a circuit breaker per API endpoint. Accepts the keyword arguments of CircuitBreaker"""
+    global _options
+
+    with _registry_lock:
+        _options = options
+        _breakers.clear()
+
+
+def disable():
+    """Disables the circuit breakers, requests are no longer tracked"""
+    global _options
+
+    with _registry_lock:
+        _options = None
+        _breakers.clear()
+
+
+def add_listener(callback):
+    """Registers callback(endpoint, old_state, new_state) for state changes of every endpoint circuit"""
+    with _registry_lock:
+        _listeners.append(callback)
+        for breaker in _breakers.values():
+            breaker.add_listener(callback)
+
+
+def get_breaker(endpoint):
+    """Returns the circuit breaker for an endpoint URL, or None when circuit breaking is disabled"""
+    if _options is None:
+        return None
+
+    with _registry_lock:
+        breaker = _breakers.get(endpoint)
+        if breaker is None and _options is not None:
+            breaker = _breakers[endpoint] = CircuitBreaker(endpoint, **_options)
+            for listener in _listeners:
+                breaker.add_listener(listener)
+        return breaker
+
+
+def states():
+    """Returns a dict with the current state per endpoint, useful for health checks and alerting"""
+    with _registry_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.state for breaker in breakers}
@@ -0,0 +1,292 @@
+#!/usr/bin/python3
+"""sgctl, command line tool to stream users and role mappings in and out of Search Guard
+
+Records are read and written as JSON lines (one object per line) or CSV, picked by the file extension
+or the --format option. Input is streamed and processed with bounded concurrency, so the memory usage
+does not depend on the size of the file. Use - to read from stdin or write to stdout.
+"""
+
+import argparse
+import csv
+import io
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from searchguard import transport
+from searchguard import backup as backups
+from searchguard import priority
+from searchguard.concurrency import run_bounded
+from searchguard.limiter import AdaptiveLimiter
+from searchguard.internalusers import create_user, delete_user, iter_users
+from searchguard.rolesmapping import create_rolemapping, modify_rolemapping, iter_rolemappings
+
+
+LIST_FIELDS = ('roles', 'backendroles', 'users', 'hosts')
+LIST_SEPARATOR = ';'
+USER_COLUMNS = ('username', 'password', 'hash', 'roles', 'attributes')
+ROLEMAPPING_COLUMNS = ('role', 'users', 'backendroles', 'hosts')
+
+
+class Progress(object):
+    """Prints the live throughput and error count on a single (stderr) line"""
+
+    def __init__(self, label, stream=None, interval=0.5, limiter=None):
+        self.label = label
+        self.stream = stream or sys.stderr
+        self.interval = interval
+        self.limiter = limiter
+        self.done = 0
+        self.errors = 0
+        self._start = self._printed = time.time()
+
+    def update(self, error=None, item=None):
+        self.done += 1
+        if error is not None:
+            self.errors += 1
+            self.stream.write('\rerror: {}: {}\n'.format(item, error))
+
+        if time.time() - self._printed >= self.interval:
+            self._print('')
+
+    def finish(self):
+        self._print('\n')
+
+    def _print(self, end):
+        self._printed = time.time()
+        rate = self.done / max(self._printed - self._start, 1e-9)
+        limit = ', limit {}'.format(self.limiter.metrics()['limit']) if self.limiter is not None else ''
+        self.stream.write('\r{}: {} done, {} errors, {:.0f}/s{}{}'.format(
+            self.label, self.done, self.errors, rate, limit, end))
+        self.stream.flush()
+
+
+@contextmanager
+def _open(path, mode):
+    if path == '-':
+        # Never close stdin/stdout
+        yield sys.stdin if 'r' in mode else sys.stdout
+        return
+
+    with io.open(path, mode, newline='') as fh:
+        yield fh
+
+
+def _format(path, fmt):
+    if fmt:
+        return fmt
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+def _decode_csv_row(row):
+    record = dict()
+    for key, value in row.items():
+        if value in (None, ''):
+            continue
+        if key in LIST_FIELDS:
+            value = [item for item in value.split(LIST_SEPARATOR) if item]
+        elif key == 'attributes':
+            value = json.loads(value)
+        record[key] = value
+    return record
+
+
+def _encode_csv_row(record):
+    row = dict()
+    for key, value in record.items():
+        if isinstance(value, list):
+            value = LIST_SEPARATOR.join(value)
+        elif isinstance(value, dict):
+            value = json.dumps(value, sort_keys=True)
+        row[key] = value
+    return row
+
+
+def read_records(fh, fmt):
+    """Yields the records of a JSON lines or CSV file one at a time"""
+    if fmt == 'csv':
+        for row in csv.DictReader(fh):
+            yield _decode_csv_row(row)
+        return
+
+    for line in fh:
+        if line.strip():
+            yield json.loads(line)
+
+
+class RecordWriter(object):
+    """Writes records to a JSON lines or CSV file, one at a time (thread-safe)"""
+
+    def __init__(self, fh, fmt, columns):
+        self.fh = fh
+        self.fmt = fmt
+        self._lock = threading.Lock()
+        if fmt == 'csv':
+            self._csv = csv.DictWriter(fh, fieldnames=columns, extrasaction='ignore')
+            self._csv.writeheader()
+
+    def write(self, record):
+        with self._lock:
+            if self.fmt == 'csv':
+                self._csv.writerow(_encode_csv_row(record))
+            else:
+                self.fh.write(json.dumps(record, sort_keys=True) + '\n')
+
+
+def _run(label, func, records, concurrency, key):
+    progress = Progress(label, limiter=concurrency if isinstance(concurrency, AdaptiveLimiter) else None)
+    for outcome in run_bounded(func, records, concurrency):
+        progress.update(outcome.error, outcome.item.get(key))
+    progress.finish()
+    return progress
+
+
+def export_users(args):
+    fmt = _format(args.output, args.format)
+    progress = Progress('export-users')
+    with _open(args.output, 'w') as fh:
+        writer = RecordWriter(fh, fmt, USER_COLUMNS)
+        for username, properties in iter_users():
+            writer.write(dict(properties, username=username))
+            progress.update()
+    progress.finish()
+    return progress
+
+
+def import_users(args):
+    fmt = _format(args.input, args.format)
+    with _open(args.input, 'r') as fh, _open(args.passwords, 'w') as passwords_fh:
+        passwords = RecordWriter(passwords_fh, _format(args.passwords, args.format), ('username', 'password'))
+
+        def create(record):
+            properties = dict(record)
+            username = properties.pop('username')
+            password = create_user(username, properties.pop('password', None), properties)
+            if password:
+                passwords.write({'username': username, 'password': password})
+
+        return _run('import-users', create, read_records(fh, fmt), args.concurrency, 'username')
+
+
+def delete_users(args):
+    fmt = _format(args.input, args.format)
+    with _open(args.input, 'r') as fh:
+        return _run('delete-users', lambda record: delete_user(record['username']),
+                    read_records(fh, fmt), args.concurrency, 'username')
+
+
+def export_rolemappings(args):
+    fmt = _format(args.output, args.format)
+    progress = Progress('export-rolemappings')
+    with _open(args.output, 'w') as fh:
+        writer = RecordWriter(fh, fmt, ROLEMAPPING_COLUMNS)
+        for role, properties in iter_rolemappings():
+            writer.write(dict(properties, role=role))
+            progress.update()
+    progress.finish()
+    return progress
+
+
+def import_rolemappings(args):
+    fmt = _format(args.input, args.format)
+
+    def apply(record):
+        properties = dict(record)
+        role = properties.pop('role')
+        if args.action == 'create':
+            create_rolemapping(role, properties)
+        else:
+            modify_rolemapping(role, properties, args.action)
+
+    with _open(args.input, 'r') as fh:
+        return _run('import-rolemappings', apply, read_records(fh, fmt), args.concurrency, 'role')
+
+
+def backup(args):
+    progress = Progress('backup')
+    backups.backup(args.directory, on_entry=lambda resource, name: progress.update())
+    progress.finish()
+    return progress
+
+
+def restore(args):
+    progress = Progress('restore', limiter=args.concurrency if isinstance(args.concurrency, AdaptiveLimiter) else None)
+    with _open(args.passwords, 'w') as fh:
+        # Written as they are generated, so an interrupted restore does not lose them
+        passwords = RecordWriter(fh, _format(args.passwords, args.format), ('username', 'password'))
+        result = backups.restore(
+            args.directory, args.concurrency, args.checkpoint,
+            on_entry=lambda resource, name, error: progress.update(error, '{}/{}'.format(resource, name)),
+            reset_passwords=args.reset_passwords,
+            on_password=lambda username, password: passwords.write({'username': username, 'password': password}))
+    progress.finish()
+    # Mappings of failed roles are reported in the result without being attempted
+    progress.errors = len(result.failed)
+    return progress
+
+
+def _concurrency(value):
+    if value == 'auto':
+        return AdaptiveLimiter()
+    return int(value)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='sgctl', description=__doc__.splitlines()[0])
+    parser.add_argument('--format', choices=('jsonl', 'csv'), help='record format (default: by file extension)')
+    parser.add_argument('--concurrency', type=_concurrency, default=8,
+                        help='number of parallel API calls, or auto to adapt it to the cluster (default: 8)')
+    parser.add_argument('--transport', choices=sorted(transport.TRANSPORTS), help='HTTP transport to use')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    command = commands.add_parser('export-users', help='write all internal users')
+    command.add_argument('output', nargs='?', default='-')
+    command.set_defaults(func=export_users)
+
+    command = commands.add_parser('import-users', help='create users, records need a username')
+    command.add_argument('input')
+    command.add_argument('--passwords', default='-', help='where to write the passwords of the created users')
+    command.set_defaults(func=import_users)
+
+    command = commands.add_parser('delete-users', help='delete users, records need a username')
+    command.add_argument('input')
+    command.set_defaults(func=delete_users)
+
+    command = commands.add_parser('export-rolemappings', help='write all role mappings')
+    command.add_argument('output', nargs='?', default='-')
+    command.set_defaults(func=export_rolemappings)
+
+    command = commands.add_parser('import-rolemappings', help='create or modify role mappings, records need a role')
+    command.add_argument('input')
+    command.add_argument('--action', choices=('create', 'replace', 'merge', 'split'), default='merge')
+    command.set_defaults(func=import_rolemappings)
+
+    command = commands.add_parser('backup', help='write roles, role mappings and users to a backup directory')
+    command.add_argument('directory')
+    command.set_defaults(func=backup)
+
+    command = commands.add_parser('restore', help='restore a backup directory, resuming an interrupted restore')
+    command.add_argument('directory')
+    command.add_argument('--checkpoint', help='checkpoint file (default: restore.checkpoint in the directory)')
+    command.add_argument('--passwords', default='-', help='where to write the new passwords of users without hash')
+    command.add_argument('--reset-passwords', action='store_true',
+                         help='give existing users without hash in the backup a new password instead of keeping them')
+    command.set_defaults(func=restore)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.transport:
+        transport.set_transport(args.transport)
+
+    with priority.priority(priority.BATCH):
+        progress = args.func(args)
+    return 1 if progress.errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
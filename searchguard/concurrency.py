@@ -0,0 +1,51 @@
+#!/usr/bin/python3
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import searchguard.deadline as deadline
+import searchguard.priority as priority
+from searchguard.limiter import AdaptiveLimiter
+
+
+Outcome = namedtuple('Outcome', ['item', 'result', 'error'])
+
+
+def _call(func, item):
+    try:
+        return Outcome(item, func(item), None)
+    except Exception as e:
+        return Outcome(item, None, e)
+
+
+def run_bounded(func, items, concurrency=8):
+    """Calls func for every item using a pool of worker threads and yields an Outcome per item
+    Items are consumed lazily and at most twice the concurrency is in flight at any time, so arbitrarily
+    long (streamed) inputs are processed in constant memory. Outcomes are yielded in completion order,
+    exceptions raised by func are returned in Outcome.error instead of being raised.
+    The workers run under the deadline of the calling thread, if any.
+    With an AdaptiveLimiter as concurrency, the number of calls in flight follows its limit.
+    The workers send their requests with the priority class of the calling thread.
+
+    :param func: callable taking a single item
+    :param items: iterable of items
+    :param concurrency: number of worker threads or an AdaptiveLimiter
+    :returns: generator of Outcome(item, result, error)
+    """
+    if isinstance(concurrency, AdaptiveLimiter):
+        func = concurrency.wrap(func)
+        concurrency = concurrency.max_limit
+
+    func = deadline.propagate(priority.propagate(func))
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = set()
+        for item in items:
+            pending.add(executor.submit(_call, func, item))
+            if len(pending) >= concurrency * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+
+import threading
+import time
+from contextlib import contextmanager
+from searchguard.exceptions import DeadlineExceededException
+
+
+_local = threading.local()
+
+
+class Deadline(object):
+    """Point in time by which an operation, including all of its requests, has to be finished
+    expires_at is on the time.monotonic() clock, so wall clock adjustments do not move it.
+    """
+
+    def __init__(self, expires_at):
+        self.expires_at = expires_at
+
+    def remaining(self):
+        """Returns the seconds left, can be negative when the deadline passed"""
+        return self.expires_at - time.monotonic()
+
+    def expired(self):
+        return self.remaining() <= 0
+
+
+def current():
+    """Returns the Deadline of the running operation in this thread, or None"""
+    return getattr(_local, 'deadline', None)
+
+
+@contextmanager
+def deadline(seconds):
+    """Gives every request made in the with block (also in run_bounded workers) a shared time budget
+    Requests are sent with timeouts capped to the remaining budget and fail fast with
+    DeadlineExceededException once it is spent. A nested deadline can only shorten the outer one.
+
+    :param float seconds: time budget of the block
+    """
+    outer = current()
+    expires_at = time.monotonic() + seconds
+    if outer is not None:
+        expires_at = min(expires_at, outer.expires_at)
+
+    _local.deadline = Deadline(expires_at)
+    try:
+        yield _local.deadline
+    finally:
+        _local.deadline = outer
+
+
+def remaining():
+    """Returns the seconds left of the current deadline (None without deadline)
+
+    :raises: DeadlineExceededException
+    """
+    active = current()
+    if active is None:
+        return None
+
+    seconds = active.remaining()
+    if seconds <= 0:
+        raise DeadlineExceededException('Deadline exceeded by {:.3f}s'.format(-seconds))
+    return seconds
+
+
+def propagate(func):
+    """Wraps func so it runs under the deadline of the calling thread, for use in worker threads"""
+    active = current()
+    if active is None:
+        return func
+
+    def wrapper(*args, **kwargs):
+        outer = current()
+        _local.deadline = active
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.deadline = outer
+    return wrapper
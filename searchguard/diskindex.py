@@ -0,0 +1,315 @@
+#!/usr/bin/python3
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_left
+import searchguard.transport as transport
+from searchguard.exceptions import ListUsersException, ViewAllRoleMappingException
+from searchguard.userindex import prefix_of
+
+
+MAGIC = b'SGIX'
+VERSION = 1
+BYTE_ORDERS = {'little': 1, 'big': 2}
+# magic, format version, byte order of the arrays, build time, sha1 of the internalusers and rolesmapping bodies
+HEADER = struct.Struct('<4sHHd20s20s')
+# offset and length in bytes of every section
+SECTION = struct.Struct('<QQ')
+SECTIONS = ('user_names', 'user_offsets', 'user_flags', 'user_roles_ptr', 'user_roles',
+            'role_names', 'role_offsets', 'role_members_ptr', 'role_members',
+            'prefix_names', 'prefix_offsets', 'prefix_users')
+# Users are internal users (listed by list_users) or only appear in role mappings
+INTERNAL = 1
+ALIGNMENT = 8
+
+
+def _strings(values):
+    """Private function packing strings into one utf-8 blob plus an array of n + 1 offsets"""
+    blob, offsets = bytearray(), array('I', [0])
+    for value in values:
+        blob += value.encode('utf-8')
+        offsets.append(len(blob))
+    return bytes(blob), offsets
+
+
+def _postings(lists):
+    """Private function packing lists of ids into one array plus an array of n + 1 offsets"""
+    values, offsets = array('I'), array('I', [0])
+    for ids in lists:
+        values.extend(ids)
+        offsets.append(len(values))
+    return values, offsets
+
+
+def _user_key(username):
+    return prefix_of(username), username
+
+
+def write_index(path, users, rolemappings, digests=None):
+    """Writes an index file and atomically replaces path with it, readers keep their current mapping
+
+    :param str path: path of the index file
+    :param dict users: users as returned by list_users
+    :param dict rolemappings: role mappings as returned by view_all_rolemappings
+    :param tuple digests: sha1 digests of the internalusers and rolesmapping response bodies
+    """
+    roles = sorted(rolemappings)
+    members = [set(rolemappings[role].get('users', [])) for role in roles]
+    # Sorted by prefix first, so the users of a prefix are one contiguous range
+    names = sorted(set(users).union(*members), key=_user_key)
+    user_ids = {name: position for position, name in enumerate(names)}
+
+    role_members = [sorted(user_ids[user] for user in users_of_role) for users_of_role in members]
+    user_roles = [[] for _ in names]
+    for role_id, ids in enumerate(role_members):
+        for user_id in ids:
+            user_roles[user_id].append(role_id)
+
+    prefixes, prefix_users = [], array('I')
+    for position, name in enumerate(names):
+        prefix = prefix_of(name)
+        if not prefixes or prefixes[-1] != prefix:
+            prefixes.append(prefix)
+            prefix_users.append(position)
+    prefix_users.append(len(names))
+
+    user_blob, user_offsets = _strings(names)
+    role_blob, role_offsets = _strings(roles)
+    prefix_blob, prefix_offsets = _strings(prefixes)
+    user_roles, user_roles_ptr = _postings(user_roles)
+    role_members, role_members_ptr = _postings(role_members)
+    flags = array('B', [INTERNAL if name in users else 0 for name in names])
+    sections = [user_blob, user_offsets.tobytes(), flags.tobytes(), user_roles_ptr.tobytes(), user_roles.tobytes(),
+                role_blob, role_offsets.tobytes(), role_members_ptr.tobytes(), role_members.tobytes(),
+                prefix_blob, prefix_offsets.tobytes(), prefix_users.tobytes()]
+
+    users_digest, rolemappings_digest = digests or (b'\0' * 20, b'\0' * 20)
+    header = HEADER.pack(MAGIC, VERSION, BYTE_ORDERS[sys.byteorder], time.time(), users_digest, rolemappings_digest)
+    offset = HEADER.size + SECTION.size * len(SECTIONS)
+    table, body = [], bytearray()
+    for section in sections:
+        start = offset + len(body) + (-(offset + len(body)) % ALIGNMENT)
+        body += b'\0' * (start - offset - len(body))
+        table.append(SECTION.pack(start, len(section)))
+        body += section
+
+    temporary = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temporary, 'wb') as index_file:
+        index_file.write(header)
+        index_file.write(b''.join(table))
+        index_file.write(body)
+        index_file.flush()
+        os.fsync(index_file.fileno())
+    os.replace(temporary, path)
+
+
+class _Strings(object):
+    """Read-only sequence over a string section, decoding only the entries that are accessed"""
+
+    def __init__(self, blob, offsets, key=None):
+        self._blob = blob
+        self._offsets = offsets
+        self._key = key
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, position):
+        value = self._blob[self._offsets[position]:self._offsets[position + 1]].tobytes().decode('utf-8')
+        return value if self._key is None else self._key(value)
+
+
+def _find(sequence, value):
+    position = bisect_left(sequence, value)
+    if position < len(sequence) and sequence[position] == value:
+        return position
+    return None
+
+
+def _download(resource, exception):
+    """Private function returning the raw body of a bulk endpoint and its sha1 digest, without parsing it"""
+    response = transport.send('get', '{}/'.format(resource), hedge=True)
+    if response.status_code != 200:
+        raise exception('Error retrieving {}. status: {} - body: {}'.format(resource, response.status_code,
+                                                                            response.text))
+    body = response.text.encode('utf-8')
+    return body, hashlib.sha1(body).digest()
+
+
+class DiskIndex(object):
+    """Memory mapped binary index of user -> roles, role -> members and username prefixes, for short-lived
+    processes (cron jobs, CLI calls) that need a few lookups without downloading and parsing all users
+    and role mappings. Lookups binary search the mapped file and only decode the strings they touch.
+    Before use, ensure_fresh() compares the sha1 of the current internalusers and rolesmapping bodies
+    with the ones the index was built from, and only rebuilds it when they differ. One process at a time
+    rebuilds it (under an exclusive lock on path.lock) and atomically replaces the file.
+    Role members are the users entries of the mappings as written: wildcard and regex entries are not
+    expanded (see searchguard.mappingindex for that).
+
+    :param str path: path of the index file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.built = None
+        self._map = None
+        self._inode = None
+        self._digests = None
+        self._open()
+
+    @property
+    def loaded(self):
+        return self._map is not None
+
+    def verified(self):
+        """Returns the time.time() the index was last built or confirmed to match the cluster, or None"""
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    def ensure_fresh(self, max_age=60):
+        """Makes sure the index matches the cluster, returns True when it was (re)built
+        The check is skipped when the index was verified within max_age seconds. Otherwise it downloads
+        both full bodies to hash them, since the API has no cheaper change signal (no ETag or version):
+        it saves the parsing and rebuilding, not the transfer, so pick max_age accordingly.
+
+        :param float max_age: seconds a verified index is trusted without checking
+        :raises: ListUsersException, ViewAllRoleMappingException
+        """
+        self._reopen_if_replaced()
+        verified = self.verified()
+        if self.loaded and verified is not None and time.time() - verified < max_age:
+            return False
+
+        users = _download('internalusers', ListUsersException)
+        rolemappings = _download('rolesmapping', ViewAllRoleMappingException)
+        if self._matches(users, rolemappings):
+            os.utime(self.path, None)
+            return False
+
+        # Imported here, the module is imported on every platform but rebuilding needs POSIX locks
+        import fcntl
+        with open(self.path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # Another process may have rebuilt it while this one waited for the lock
+            self._reopen_if_replaced()
+            if self._matches(users, rolemappings):
+                return False
+            write_index(self.path, json.loads(users[0].decode('utf-8')), json.loads(rolemappings[0].decode('utf-8')),
+                        (users[1], rolemappings[1]))
+            self._open()
+        return True
+
+    def roles_for(self, user):
+        """Returns the sorted roles the user is mapped to (empty for unknown users)"""
+        user_id = self._user_id(user)
+        if user_id is None:
+            return []
+        ptr = self._sections['user_roles_ptr']
+        return [self._roles[role_id] for role_id in self._sections['user_roles'][ptr[user_id]:ptr[user_id + 1]]]
+
+    def members(self, role):
+        """Returns the sorted users mapped to the role (empty for unknown roles)"""
+        role_id = _find(self._roles, role)
+        if role_id is None:
+            return []
+        ptr = self._sections['role_members_ptr']
+        return sorted(self._users[user_id] for user_id in self._sections['role_members'][ptr[role_id]:ptr[role_id + 1]])
+
+    def user_exists(self, user):
+        """Returns whether user is an internal user"""
+        user_id = self._user_id(user)
+        return user_id is not None and bool(self._sections['user_flags'][user_id] & INTERNAL)
+
+    def prefixes(self):
+        """Returns all username prefixes (the part before the first underscore, like list_users)"""
+        return list(self._prefixes)
+
+    def users_for_prefix(self, prefix):
+        """Returns the sorted internal users with the prefix, like list_users(prefix=prefix).keys()"""
+        position = _find(self._prefixes, prefix)
+        if position is None:
+            return []
+        ptr, flags = self._sections['prefix_users'], self._sections['user_flags']
+        return sorted(self._users[user_id] for user_id in range(ptr[position], ptr[position + 1])
+                      if flags[user_id] & INTERNAL)
+
+    def close(self):
+        self._release()
+
+    def _user_id(self, user):
+        return _find(self._user_keys, _user_key(user))
+
+    def _matches(self, users, rolemappings):
+        return self.loaded and self._digests == (users[1], rolemappings[1])
+
+    def _reopen_if_replaced(self):
+        try:
+            inode = os.stat(self.path).st_ino
+        except OSError:
+            return
+        if inode != self._inode:
+            self._open()
+
+    def _open(self):
+        """Private function mapping the index file, an absent or incompatible file leaves the index unloaded"""
+        self._release()
+        try:
+            with open(self.path, 'rb') as index_file:
+                inode = os.fstat(index_file.fileno()).st_ino
+                mapped = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, OSError, ValueError):
+            return
+
+        if len(mapped) < HEADER.size:
+            mapped.close()
+            return
+        magic, version, byte_order, built, users_digest, rolemappings_digest = HEADER.unpack_from(mapped, 0)
+        if magic != MAGIC or version != VERSION or byte_order != BYTE_ORDERS[sys.byteorder]:
+            # Written by another format version or on another architecture, it gets rebuilt
+            mapped.close()
+            return
+
+        view = memoryview(mapped)
+        sections = dict()
+        for position, name in enumerate(SECTIONS):
+            start, length = SECTION.unpack_from(mapped, HEADER.size + position * SECTION.size)
+            section = view[start:start + length]
+            # Names are utf-8 blobs and the flags single bytes, the other sections are arrays of uint32
+            sections[name] = section if name.endswith('_names') or name == 'user_flags' else section.cast('I')
+
+        self._map, self._view, self._sections = mapped, view, sections
+        self._inode, self.built, self._digests = inode, built, (users_digest, rolemappings_digest)
+        self._users = _Strings(sections['user_names'], sections['user_offsets'])
+        self._user_keys = _Strings(sections['user_names'], sections['user_offsets'], _user_key)
+        self._roles = _Strings(sections['role_names'], sections['role_offsets'])
+        self._prefixes = _Strings(sections['prefix_names'], sections['prefix_offsets'])
+
+    def _release(self):
+        if self._map is None:
+            return
+        # The views have to be released before the mapping can be closed
+        for section in self._sections.values():
+            section.release()
+        self._view.release()
+        self._map.close()
+        self._map = self._inode = self._digests = self.built = None
+
+
+def load(path, max_age=60):
+    """Opens the index at path, building or rebuilding it when it is missing or no longer matches the cluster
+
+    :param str path: path of the index file
+    :param float max_age: seconds a verified index is trusted without checking
+    :raises: ListUsersException, ViewAllRoleMappingException
+    """
+    index = DiskIndex(path)
+    index.ensure_fresh(max_age)
+    return index
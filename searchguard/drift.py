@@ -0,0 +1,223 @@
+#!/usr/bin/python3
+
+import hashlib
+import json
+from collections import namedtuple
+import searchguard.transport as transport
+from searchguard.concurrency import run_bounded
+from searchguard.exceptions import ListUsersException, ListRolesException, ViewAllRoleMappingException
+from searchguard.fingerprints import fingerprint
+from searchguard.streaming import iter_json_object
+
+
+RESOURCES = ('roles', 'rolesmapping', 'internalusers')
+EXCEPTIONS = {'roles': ListRolesException, 'rolesmapping': ViewAllRoleMappingException,
+              'internalusers': ListUsersException}
+# Entries are placed by the first hex digits of the hash of their name, 16 subtrees of 16 buckets
+DEPTH = 2
+HEX_DIGITS = '0123456789abcdef'
+
+MISSING = 'missing'
+EXTRA = 'extra'
+CHANGED = 'changed'
+
+Drift = namedtuple('Drift', ['resource', 'name', 'kind'])
+
+
+def _position(name):
+    return hashlib.sha1(name.encode('utf-8')).hexdigest()[:DEPTH]
+
+
+def _combine(children):
+    """Private function hashing the (label, hash) pairs of the non-empty children of a node"""
+    return hashlib.sha1(''.join(label + digest for label, digest in sorted(children)).encode('utf-8')).hexdigest()
+
+
+class MerkleTree(object):
+    """Merkle tree over the entries of one resource, where an entry hash is the fingerprint of its canonical
+    body (see searchguard.fingerprints). Entries are bucketed by the hash of their name, so equal entries
+    land in the same place on every cluster and the trees of two clusters only have to be descended
+    where their hashes differ.
+
+    :param str resource: roles, rolesmapping or internalusers
+    :param dict entries: name -> entry hash
+    """
+
+    def __init__(self, resource, entries):
+        self.resource = resource
+        self.entries = entries
+        self.buckets = dict()
+        for name, digest in entries.items():
+            self.buckets.setdefault(_position(name), dict())[name] = digest
+
+        # prefix of the name hash -> node hash, '' is the root. Empty subtrees have no node
+        self.nodes = {prefix: _combine(bucket.items()) for prefix, bucket in self.buckets.items()}
+        for depth in range(DEPTH - 1, -1, -1):
+            parents = dict()
+            for prefix, digest in self.nodes.items():
+                if len(prefix) == depth + 1:
+                    parents.setdefault(prefix[:depth], []).append((prefix[depth], digest))
+            self.nodes.update((prefix, _combine(children)) for prefix, children in parents.items())
+        self.nodes.setdefault('', _combine([]))
+
+    @classmethod
+    def from_bodies(cls, resource, bodies):
+        """Builds the tree from (name, body) pairs, for example list_roles().items() or iter_users()"""
+        return cls(resource, {name: fingerprint(resource, body) for name, body in bodies})
+
+    @property
+    def root(self):
+        return self.nodes['']
+
+    def diff(self, other):
+        """Compares this (baseline) tree with another, only visiting the subtrees whose hashes differ
+
+        :returns: (list of Drift, number of nodes compared)
+        """
+        drift, compared, pending = [], 0, ['']
+        while pending:
+            prefix = pending.pop()
+            compared += 1
+            if self.nodes.get(prefix) == other.nodes.get(prefix):
+                continue
+            if len(prefix) < DEPTH:
+                pending.extend(prefix + digit for digit in HEX_DIGITS
+                               if prefix + digit in self.nodes or prefix + digit in other.nodes)
+                continue
+
+            expected, actual = self.buckets.get(prefix, {}), other.buckets.get(prefix, {})
+            for name in sorted(set(expected) | set(actual)):
+                if name not in actual:
+                    drift.append(Drift(self.resource, name, MISSING))
+                elif name not in expected:
+                    drift.append(Drift(self.resource, name, EXTRA))
+                elif expected[name] != actual[name]:
+                    drift.append(Drift(self.resource, name, CHANGED))
+        return drift, compared
+
+
+class Snapshot(object):
+    """Merkle trees of the resources of one cluster (or a saved baseline)
+
+    :param str label: name of the cluster, for example its URL
+    :param dict trees: resource -> MerkleTree
+    """
+
+    def __init__(self, label, trees):
+        self.label = label
+        self.trees = trees
+
+    def roots(self):
+        """Returns resource -> Merkle root, equal roots mean equal resources"""
+        return {resource: tree.root for resource, tree in self.trees.items()}
+
+    def save(self, path):
+        """Writes the entry hashes to a JSON file, to compare clusters against later"""
+        data = {'label': self.label, 'entries': {resource: tree.entries for resource, tree in self.trees.items()}}
+        with open(path, 'w') as fh:
+            json.dump(data, fh, sort_keys=True)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as fh:
+            data = json.load(fh)
+        return cls(data['label'], {resource: MerkleTree(resource, entries) for resource, entries in data['entries'].items()})
+
+
+class DriftReport(object):
+    """Differences of a cluster to the baseline
+
+    :ivar str baseline: label of the baseline
+    :ivar str label: label of the compared cluster
+    :ivar list drift: Drift(resource, name, kind) per differing entry. kind is missing (only in the
+    baseline), extra (only on the cluster) or changed
+    :ivar int compared: number of tree nodes compared
+    """
+
+    def __init__(self, baseline, label, drift, compared):
+        self.baseline = baseline
+        self.label = label
+        self.drift = drift
+        self.compared = compared
+
+    @property
+    def clean(self):
+        return not self.drift
+
+    def summary(self):
+        """Returns resource -> kind -> number of drifted entries"""
+        counts = dict()
+        for drift in self.drift:
+            kinds = counts.setdefault(drift.resource, dict())
+            kinds[drift.kind] = kinds.get(drift.kind, 0) + 1
+        return counts
+
+    def __repr__(self):
+        return '<DriftReport {} vs {}: {} drifted>'.format(self.label, self.baseline, len(self.drift))
+
+
+def compare(baseline, snapshot):
+    """Compares a snapshot with a baseline snapshot, resource by resource, descending only where roots differ
+
+    :returns DriftReport:
+    """
+    drift, compared = [], 0
+    for resource, tree in baseline.trees.items():
+        other = snapshot.trees.get(resource) or MerkleTree(resource, {})
+        resource_drift, resource_compared = tree.diff(other)
+        drift.extend(resource_drift)
+        compared += resource_compared
+    return DriftReport(baseline.label, snapshot.label, drift, compared)
+
+
+def _fetch_tree(resource, cluster):
+    """Private function building the tree of a resource from one streamed bulk GET, entry by entry"""
+    response = transport.send('get', '{}/'.format(resource), stream=True, node=cluster)
+    try:
+        if response.status_code != 200:
+            raise EXCEPTIONS[resource]('Error retrieving {} from {}. status: {} - body: {}'.format(
+                resource, cluster or 'the cluster', response.status_code, response.text))
+        return MerkleTree.from_bodies(resource, iter_json_object(response.iter_content(transport.STREAM_CHUNK_SIZE)))
+    finally:
+        response.close()
+
+
+def fetch_snapshots(clusters, resources=RESOURCES, concurrency=8):
+    """Fetches the resources of several clusters concurrently and returns cluster -> Snapshot
+    The credentials of SEARCHGUARD_API_AUTH are used for every cluster.
+
+    :param list clusters: base API URLs, like SEARCHGUARD_API_URL (None for the configured nodes)
+    :param tuple resources: resources to fetch
+    :param concurrency: number of parallel requests or an AdaptiveLimiter
+    :raises: ListRolesException, ViewAllRoleMappingException, ListUsersException
+    """
+    trees = {cluster: dict() for cluster in clusters}
+    tasks = [(cluster, resource) for cluster in clusters for resource in resources]
+    for outcome in run_bounded(lambda task: _fetch_tree(task[1], task[0]), tasks, concurrency):
+        if outcome.error is not None:
+            raise outcome.error
+        cluster, resource = outcome.item
+        trees[cluster][resource] = outcome.result
+    return {cluster: Snapshot(cluster, trees[cluster]) for cluster in clusters}
+
+
+def fetch_snapshot(cluster=None, resources=RESOURCES, concurrency=8):
+    """Fetches the resources of one cluster (default: the configured nodes) concurrently as a Snapshot"""
+    return fetch_snapshots([cluster], resources, concurrency)[cluster]
+
+
+def check_drift(clusters, baseline=None, resources=RESOURCES, concurrency=8):
+    """Compares clusters with a baseline and returns cluster -> DriftReport
+    Clusters whose Merkle roots match the baseline are done after comparing the roots; for the others only
+    the differing subtrees are compared.
+
+    :param list clusters: base API URLs of the clusters
+    :param Snapshot baseline: snapshot to compare with (default: the first cluster)
+    :param tuple resources: resources to compare
+    :param concurrency: number of parallel requests or an AdaptiveLimiter
+    :raises: ListRolesException, ViewAllRoleMappingException, ListUsersException
+    """
+    snapshots = fetch_snapshots(clusters, resources, concurrency)
+    if baseline is None:
+        baseline = snapshots[clusters[0]]
+    return {cluster: compare(baseline, snapshots[cluster]) for cluster in clusters}
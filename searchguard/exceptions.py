@@ -46,6 +46,10 @@ class ListUsersException(SearchGuardException):
     pass
 
 
+class ListRolesException(SearchGuardException):
+    pass
+
+
 class CheckUserExistsException(SearchGuardException):
     pass
 
@@ -80,3 +84,54 @@ class ViewRoleMappingException(SearchGuardException):
 
 class DeleteRoleMappingException(SearchGuardException):
     pass
+
+
+class NotFoundException(SearchGuardException):
+    """Raised when the user, role or role mapping a request refers to does not exist"""
+
+
+class UserNotFoundException(ViewUserException, ModifyUserException, DeleteUserException, NotFoundException):
+    pass
+
+
+class RoleNotFoundException(ViewRoleException, ModifyRoleException, DeleteRoleException, CheckRoleExistsException,
+                            NotFoundException):
+    pass
+
+
+class RoleMappingNotFoundException(ViewRoleMappingException, ModifyRoleMappingException, DeleteRoleMappingException,
+                                   NotFoundException):
+    pass
+
+
+class CircuitOpenException(SearchGuardException):
+    pass
+
+
+class DeadlineExceededException(SearchGuardException):
+    pass
+
+
+class TransportException(SearchGuardException):
+    """Raised when a request fails without response: the connection failed or timed out
+    The error of the HTTP backend is kept as __cause__.
+    """
+
+
+class WriteBehindException(SearchGuardException):
+    pass
+
+
+class ValidationException(SearchGuardException):
+    """Raised before any request is sent when a body does not match the schema
+
+    :ivar dict errors: name -> list of errors
+    """
+
+    def __init__(self, message, errors=None):
+        super(ValidationException, self).__init__(message)
+        self.errors = errors or {}
+
+
+class BackupException(SearchGuardException):
+    pass
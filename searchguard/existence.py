@@ -0,0 +1,134 @@
+#!/usr/bin/python3
+
+import hashlib
+import math
+import threading
+import time
+
+
+# Seconds a loaded filter is trusted, names created by other clients in this window get overwritten
+DEFAULT_MAX_AGE = 60
+
+
+class BloomFilter(object):
+    """Set membership with false positives but no false negatives, in about 10 bits per name at 1%
+
+    :param int capacity: number of names the filter is sized for
+    :param float error_rate: false positive rate at capacity
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.capacity = capacity
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / float(capacity) * math.log(2))))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, name):
+        digest = hashlib.blake2b(name.encode('utf-8'), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, name):
+        for position in self._positions(name):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, name):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(name))
+
+
+class ExistenceFilter(object):
+    """Tells which user and role names definitely do not exist, so create_user and create_role can skip
+    their existence check request. A filter is loaded from the bulk listings (list_users, list_roles) and
+    kept current with the creates made through the library (create_user, create_role, bulk writers and
+    restores). Deleted names are not removed and keep being checked. Names that might exist, and names
+    of resources without a (fresh) filter, are checked as before.
+    Only use it when this process is the only writer of users and roles: the create is a PUT, which is
+    an upsert, so a name created by another client after the filter was loaded would be overwritten
+    (including the password of a user) before UserAlreadyExistsException or RoleAlreadyExistsException is
+    raised. A Bloom filter cannot tell that a name definitely exists, so with other writers the check
+    request cannot be skipped safely at all.
+
+    :param float max_age: seconds after which a filter is no longer trusted (None trusts it forever)
+    :param float error_rate: false positive rate, each false positive costs the existence check request
+    :param float headroom: filters are sized for headroom times the listed names, to make room for creates
+    """
+
+    def __init__(self, max_age=DEFAULT_MAX_AGE, error_rate=0.01, headroom=2.0):
+        self.max_age = max_age
+        self.error_rate = error_rate
+        self.headroom = headroom
+        self.skipped = 0
+        self._filters = {}
+        self._lock = threading.Lock()
+
+    def load(self, resource, names):
+        """Replaces the filter of a resource type with the names of a bulk listing
+
+        :param str resource: internalusers or roles
+        :param names: iterable of all existing names
+        """
+        names = list(names)
+        bloom = BloomFilter(int(len(names) * self.headroom) + 64, self.error_rate)
+        for name in names:
+            bloom.add(name)
+        with self._lock:
+            self._filters[resource] = (bloom, time.time())
+
+    def add(self, resource, name):
+        """Records a name created through the library"""
+        with self._lock:
+            known = self._filters.get(resource)
+            if known is not None:
+                known[0].add(name)
+
+    def might_exist(self, resource, name):
+        """Returns False when name definitely does not exist, True when it has to be checked"""
+        with self._lock:
+            known = self._filters.get(resource)
+            if known is None:
+                return True
+            bloom, loaded = known
+            if (self.max_age is not None and time.time() - loaded > self.max_age) or bloom.count > bloom.capacity:
+                # Stale or overfull, the false positive rate is no longer bounded
+                return True
+            if name in bloom:
+                return True
+            self.skipped += 1
+            return False
+
+
+_filter = None
+
+
+def enable(single_writer=False, max_age=DEFAULT_MAX_AGE, error_rate=0.01):
+    """Enables skipping the existence check of create_user and create_role for new names and returns the
+    ExistenceFilter. It is loaded by the next list_users() and list_roles() call.
+    Skipping the check is only safe for single-writer setups, see ExistenceFilter. Pass single_writer=True
+    to confirm that no other client or process creates users or roles.
+
+    :param bool single_writer: this process is the only writer of users and roles
+    :param float max_age: seconds after which a filter is no longer trusted
+    :param float error_rate: false positive rate of the filters
+    :raises: ValueError when single_writer is not set
+    """
+    global _filter
+
+    if not single_writer:
+        raise ValueError('The existence filter can overwrite users and roles created by other clients, '
+                         'enable it with single_writer=True only when this process is the only writer')
+    _filter = ExistenceFilter(max_age=max_age, error_rate=error_rate)
+    return _filter
+
+
+def disable():
+    global _filter
+
+    _filter = None
+
+
+def get_filter():
+    """Returns the active ExistenceFilter, or None when it is disabled"""
+    return _filter
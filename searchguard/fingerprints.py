@@ -0,0 +1,155 @@
+#!/usr/bin/python3
+
+import hashlib
+import json
+import threading
+import time
+from collections import deque, namedtuple
+
+
+# Read-only metadata Search Guard adds to resources, not part of what callers write
+METADATA_KEYS = ('readonly', 'reserved', 'hidden', 'static')
+ROLEMAPPING_KEYS = ('users', 'backendroles', 'hosts')
+# Skipped writes kept for pop_skipped, older ones are dropped when nobody collects them
+MAX_SKIPPED = 1000
+# Seconds a fingerprint is trusted by default, like the existence filter
+DEFAULT_MAX_AGE = 60
+
+_STRING_TYPES = (type(''), type(u''))
+
+SkippedWrite = namedtuple('SkippedWrite', ['resource', 'name', 'fingerprint'])
+
+
+def _canonical(value):
+    if isinstance(value, dict):
+        return {k: _canonical(v) for k, v in value.items()}
+    if isinstance(value, list):
+        items = [_canonical(item) for item in value]
+        # Lists of names and permissions are sets in Search Guard, their order is irrelevant
+        if all(isinstance(item, _STRING_TYPES) for item in items):
+            return sorted(items)
+        return items
+    return value
+
+
+def canonicalize(resource, body):
+    """Returns the canonical JSON representation of a resource body
+    Keys are sorted, read-only metadata is dropped, lists of strings are sorted and role mappings get
+    empty lists for missing users, backendroles and hosts (like modify_rolemapping does).
+
+    :param str resource: roles or rolesmapping
+    :param dict body: the resource body as written to or read from the API
+    """
+    # Metadata is only added at the top level, nested keys with the same names are part of the body
+    body = _canonical({key: value for key, value in body.items() if key not in METADATA_KEYS})
+    if resource == 'rolesmapping':
+        for key in ROLEMAPPING_KEYS:
+            body.setdefault(key, [])
+    return json.dumps(body, sort_keys=True, separators=(',', ':'))
+
+
+def fingerprint(resource, body):
+    """Returns the sha1 hex digest of the canonical representation of a resource body"""
+    return hashlib.sha1(canonicalize(resource, body).encode('utf-8')).hexdigest()
+
+
+class FingerprintCache(object):
+    """Keeps a fingerprint of the last known server state per resource, to skip writes that change nothing
+
+    :param float max_age: seconds after which a fingerprint is no longer trusted (None trusts it forever)
+    :param on_skip: optional callback(SkippedWrite), called for every skipped write
+    :param int max_skipped: number of skipped writes kept for pop_skipped, the oldest are dropped first
+    """
+
+    def __init__(self, max_age=DEFAULT_MAX_AGE, on_skip=None, max_skipped=MAX_SKIPPED):
+        self.max_age = max_age
+        self.on_skip = on_skip
+        self.skipped = deque(maxlen=max_skipped)
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+
+    def set(self, resource, name, body):
+        """Records the server state of a single resource"""
+        with self._lock:
+            self._fingerprints[(resource, name)] = (fingerprint(resource, body), time.time())
+
+    def discard(self, resource, name):
+        with self._lock:
+            self._fingerprints.pop((resource, name), None)
+
+    def check(self, resource, name, body):
+        """Drops the fingerprint of a resource when a read returned a body that does not match it
+        For reads that do not record the server state themselves: streamed reads and replica copies.
+        """
+        digest = fingerprint(resource, body)
+        with self._lock:
+            known = self._fingerprints.get((resource, name))
+            if known is not None and known[0] != digest:
+                del self._fingerprints[(resource, name)]
+
+    def refresh(self, resource, bodies):
+        """Replaces all fingerprints of a resource type with the result of a bulk read
+
+        :param str resource: roles or rolesmapping
+        :param dict bodies: mapping of name to body, as returned by list_roles or view_all_rolemappings
+        """
+        now = time.time()
+        fingerprints = {(resource, name): (fingerprint(resource, body), now) for name, body in bodies.items()}
+        with self._lock:
+            for key in [key for key in self._fingerprints if key[0] == resource]:
+                del self._fingerprints[key]
+            self._fingerprints.update(fingerprints)
+
+    def get(self, resource, name):
+        """Returns the known fingerprint of a resource, or None when it is unknown or expired"""
+        with self._lock:
+            known = self._fingerprints.get((resource, name))
+        if known is None or (self.max_age is not None and time.time() - known[1] > self.max_age):
+            return None
+        return known[0]
+
+    def skip_write(self, resource, name, body):
+        """Returns True (and reports the skipped write) when body matches the known server state"""
+        known = self.get(resource, name)
+        if known is None or known != fingerprint(resource, body):
+            return False
+
+        skipped = SkippedWrite(resource, name, known)
+        with self._lock:
+            self.skipped.append(skipped)
+        if self.on_skip is not None:
+            self.on_skip(skipped)
+        return True
+
+    def pop_skipped(self):
+        """Returns and clears the list of writes skipped since the last call (at most max_skipped)"""
+        with self._lock:
+            skipped = list(self.skipped)
+            self.skipped.clear()
+        return skipped
+
+
+_cache = None
+
+
+def enable(max_age=DEFAULT_MAX_AGE, on_skip=None):
+    """Enables compare-before-write for modify_role and modify_rolemapping and returns the cache
+
+    :param float max_age: seconds after which a fingerprint is no longer trusted (None trusts it forever)
+    :param on_skip: optional callback(SkippedWrite), called for every skipped write
+    """
+    global _cache
+
+    _cache = FingerprintCache(max_age=max_age, on_skip=on_skip)
+    return _cache
+
+
+def disable():
+    global _cache
+
+    _cache = None
+
+
+def get_cache():
+    """Returns the active FingerprintCache, or None when compare-before-write is disabled"""
+    return _cache
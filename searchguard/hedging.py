@@ -0,0 +1,152 @@
+#!/usr/bin/python3
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import searchguard.deadline as deadline
+import searchguard.priority as priority
+import searchguard.profiler as profiler
+
+
+class _Tried(list):
+    """Nodes tried by the first request, chosen is set once it picked one (or finished without)"""
+
+    def __init__(self):
+        super(_Tried, self).__init__()
+        self.chosen = threading.Event()
+
+    def append(self, node):
+        super(_Tried, self).append(node)
+        self.chosen.set()
+
+
+class HedgingPolicy(object):
+    """Sends a duplicate of a slow idempotent read to a second node, the first good response wins
+
+    The hedge is sent when the first request did not finish within delay seconds, to a node the first
+    request did not pick. Without a fixed delay the given percentile of the recently observed latencies
+    is used (initial_delay until enough are observed). Both requests run in the worker threads and the
+    caller gets the first good response. The losing request cannot be interrupted once sent, it is
+    cancelled when it did not start yet and otherwise its response is discarded.
+
+    :param float delay: fixed hedge delay in seconds (None to use the observed percentile)
+    :param float percentile: percentile of the observed latencies used as delay, e.g. 95
+    :param float initial_delay: delay used until min_samples latencies are observed
+    :param int min_samples: number of observed latencies needed before using the percentile
+    :param int max_workers: threads used to send the hedgeable requests
+    """
+
+    def __init__(self, delay=None, percentile=95, initial_delay=0.05, min_samples=20, max_workers=16):
+        self.delay = delay
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+        self._latencies = deque(maxlen=1000)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def hedge_delay(self):
+        """Returns the seconds to wait before sending the hedge"""
+        if self.delay is not None:
+            return self.delay
+
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < self.min_samples:
+            return self.initial_delay
+        return latencies[min(len(latencies) - 1, int(len(latencies) * self.percentile / 100.0))]
+
+    def stats(self):
+        """Returns the number of hedgeable requests, sent hedges, hedges that won and the current delay"""
+        delay = self.hedge_delay()
+        with self._lock:
+            return {'requests': self.requests, 'hedged': self.hedged, 'hedge_wins': self.hedge_wins, 'delay': delay}
+
+    def run(self, attempt):
+        """Runs attempt(tried) and, when it is slow, a hedged attempt(tried) that skips the nodes already tried
+        An attempt appends every node it picks to tried, returns a response or raises. A response with a 5xx
+        status or an exception only wins when both attempts failed.
+        """
+        started = time.time()
+        primary_tried = _Tried()
+        attempt = deadline.propagate(priority.propagate(profiler.propagate(attempt)))
+        primary = self._executor.submit(attempt, primary_tried)
+        primary.add_done_callback(lambda future: primary_tried.chosen.set())
+        with self._lock:
+            self.requests += 1
+
+        done, _ = wait([primary], timeout=self.hedge_delay())
+        if not done:
+            # The first request may still wait for a worker, the hedge has to know which node it picks
+            primary_tried.chosen.wait()
+        if primary.done():
+            self._observe(time.time() - started)
+            return primary.result()
+
+        hedge = self._executor.submit(attempt, list(primary_tried))
+        with self._lock:
+            self.hedged += 1
+
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if self._succeeded(future):
+                    self._discard(pending)
+                    self._observe(time.time() - started)
+                    if future is hedge:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return future.result()
+
+        # Both failed, report the outcome of the first request
+        return primary.result()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+    def _observe(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+
+    @staticmethod
+    def _succeeded(future):
+        return future.exception() is None and future.result().status_code < 500
+
+    @staticmethod
+    def _discard(futures):
+        for future in futures:
+            if not future.cancel():
+                future.add_done_callback(lambda loser: loser.exception() is None and loser.result().close())
+
+
+_policy = None
+
+
+def enable(**options):
+    """Enables hedging of idempotent reads and returns the HedgingPolicy. Accepts its keyword arguments
+    Only has effect when SEARCHGUARD_API_URL holds more than one node.
+    """
+    global _policy
+
+    disable()
+    _policy = HedgingPolicy(**options)
+    return _policy
+
+
+def disable():
+    global _policy
+
+    policy, _policy = _policy, None
+    if policy is not None:
+        policy.shutdown()
+
+
+def get_policy():
+    """Returns the active HedgingPolicy, or None when hedging is disabled"""
+    return _policy
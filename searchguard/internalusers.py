@@ -1,12 +1,16 @@
 #!/usr/bin/python3
 
-import requests
 import warnings
 import json
 import random
 import string
 import searchguard.settings as settings
+import searchguard.transport as transport
+import searchguard.existence as existence
+import searchguard.validation as validation
 from searchguard.exceptions import *
+from searchguard.streaming import iter_json_object
+from searchguard.batchread import read_batch
 
 
 def password_generator(size=25, chars=string.ascii_uppercase + string.ascii_lowercase + string.digits):
@@ -16,7 +20,7 @@ def password_generator(size=25, chars=string.ascii_uppercase + string.ascii_lowe
 
 def check_user_exists(username):
     """Returns True of False depending on whether the requested user exists in Search Guard"""
-    user_exists_check = requests.get('{}/internalusers/{}'.format(settings.SEARCHGUARD_API_URL, username), auth=settings.SEARCHGUARD_API_AUTH)
+    user_exists_check = transport.send('get', 'internalusers/{}'.format(username), hedge=True)
 
     if user_exists_check.status_code == 200:
         # Username exists in SearchGuard
@@ -40,10 +44,19 @@ def create_user(username, password=None, properties=None):
     If password is passed both explicitly and as a property,
     mismatching passwords would raise a ValueError.
 
-    :raises: UserAlreadyExistsException, CreateUserException, ValueError
+    When the existence filter is enabled (see searchguard.existence), the check request is skipped for
+    names that definitely do not exist.
+    When validation is enabled (see searchguard.validation), invalid properties are rejected before any
+    request is sent.
+
+    :raises: UserAlreadyExistsException, CreateUserException, ValueError, ValidationException
     :return str: password, or if hash is used empty string
     """
-    if check_user_exists(username):
+    validation.check('internalusers', username, properties or {})
+
+    existence_filter = existence.get_filter()
+    checked = existence_filter is None or existence_filter.might_exist('internalusers', username)
+    if checked and check_user_exists(username):
         raise UserAlreadyExistsException('User {} already exists'.format(username))
 
     # The username does not exist, let's create it
@@ -62,12 +75,18 @@ def create_user(username, password=None, properties=None):
         password = password or password_generator()
         properties['password'] = password
 
-    create_sg_user = requests.put('{}/internalusers/{}'.format(settings.SEARCHGUARD_API_URL, username),
-                                  data=json.dumps(properties), headers=settings.HEADER, auth=settings.SEARCHGUARD_API_AUTH)
+    create_sg_user = transport.send('put', 'internalusers/{}'.format(username),
+                                    data=json.dumps(properties), headers=settings.HEADER)
 
     if create_sg_user.status_code == 201:
         # User created successfully
+        if existence_filter is not None:
+            existence_filter.add('internalusers', username)
         return password
+    elif create_sg_user.status_code == 200 and not checked:
+        # The user was created by someone else after the existence filter was loaded, the PUT updated it
+        existence_filter.add('internalusers', username)
+        raise UserAlreadyExistsException('User {} already exists'.format(username))
     else:
         # Raise exception because we received an error when creating the user
         raise CreateUserException('Error creating user {} - msg: {}'.format(username, create_sg_user.text))
@@ -75,10 +94,12 @@ def create_user(username, password=None, properties=None):
 
 def modify_user(user, properties):
     """Modifies a Search Guard user. Returns when successfully modified"""
+    validation.check('internalusers', user, properties)
+
     if check_user_exists(user):
         # The user does exist, let's modify it
-        modify_sg_user = requests.put('{}/internalusers/{}'.format(settings.SEARCHGUARD_API_URL, user),
-                                      data=json.dumps(properties), headers=settings.HEADER, auth=settings.SEARCHGUARD_API_AUTH)
+        modify_sg_user = transport.send('put', 'internalusers/{}'.format(user),
+                                        data=json.dumps(properties), headers=settings.HEADER)
 
         if modify_sg_user.status_code == 200:
             # User modified successfully
@@ -88,17 +109,17 @@ def modify_user(user, properties):
             raise ModifyUserException('Error modifying user {} - msg: {}'.format(user, modify_sg_user.text))
     else:
         # Raise exception because the user does not exist
-        raise ModifyUserException('User {} does not exist'.format(user))
+        raise UserNotFoundException('User {} does not exist'.format(user))
 
 
 def delete_user(username):
     """Deletes a Search Guard user. Returns when successfully deleted"""
     if not check_user_exists(username):
         # Raise exception because the user does not exist
-        raise DeleteUserException('Error deleting the user {}, does not exist'.format(username))
+        raise UserNotFoundException('Error deleting the user {}, does not exist'.format(username))
 
     # The user does exist, let's delete it
-    delete_sg_user = requests.delete('{}/internalusers/{}'.format(settings.SEARCHGUARD_API_URL, username), auth=settings.SEARCHGUARD_API_AUTH)
+    delete_sg_user = transport.send('delete', 'internalusers/{}'.format(username))
 
     if delete_sg_user.status_code != 200:
         # Raise exception because we could not delete the user
@@ -112,7 +133,7 @@ def view_user(user):
     """
     if check_user_exists(user):
         # The user does exist, let's view it
-        view_sg_user = requests.get('{}/internalusers/{}'.format(settings.SEARCHGUARD_API_URL, user), auth=settings.SEARCHGUARD_API_AUTH)
+        view_sg_user = transport.send('get', 'internalusers/{}'.format(user))
 
         if view_sg_user.status_code == 200:
             return view_sg_user.text
@@ -121,19 +142,42 @@ def view_user(user):
             raise ViewUserException('Error viewing the user {} - msg {}'.format(user, view_sg_user.text))
     else:
         # Raise exception because the user does not exist
-        raise ViewUserException('Error viewing the user {}, does not exist'.format(user))
+        raise UserNotFoundException('Error viewing the user {}, does not exist'.format(user))
+
+
+def view_users(usernames, concurrency=8, strategy=None):
+    """Returns information about many Search Guard users at once
+    Reads them with a concurrent GET per user or with a single GET of all users, whichever the cost model
+    (see searchguard.batchread) estimates to be cheaper. Unlike view_user no existence checks are sent.
+
+    :param list usernames: names of the users to view
+    :param int concurrency: number of parallel GETs
+    :param str strategy: force per_name or bulk
+    :returns BatchReadResult: found (username -> properties), missing usernames and the chosen strategy
+    :raises: ViewUserException
+    """
+    def loaded(users):
+        existence_filter = existence.get_filter()
+        if existence_filter is not None:
+            existence_filter.load('internalusers', users)
+
+    return read_batch('internalusers', usernames, ViewUserException, concurrency, strategy, on_listing=loaded)
 
 
 def list_users(prefix=None, search=None):
     """Returns the existing Search Guard users that match the filter criteria
     When no filters are specified, all users are returned.
+    When the existence filter is enabled, it is loaded with all users.
     :param str prefix: Return only users that match this prefix (underscore is used as delimiter)
     :param str search: Return only users that contain this search string
     """
-    response = requests.get('{}/internalusers/'.format(settings.SEARCHGUARD_API_URL), auth=settings.SEARCHGUARD_API_AUTH)
+    response = transport.send('get', 'internalusers/')
 
     if response.status_code == 200:
-        list_sg_users = json.loads(response.text)
+        list_sg_users = transport.parse_json(response)
+        existence_filter = existence.get_filter()
+        if existence_filter is not None:
+            existence_filter.load('internalusers', list_sg_users)
         # The API returned a list of existing users
         if prefix and search:
             # Return list of users filtered on prefix and search string
@@ -150,3 +194,23 @@ def list_users(prefix=None, search=None):
     else:
         # Raise exception because the API did not return code 200
         raise ListUsersException('Error listing users. status: {} - body: {}'.format(response.status_code, response.text))
+
+
+def iter_users():
+    """Yields (username, properties) for every Search Guard user while the user list is being downloaded
+    Unlike list_users the complete user list is never held in memory, which keeps exports of large
+    clusters in constant memory.
+
+    :raises: ListUsersException
+    """
+    response = transport.send('get', 'internalusers/', stream=True)
+
+    try:
+        if response.status_code != 200:
+            # Raise exception because the API did not return code 200
+            raise ListUsersException('Error listing users. status: {} - body: {}'.format(response.status_code, response.text))
+
+        for username, properties in iter_json_object(response.iter_content(transport.STREAM_CHUNK_SIZE)):
+            yield username, properties
+    finally:
+        response.close()
@@ -0,0 +1,120 @@
+#!/usr/bin/python3
+
+import threading
+import time
+
+
+_local = threading.local()
+
+
+class AdaptiveLimiter(object):
+    """Limits the number of concurrent operations with additive increase, multiplicative decrease (AIMD)
+    Every successful request with a normal latency raises the limit by 1 / limit, so by about one per
+    limit requests. A 429, a 5xx, a connection error or a latency above tolerance times the normal
+    latency cuts the limit by backoff; requests that were already in flight at that moment cannot cut
+    it again. The normal latency is kept per HTTP method, so a mix of fast reads and slow writes does not
+    look like a spike: it is the moving average of all responses of that method that were not a 429 or
+    5xx, including slow ones, each is compared with the average before it is added to it.
+    Pass it as concurrency to run_bounded (and so to the batch functions and sgctl) to use it.
+
+    :param int initial: initial limit
+    :param int min_limit: lowest limit
+    :param int max_limit: highest limit, also the number of worker threads
+    :param float backoff: factor the limit is multiplied with on overload
+    :param float tolerance: a latency above tolerance times the normal latency counts as overload
+    :param float smoothing: weight of a new latency in the moving average
+    """
+
+    def __init__(self, initial=4, min_limit=1, max_limit=64, backoff=0.5, tolerance=2.0, smoothing=0.1):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.in_flight = 0
+        self.latency = {}
+
+        self._last_decrease = 0.0
+        self._listeners = []
+        self._condition = threading.Condition()
+
+    def add_listener(self, listener):
+        """Registers listener(limit), called whenever the (integer) limit changes, to publish it as metric"""
+        self._listeners.append(listener)
+
+    def metrics(self):
+        with self._condition:
+            return {'limit': int(self.limit), 'in_flight': self.in_flight, 'latency': dict(self.latency)}
+
+    def acquire(self):
+        """Blocks until an operation may start"""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def record(self, method, status_code, latency, started):
+        """Adjusts the limit to the outcome of a request
+
+        :param str method: HTTP method of the request, the latency is compared with its own baseline
+        :param int status_code: HTTP status, None when the request failed without response
+        :param float latency: seconds the request took
+        :param float started: time.time() the request was sent
+        """
+        method = method.lower()
+        with self._condition:
+            normal = self.latency.get(method)
+            failed = status_code is None or status_code == 429 or status_code >= 500
+            overloaded = failed or (normal is not None and latency > normal * self.tolerance)
+            previous = int(self.limit)
+
+            if not failed:
+                # Slow responses move the baseline too, so a lasting latency shift stops counting as overload
+                self.latency[method] = latency if normal is None else normal + self.smoothing * (latency - normal)
+
+            if overloaded:
+                if started < self._last_decrease:
+                    # Sent before the last decrease took effect
+                    return
+                self.limit = max(float(self.min_limit), self.limit * self.backoff)
+                self._last_decrease = time.time()
+            else:
+                self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+
+            limit = int(self.limit)
+            self._condition.notify_all()
+
+        if limit != previous:
+            for listener in self._listeners:
+                listener(limit)
+
+    def wrap(self, func):
+        """Wraps func so every call holds a slot and the requests it sends feed the limiter"""
+        def wrapper(*args, **kwargs):
+            self.acquire()
+            outer = current()
+            _local.limiter = self
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _local.limiter = outer
+                self.release()
+        return wrapper
+
+
+def current():
+    """Returns the AdaptiveLimiter of the operation running in this thread, or None"""
+    return getattr(_local, 'limiter', None)
+
+
+def observe(method, status_code, started):
+    """Feeds the outcome of a request to the limiter of the current operation, if any"""
+    limiter = current()
+    if limiter is not None:
+        limiter.record(method, status_code, time.time() - started, started)
@@ -0,0 +1,137 @@
+#!/usr/bin/python3
+
+import fnmatch
+import ipaddress
+import re
+from searchguard.rolesmapping import view_all_rolemappings
+
+
+WILDCARD_CHARS = ('*', '?')
+
+
+def _compile(pattern, flags=0):
+    """Compiles a Search Guard pattern: /regex/ or a wildcard pattern with * and ?"""
+    if len(pattern) > 1 and pattern.startswith('/') and pattern.endswith('/'):
+        return re.compile('(?:{})\\Z'.format(pattern[1:-1]), flags)
+    return re.compile(fnmatch.translate(pattern), flags)
+
+
+def _is_pattern(value):
+    return any(char in value for char in WILDCARD_CHARS) or (len(value) > 1 and value[0] == value[-1] == '/')
+
+
+class _MatchTable(object):
+    """Resolves the roles for a value: a hashed table for exact entries plus compiled matchers for patterns"""
+
+    def __init__(self, ignore_case=False):
+        self.ignore_case = ignore_case
+        self.exact = dict()
+        self.patterns = dict()
+        self._matchers = []
+        self._any = None
+
+    def _normalize(self, value):
+        return value.lower() if self.ignore_case else value
+
+    def add(self, entry, role):
+        if _is_pattern(entry):
+            self.patterns.setdefault(entry, set()).add(role)
+        else:
+            self.exact.setdefault(self._normalize(entry), set()).add(role)
+
+    def compile(self):
+        """Compiles every distinct pattern once, plus one combined matcher to reject non-matching values fast"""
+        flags = re.IGNORECASE if self.ignore_case else 0
+        self._matchers = [(_compile(pattern, flags), roles) for pattern, roles in self.patterns.items()]
+        self._any = None
+        if self._matchers:
+            try:
+                self._any = re.compile('|'.join('(?:{})'.format(matcher.pattern) for matcher, _ in self._matchers),
+                                       flags)
+            except re.error:
+                # e.g. duplicate group names in /regex/ entries, check the patterns one by one
+                self._any = re.compile('')
+
+    def match(self, value):
+        roles = set(self.exact.get(self._normalize(value), ()))
+        if self._any is not None and self._any.match(value):
+            for matcher, pattern_roles in self._matchers:
+                if matcher.match(value):
+                    roles.update(pattern_roles)
+        return roles
+
+
+class _HostTable(_MatchTable):
+    """Match table for hosts, additionally resolving IP addresses against CIDR entries (10.0.0.0/8)"""
+
+    def __init__(self):
+        super(_HostTable, self).__init__(ignore_case=True)
+        self.networks = []
+
+    def add(self, entry, role):
+        if '/' in entry and not _is_pattern(entry):
+            try:
+                self.networks.append((ipaddress.ip_network(u'{}'.format(entry), strict=False), role))
+                return
+            except ValueError:
+                pass
+        super(_HostTable, self).add(entry, role)
+
+    def match(self, value):
+        roles = super(_HostTable, self).match(value)
+        if self.networks:
+            try:
+                address = ipaddress.ip_address(u'{}'.format(value))
+            except ValueError:
+                return roles
+            roles.update(role for network, role in self.networks if address in network)
+        return roles
+
+
+class RoleMappingIndex(object):
+    """Precompiled index over all role mappings, resolving the effective roles of a request in one lookup
+    A role applies when the user, any of the backend roles or the host matches its mapping. Entries can be
+    exact values, wildcard patterns (* and ?) or /regular expressions/; hosts can also be CIDR ranges.
+
+    :param dict rolemappings: role mappings as returned by view_all_rolemappings
+    """
+
+    def __init__(self, rolemappings):
+        self.users = _MatchTable()
+        self.backendroles = _MatchTable()
+        self.hosts = _HostTable()
+
+        for role, properties in rolemappings.items():
+            for user in properties.get('users', []):
+                self.users.add(user, role)
+            for backendrole in properties.get('backendroles', []):
+                self.backendroles.add(backendrole, role)
+            for host in properties.get('hosts', []):
+                self.hosts.add(host, role)
+
+        for table in (self.users, self.backendroles, self.hosts):
+            table.compile()
+
+    @classmethod
+    def fetch(cls):
+        """Builds the index from the current role mappings in Search Guard
+
+        :raises: ViewAllRoleMappingException
+        """
+        return cls(view_all_rolemappings())
+
+    def roles_for(self, user=None, backendroles=(), host=None):
+        """Returns the set of roles that apply to a user with the given backend roles, connecting from host
+
+        :param str user: username
+        :param list backendroles: backend roles of the user
+        :param str host: hostname or IP address of the client
+        """
+        roles = set()
+        if user is not None:
+            roles.update(self.users.match(user))
+        for backendrole in backendroles:
+            roles.update(self.backendroles.match(backendrole))
+        if host is not None:
+            roles.update(self.hosts.match(host))
+        return roles
@@ -0,0 +1,171 @@
+#!/usr/bin/python3
+
+from searchguard.rolesmapping import view_all_rolemappings
+
+
+def _import():
+    """Private function importing the optional numpy and scipy dependencies"""
+    try:
+        import numpy
+        import scipy.sparse
+    except ImportError:
+        raise ImportError('The membership matrix requires numpy and scipy, install them with: '
+                          'pip install searchguard[analytics]')
+    return numpy, scipy.sparse
+
+
+def _vocabulary(values):
+    values = sorted(values)
+    return values, {value: position for position, value in enumerate(values)}
+
+
+class MembershipMatrix(object):
+    """Role mappings as sparse boolean matrices for access reviews: users x roles and backend roles x roles
+    Rows and columns are numbered in the sorted users, backendroles and roles vocabularies. Wildcard and
+    regex entries are kept as they are, as one member each. Requires the optional numpy and scipy
+    dependencies.
+
+    :param dict rolemappings: role mappings as returned by view_all_rolemappings
+    """
+
+    def __init__(self, rolemappings):
+        numpy, sparse = _import()
+        self._numpy = numpy
+        self._sparse = sparse
+
+        self.roles, self.role_index = _vocabulary(rolemappings)
+        self.users, self.user_index = _vocabulary({user for properties in rolemappings.values()
+                                                   for user in properties.get('users', [])})
+        self.backendroles, self.backendrole_index = _vocabulary({backendrole for properties in rolemappings.values()
+                                                                 for backendrole in properties.get('backendroles', [])})
+
+        def build(field, index, size):
+            rows, columns = [], []
+            for role, properties in rolemappings.items():
+                members = set(properties.get(field, []))
+                rows.extend(index[member] for member in members)
+                columns.extend([self.role_index[role]] * len(members))
+            data = numpy.ones(len(rows), dtype=numpy.int32)
+            return sparse.csr_matrix((data, (rows, columns)), shape=(size, len(self.roles)), dtype=numpy.int32)
+
+        self.matrix = build('users', self.user_index, len(self.users))
+        self.backendrole_matrix = build('backendroles', self.backendrole_index, len(self.backendroles))
+        self.matrix.sort_indices()
+        self.backendrole_matrix.sort_indices()
+
+    @classmethod
+    def fetch(cls):
+        """Builds the matrix from the current role mappings in Search Guard
+
+        :raises: ViewAllRoleMappingException
+        """
+        return cls(view_all_rolemappings())
+
+    def users_per_role(self):
+        """Returns a dict role -> number of users mapped to it"""
+        return dict(zip(self.roles, self._column_counts(self.matrix).tolist()))
+
+    def backendroles_per_role(self):
+        """Returns a dict role -> number of backend roles mapped to it"""
+        return dict(zip(self.roles, self._column_counts(self.backendrole_matrix).tolist()))
+
+    def roles_per_backendrole(self):
+        """Returns a dict backend role -> number of roles it grants"""
+        counts = self._numpy.diff(self.backendrole_matrix.indptr)
+        return dict(zip(self.backendroles, counts.tolist()))
+
+    def roles_for_users(self, users):
+        """Returns the roles of many users at once, as a dict user -> sorted list of roles
+
+        :param list users: usernames, users without mappings get an empty list
+        """
+        return self._rows(self.matrix, self.user_index, users)
+
+    def roles_for_backendroles(self, backendroles):
+        """Returns the roles each backend role grants, as a dict backend role -> sorted list of roles
+
+        :param list backendroles: backend roles, unmapped ones get an empty list
+        """
+        return self._rows(self.backendrole_matrix, self.backendrole_index, backendroles)
+
+    def co_membership(self):
+        """Returns the roles x roles sparse matrix of the number of users mapped to both roles
+        The diagonal holds the number of users per role.
+        """
+        return self.matrix.T.dot(self.matrix).tocsr()
+
+    def jaccard(self):
+        """Returns the roles x roles dense array of the Jaccard similarity of the users of every pair of roles
+        (users in both / users in either), 0 for two roles without users.
+        """
+        numpy = self._numpy
+        shared = self.co_membership().toarray().astype(numpy.float64)
+        counts = shared.diagonal()
+        union = counts[:, None] + counts[None, :] - shared
+        return numpy.divide(shared, union, out=numpy.zeros_like(shared), where=union > 0)
+
+    def overlap(self, role, other):
+        """Returns the Jaccard similarity of the users of two roles
+
+        :raises: KeyError when a role is not mapped
+        """
+        first, second = self.role_index[role], self.role_index[other]
+        columns = self.matrix[:, [first, second]].toarray()
+        union = self._numpy.count_nonzero(columns.any(axis=1))
+        if not union:
+            return 0.0
+        return self._numpy.count_nonzero(columns.all(axis=1)) / float(union)
+
+    def shared_role_sets(self, min_users=2):
+        """Returns the groups of users mapped to exactly the same roles, largest first, as a list of
+        (roles, users) tuples
+
+        :param int min_users: smallest group to return
+        """
+        groups = dict()
+        indptr, indices = self.matrix.indptr, self.matrix.indices
+        for row in range(len(self.users)):
+            groups.setdefault(indices[indptr[row]:indptr[row + 1]].tobytes(), []).append(row)
+
+        result = []
+        for rows in groups.values():
+            if len(rows) >= min_users:
+                first = rows[0]
+                roles = [self.roles[column] for column in indices[indptr[first]:indptr[first + 1]]]
+                result.append((roles, [self.users[row] for row in rows]))
+        result.sort(key=lambda group: (-len(group[1]), group[0]))
+        return result
+
+    def redundant_roles(self):
+        """Returns the (role, superset) pairs where every user and backend role mapped to role is also mapped
+        to superset, so the mapping of role adds no members. Roles without members are left out.
+        """
+        numpy = self._numpy
+        members = self._members()
+        shared = members.T.dot(members).toarray()
+        counts = shared.diagonal()
+        contained = (shared == counts[:, None]) & (counts[:, None] > 0)
+        numpy.fill_diagonal(contained, False)
+        return [(self.roles[role], self.roles[superset]) for role, superset in zip(*numpy.nonzero(contained))]
+
+    def _members(self):
+        """Private function stacking the user and backend role rows into one members x roles matrix"""
+        return self._sparse.vstack([self.matrix, self.backendrole_matrix]).tocsr()
+
+    def _column_counts(self, matrix):
+        return self._numpy.asarray(matrix.sum(axis=0)).ravel()
+
+    def _rows(self, matrix, index, names):
+        positions = [index.get(name) for name in names]
+        known = [position for position in positions if position is not None]
+        selected = matrix[known]
+        indptr, indices = selected.indptr, selected.indices
+
+        result, row = dict(), 0
+        for name, position in zip(names, positions):
+            if position is None:
+                result[name] = []
+                continue
+            result[name] = [self.roles[column] for column in indices[indptr[row]:indptr[row + 1]]]
+            row += 1
+        return result
@@ -0,0 +1,115 @@
+#!/usr/bin/python3
+
+import itertools
+import threading
+import time
+import searchguard.settings as settings
+
+
+ROUND_ROBIN = 'round_robin'
+LEAST_OUTSTANDING = 'least_outstanding'
+
+
+class Node(object):
+    """A coordinating node of the cluster and its passive health state"""
+
+    def __init__(self, url):
+        self.url = url
+        self.outstanding = 0
+        self.failures = 0
+        self.ejected_until = 0.0
+
+    def healthy(self, now):
+        return self.ejected_until <= now
+
+    def __repr__(self):
+        return '<Node {} outstanding={} failures={}>'.format(self.url, self.outstanding, self.failures)
+
+
+class NodePool(object):
+    """Spreads requests over the configured node URLs with passive health tracking
+    A node is ejected for ejection_time seconds after max_failures consecutive failed requests (connection
+    errors or 5xx responses). Once the ejection ends it is readmitted: a successful request resets its
+    failure count, another failure ejects it again. When every node is ejected all nodes are used.
+
+    :param list urls: base URLs of the Search Guard API on every node
+    :param str strategy: round_robin or least_outstanding (fewest requests in flight)
+    :param int max_failures: consecutive failures after which a node is ejected
+    :param float ejection_time: seconds an ejected node is skipped
+    """
+
+    def __init__(self, urls, strategy=ROUND_ROBIN, max_failures=3, ejection_time=30):
+        if strategy not in (ROUND_ROBIN, LEAST_OUTSTANDING):
+            raise ValueError('Unknown load balancing strategy {}'.format(strategy))
+
+        self.nodes = [Node(url) for url in urls]
+        self.strategy = strategy
+        self.max_failures = max_failures
+        self.ejection_time = ejection_time
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def select(self, exclude=()):
+        """Returns the node for the next request, skipping ejected nodes and the nodes in exclude"""
+        now = time.time()
+        with self._lock:
+            candidates = [node for node in self.nodes if node not in exclude] or self.nodes
+            candidates = [node for node in candidates if node.healthy(now)] or candidates
+
+            start = next(self._counter)
+            rotated = [candidates[(start + i) % len(candidates)] for i in range(len(candidates))]
+            if self.strategy == LEAST_OUTSTANDING:
+                return min(rotated, key=lambda node: node.outstanding)
+            return rotated[0]
+
+    def acquire(self, node):
+        with self._lock:
+            node.outstanding += 1
+
+    def release(self, node, success):
+        """Marks a request to node as finished and updates its health (left as it is when success is None)"""
+        with self._lock:
+            node.outstanding -= 1
+            if success is None:
+                return
+            if success:
+                node.failures = 0
+                return
+
+            node.failures += 1
+            if node.failures >= self.max_failures:
+                node.ejected_until = time.time() + self.ejection_time
+
+    def healthy_nodes(self):
+        now = time.time()
+        return [node for node in self.nodes if node.healthy(now)]
+
+
+_pool = None
+_pool_config = None
+
+
+def parse_urls(value):
+    """Splits a comma separated SEARCHGUARD_API_URL into the node URLs"""
+    return [url.strip() for url in value.split(',') if url.strip()] or [value]
+
+
+def get_pool():
+    """Returns the NodePool for the node URLs in SEARCHGUARD_API_URL (comma separated)
+    The pool is rebuilt whenever SEARCHGUARD_API_URL or SEARCHGUARD_LOAD_BALANCING change.
+    """
+    global _pool, _pool_config
+
+    config = (settings.SEARCHGUARD_API_URL, settings.SEARCHGUARD_LOAD_BALANCING)
+    pool = _pool
+    if pool is None or _pool_config != config:
+        pool = NodePool(parse_urls(config[0]), strategy=config[1])
+        _pool, _pool_config = pool, config
+    return pool
+
+
+def set_pool(pool):
+    """Uses a custom NodePool (other strategy or health parameters) for the configured node URLs"""
+    global _pool, _pool_config
+
+    _pool, _pool_config = pool, (settings.SEARCHGUARD_API_URL, settings.SEARCHGUARD_LOAD_BALANCING)
@@ -0,0 +1,165 @@
+#!/usr/bin/python3
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+import searchguard.deadline as deadline
+from searchguard.exceptions import DeadlineExceededException
+
+
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+CLASSES = (INTERACTIVE, BATCH)
+
+_local = threading.local()
+
+
+def current():
+    """Returns the priority class of the requests sent by this thread (interactive unless set)"""
+    return getattr(_local, 'priority', None) or INTERACTIVE
+
+
+@contextmanager
+def priority(name):
+    """Sends every request made in the with block with the given priority class
+
+    :param str name: interactive or batch
+    """
+    if name not in CLASSES:
+        raise ValueError('Unknown priority class {}'.format(name))
+
+    outer = getattr(_local, 'priority', None)
+    _local.priority = name
+    try:
+        yield
+    finally:
+        _local.priority = outer
+
+
+def propagate(func):
+    """Wraps func so it runs with the priority class of the calling thread (interactive unless set)"""
+    name = current()
+
+    def wrapper(*args, **kwargs):
+        with priority(name):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class _ClassStats(object):
+
+    def __init__(self):
+        self.waiting = deque()
+        self.in_flight = 0
+        self.requests = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+
+class Dispatcher(object):
+    """Schedules the requests of all threads over a fixed number of concurrent requests (the size of the
+    connection pool), interactive requests first. Batch requests can use at most capacity - reserved
+    slots, so interactive calls always find a free slot or are next in line.
+
+    :param int capacity: maximum number of requests in flight
+    :param int reserved: slots only interactive requests can use
+    """
+
+    def __init__(self, capacity=10, reserved=2):
+        if not 0 <= reserved < capacity:
+            raise ValueError('reserved has to be between 0 and capacity - 1')
+        self.capacity = capacity
+        self.reserved = reserved
+        self._classes = {name: _ClassStats() for name in CLASSES}
+        self._condition = threading.Condition()
+
+    def _in_flight(self):
+        return sum(stats.in_flight for stats in self._classes.values())
+
+    def _may_start(self, name, ticket):
+        stats = self._classes[name]
+        if stats.waiting[0] is not ticket:
+            return False
+        if name == INTERACTIVE:
+            return self._in_flight() < self.capacity
+        return not self._classes[INTERACTIVE].waiting and self._in_flight() < self.capacity - self.reserved
+
+    def acquire(self, name, timeout=None):
+        """Waits for a slot for a request of the given class
+
+        :raises: DeadlineExceededException when no slot became free within timeout
+        """
+        stats = self._classes[name]
+        ticket = object()
+        started = time.time()
+        with self._condition:
+            stats.waiting.append(ticket)
+            try:
+                while not self._may_start(name, ticket):
+                    remaining = None if timeout is None else timeout - (time.time() - started)
+                    if remaining is not None and remaining <= 0:
+                        raise DeadlineExceededException('No free {} request slot within {:.3f}s'.format(name, timeout))
+                    self._condition.wait(remaining)
+            finally:
+                stats.waiting.remove(ticket)
+                self._condition.notify_all()
+
+            waited = time.time() - started
+            stats.in_flight += 1
+            stats.requests += 1
+            stats.wait_total += waited
+            stats.wait_max = max(stats.wait_max, waited)
+
+    def release(self, name):
+        with self._condition:
+            self._classes[name].in_flight -= 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, name=None):
+        """Holds a slot for the priority class (default: the class of this thread) while in the with block
+        Waiting is capped to the remaining budget of the current deadline.
+        """
+        name = name or current()
+        self.acquire(name, deadline.remaining())
+        try:
+            yield
+        finally:
+            self.release(name)
+
+    def stats(self):
+        """Returns per class: queue depth, requests in flight, requests sent, mean and max wait in seconds"""
+        with self._condition:
+            return {name: {'queued': len(stats.waiting),
+                           'in_flight': stats.in_flight,
+                           'requests': stats.requests,
+                           'wait_mean': stats.wait_total / stats.requests if stats.requests else 0.0,
+                           'wait_max': stats.wait_max}
+                    for name, stats in self._classes.items()}
+
+
+_dispatcher = None
+
+
+def enable(capacity=10, reserved=2):
+    """Schedules all requests through a Dispatcher and returns it. Match capacity to the connection pool
+
+    :param int capacity: maximum number of requests in flight
+    :param int reserved: slots only interactive requests can use
+    """
+    global _dispatcher
+
+    _dispatcher = Dispatcher(capacity, reserved)
+    return _dispatcher
+
+
+def disable():
+    global _dispatcher
+
+    _dispatcher = None
+
+
+def get_dispatcher():
+    """Returns the active Dispatcher, or None when priority scheduling is disabled"""
+    return _dispatcher
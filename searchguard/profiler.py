@@ -0,0 +1,220 @@
+#!/usr/bin/python3
+"""Per-phase latency profiler for the API calls of the internalusers, roles and rolesmapping modules
+
+While a profile is active every request is broken down into DNS resolution, TCP connect, TLS handshake,
+server time (request sent until the response is read) and JSON parsing, and aggregated per library
+function (e.g. internalusers.create_user). The timings are collected by temporarily wrapping
+socket.getaddrinfo, socket.socket.connect and ssl.SSLContext.wrap_socket; nothing is wrapped and no
+work is done while no profile is active. Reused keep-alive connections show up without DNS, connect
+and TLS time, which is exactly what the profile should reveal.
+
+    with profiling('create_user.json') as profile:
+        create_user('foo')
+"""
+
+import json
+import socket
+import ssl
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+PHASES = ('dns', 'connect', 'tls', 'server', 'parse')
+PROFILED_MODULES = ('searchguard.internalusers', 'searchguard.roles', 'searchguard.rolesmapping')
+
+_profile = None
+_local = threading.local()
+_originals = {}
+
+
+def _caller():
+    """Returns the outermost function of the profiled modules on the current stack, like roles.create_role"""
+    name = getattr(_local, 'caller', None) or 'unknown'
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get('__name__')
+        if module in PROFILED_MODULES:
+            name = '{}.{}'.format(module.split('.')[-1], frame.f_code.co_name)
+        frame = frame.f_back
+    return name
+
+
+def propagate(func):
+    """Wraps func so the requests it sends in a worker thread are attributed to the function of the calling thread"""
+    if _profile is None:
+        return func
+    function = _caller()
+
+    def wrapper(*args, **kwargs):
+        outer = getattr(_local, 'caller', None)
+        _local.caller = function
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.caller = outer
+    return wrapper
+
+
+def _timed(phase, func):
+    def wrapper(*args, **kwargs):
+        sample = getattr(_local, 'sample', None)
+        if sample is None:
+            return func(*args, **kwargs)
+
+        started = time.time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            sample[phase] += time.time() - started
+    return wrapper
+
+
+def _install():
+    _originals['getaddrinfo'] = socket.getaddrinfo
+    _originals['connect'] = socket.socket.connect
+    _originals['wrap_socket'] = ssl.SSLContext.wrap_socket
+
+    socket.getaddrinfo = _timed('dns', socket.getaddrinfo)
+    socket.socket.connect = _timed('connect', socket.socket.connect)
+    ssl.SSLContext.wrap_socket = _timed('tls', ssl.SSLContext.wrap_socket)
+
+
+def _uninstall():
+    socket.getaddrinfo = _originals.pop('getaddrinfo')
+    socket.socket.connect = _originals.pop('connect')
+    ssl.SSLContext.wrap_socket = _originals.pop('wrap_socket')
+
+
+def _percentile(samples, percentile):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100.0))]
+
+
+class Profile(object):
+    """Aggregated phase timings (in seconds) per library function"""
+
+    def __init__(self, functions=None):
+        # function -> {'requests': int, 'totals': [seconds per request], phase: summed seconds}
+        self.functions = functions or {}
+        self._lock = threading.Lock()
+
+    def _stats(self, function):
+        stats = self.functions.get(function)
+        if stats is None:
+            stats = self.functions[function] = dict({phase: 0.0 for phase in PHASES}, requests=0, totals=[])
+        return stats
+
+    def add_request(self, function, phases, total):
+        """Adds one request, phases maps dns, connect, tls and server to seconds"""
+        with self._lock:
+            stats = self._stats(function)
+            stats['requests'] += 1
+            stats['totals'].append(total)
+            for phase, seconds in phases.items():
+                stats[phase] += seconds
+
+    def add_parse(self, function, seconds):
+        with self._lock:
+            self._stats(function)['parse'] += seconds
+
+    def report(self):
+        """Returns a table with the mean time per request and phase, and the p99 per request, in ms"""
+        lines = ['{:<40} {:>8} {:>9} {:>9} {:>9} {:>9} {:>9} {:>9} {:>9}'.format(
+            'function', 'requests', *(PHASES + ('mean', 'p99')))]
+        for function in sorted(self.functions):
+            stats = self.functions[function]
+            requests = max(stats['requests'], 1)
+            mean = (sum(stats['totals']) + stats['parse']) / requests
+            lines.append('{:<40} {:>8} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f}'.format(
+                function, stats['requests'], *([stats[phase] / requests * 1000 for phase in PHASES] +
+                                               [mean * 1000, _percentile(stats['totals'], 99) * 1000])))
+        return '\n'.join(lines)
+
+    def dump(self, path):
+        """Writes the profile as JSON, it can be read back with Profile.load"""
+        with open(path, 'w') as fh:
+            json.dump(self.functions, fh, indent=2, sort_keys=True)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as fh:
+            return cls(json.load(fh))
+
+
+def active():
+    """Returns the active Profile, or None when not profiling"""
+    return _profile
+
+
+def start():
+    """Starts a new profile and returns it, raises RuntimeError when a profile is already active"""
+    global _profile
+
+    if _profile is not None:
+        raise RuntimeError('A profile is already active')
+    _install()
+    _profile = Profile()
+    return _profile
+
+
+def stop():
+    """Stops the active profile and returns it"""
+    global _profile
+
+    profile, _profile = _profile, None
+    if profile is not None:
+        _uninstall()
+    return profile
+
+
+@contextmanager
+def profiling(path=None, stream=None):
+    """Profiles the API calls made in the with block, prints the report and optionally writes it to path
+
+    :param str path: file to write the profile to as JSON
+    :param stream: file object for the report (default stderr), False to not print it
+    """
+    profile = start()
+    try:
+        yield profile
+    finally:
+        stop()
+        if stream is not False:
+            (stream or sys.stderr).write(profile.report() + '\n')
+        if path:
+            profile.dump(path)
+
+
+def measure_request(func, *args, **kwargs):
+    """Calls func (a transport request) and records its phases in the active profile"""
+    profile = _profile
+    if profile is None:
+        return func(*args, **kwargs)
+
+    function = _caller()
+    sample = _local.sample = {'dns': 0.0, 'connect': 0.0, 'tls': 0.0}
+    started = time.time()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        total = time.time() - started
+        _local.sample = None
+        sample['server'] = max(total - sum(sample.values()), 0.0)
+        profile.add_request(function, sample, total)
+
+
+def measure_parse(func, *args):
+    """Calls func (a JSON parser) and records the time in the active profile"""
+    profile = _profile
+    if profile is None:
+        return func(*args)
+
+    started = time.time()
+    try:
+        return func(*args)
+    finally:
+        profile.add_parse(_caller(), time.time() - started)
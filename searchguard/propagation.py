@@ -0,0 +1,115 @@
+#!/usr/bin/python3
+
+import threading
+import time
+from collections import deque
+import searchguard.deadline as deadline
+import searchguard.nodes as nodes
+import searchguard.transport as transport
+from searchguard.concurrency import run_bounded
+from searchguard.fingerprints import canonicalize
+
+
+# Propagation latencies of earlier writes, to start polling around the time changes usually show up
+_observed = deque(maxlen=50)
+_observed_lock = threading.Lock()
+
+
+class PropagationResult(object):
+    """Result of wait_until_propagated
+
+    :ivar bool complete: the change was visible on every node before the timeout
+    :ivar float latency: seconds from the write until it was visible on the last node (None if incomplete)
+    :ivar dict nodes: node URL -> seconds until the change was visible on it
+    :ivar list pending: URLs of the nodes that did not show the change before the timeout
+    :ivar int probes: number of requests sent
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.pending = []
+        self.latency = None
+        self.probes = 0
+
+    @property
+    def complete(self):
+        return not self.pending
+
+    def __repr__(self):
+        return '<PropagationResult latency={} pending={} probes={}>'.format(self.latency, len(self.pending),
+                                                                            self.probes)
+
+
+def _first_delay(initial_delay):
+    """Private function returning the delay before the second round: half the median observed latency"""
+    with _observed_lock:
+        observed = sorted(_observed)
+    if not observed:
+        return initial_delay
+    return max(initial_delay, observed[len(observed) // 2] / 2)
+
+
+def _visible(resource, name, expected, deleted, response):
+    if deleted:
+        return response.status_code == 404
+    if response.status_code != 200:
+        return False
+    if expected is None:
+        return True
+
+    body = transport.parse_json(response).get(name)
+    if callable(expected):
+        return expected(body)
+    return body is not None and canonicalize(resource, body) == canonicalize(resource, expected)
+
+
+def wait_until_propagated(resource, name, expected=None, deleted=False, timeout=30, since=None,
+                          initial_delay=0.05, max_delay=2.0, backoff=2.0):
+    """Polls every configured node until a write is visible on all of them, instead of sleeping a fixed time
+    The nodes that do not show the change yet are probed concurrently in rounds. The first round is sent
+    right away, then the delay starts at half the median propagation latency of earlier writes and grows
+    by backoff up to max_delay.
+
+    :param str resource: internalusers, roles or rolesmapping
+    :param str name: username or role
+    :param expected: body the resource should have (compared like searchguard.fingerprints does), or a
+    callable(body) returning True when the change is visible. None only waits for the resource to exist
+    :param bool deleted: wait until the resource is gone instead
+    :param float timeout: seconds after which to give up
+    :param float since: time.time() of the write, the latencies are measured from it (default: now)
+    :param float initial_delay: minimum delay between rounds
+    :param float max_delay: maximum delay between rounds
+    :param float backoff: factor the delay grows with every round
+    :returns PropagationResult:
+    """
+    started = time.time() if since is None else since
+    result = PropagationResult()
+    pending = [node.url for node in nodes.get_pool().nodes]
+    delay = _first_delay(initial_delay)
+
+    def probe(url):
+        response = transport.send('get', '{}/{}'.format(resource, name), node=url)
+        try:
+            return _visible(resource, name, expected, deleted, response)
+        finally:
+            response.close()
+
+    with deadline.deadline(timeout) as budget:
+        while pending:
+            for outcome in run_bounded(probe, pending, concurrency=len(pending)):
+                result.probes += 1
+                if outcome.error is None and outcome.result:
+                    result.nodes[outcome.item] = time.time() - started
+            pending = [url for url in pending if url not in result.nodes]
+
+            if not pending or budget.remaining() <= delay:
+                break
+            time.sleep(delay)
+            delay = min(delay * backoff, max_delay)
+
+    result.pending = pending
+    if not pending:
+        result.latency = max(result.nodes.values())
+        with _observed_lock:
+            _observed.append(result.latency)
+    return result
@@ -0,0 +1,254 @@
+#!/usr/bin/python3
+
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import searchguard.transport as transport
+from searchguard.exceptions import ViewAllRoleMappingException, ListRolesException
+
+
+MAGIC = b'SGR1'
+# magic, sequence number, payload length, payload capacity, publish time
+HEADER = struct.Struct('<4sQQQd')
+SEQUENCE = struct.Struct('<Q')
+SEQUENCE_OFFSET = 4
+# Sequence number of a file that was replaced by a larger one, readers reopen the path
+MOVED = 2 ** 64 - 1
+INITIAL_CAPACITY = 1024 * 1024
+
+
+class SharedReplica(object):
+    """Copy of all role mappings (and optionally roles) in a memory mapped file, shared by the processes of
+    one host. One process, the leader holding an exclusive lock on path.lock, downloads and publishes
+    the data every interval seconds; the other processes read it without locks or requests.
+    The leader publishes with a sequence lock: the sequence number is odd while the payload is written,
+    readers retry when it was odd or changed while they copied, so they never see a partial update.
+    When the leader process stops, another process takes over the lock within an interval.
+    Data published more than max_age seconds ago is not served, so readers fall back to the API when the
+    leader keeps failing to refresh. Failed refreshes and elections are counted in errors.
+
+    :param str path: path of the shared file, for example on /dev/shm
+    :param float interval: seconds between refreshes
+    :param bool roles: also replicate all roles
+    :param float max_age: seconds after which published data is stale (default: three intervals)
+    :param on_error: optional callback(exception), called for every failed background refresh or election
+    """
+
+    def __init__(self, path, interval=30, roles=False, max_age=None, on_error=None):
+        self.path = path
+        self.interval = interval
+        self.include_roles = roles
+        self.max_age = max_age if max_age is not None else 3 * interval
+        self.on_error = on_error
+        self.leader = False
+        self.errors = 0
+
+        self._map = None
+        self._cached = (None, None, None)
+        self._lock_file = None
+        self._stopping = threading.Event()
+        self._thread = None
+        self._write_lock = threading.Lock()
+
+    def start(self):
+        """Tries to become the leader and starts the background refresh and leader election"""
+        self.elect()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='searchguard-replica')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+        self.leader = False
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def elect(self):
+        """Takes the leader lock when no other process holds it, returns whether this process leads"""
+        if self.leader:
+            return True
+
+        # Imported here, the module is imported on every platform but leader election needs POSIX locks
+        import fcntl
+        lock_file = open(self.path + '.lock', 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError):
+            lock_file.close()
+            return False
+
+        self._lock_file = lock_file
+        self.leader = True
+        self.refresh()
+        return True
+
+    def refresh(self):
+        """Downloads the data and publishes it (leader only)
+
+        :raises: ViewAllRoleMappingException, ListRolesException
+        """
+        response = transport.send('get', 'rolesmapping/')
+        if response.status_code != 200:
+            raise ViewAllRoleMappingException('Unknown error retrieving all role mappings')
+        data = {'rolemappings': transport.parse_json(response)}
+
+        if self.include_roles:
+            response = transport.send('get', 'roles/')
+            if response.status_code != 200:
+                raise ListRolesException('Error listing roles. status: {} - body: {}'.format(
+                    response.status_code, response.text))
+            data['roles'] = transport.parse_json(response)
+
+        self.publish(json.dumps(data, separators=(',', ':')).encode('utf-8'))
+
+    def publish(self, payload):
+        """Writes a new payload under the sequence lock, moving to a larger file when it does not fit"""
+        with self._write_lock:
+            shared = self._open()
+            sequence = 0 if shared is None else SEQUENCE.unpack_from(shared, SEQUENCE_OFFSET)[0]
+            if shared is None or len(shared) - HEADER.size < len(payload):
+                # Numbering continues in the new file, so readers never mistake it for their cached copy
+                self._create(max(INITIAL_CAPACITY, 2 * len(payload)), sequence)
+                shared = self._open()
+            SEQUENCE.pack_into(shared, SEQUENCE_OFFSET, sequence + 1)
+            shared[HEADER.size:HEADER.size + len(payload)] = payload
+            HEADER.pack_into(shared, 0, MAGIC, sequence + 1, len(payload), len(shared) - HEADER.size, time.time())
+            SEQUENCE.pack_into(shared, SEQUENCE_OFFSET, sequence + 2)
+
+    def read(self):
+        """Returns the published data ({'rolemappings': ..., 'roles': ...}) and its publish time, or
+        (None, None) when nothing was published yet. The payload is copied out of the shared file once per
+        publish, every call decodes it into its own dicts, so callers may modify the result.
+        """
+        for _ in range(1000):
+            shared = self._open()
+            if shared is None:
+                return None, None
+
+            sequence = SEQUENCE.unpack_from(shared, SEQUENCE_OFFSET)[0]
+            if sequence == MOVED:
+                self._map = None
+                continue
+            if sequence == 0:
+                return None, None
+            if sequence == self._cached[0]:
+                return json.loads(self._cached[1]), self._cached[2]
+            if sequence % 2:
+                # The leader is writing
+                time.sleep(0)
+                continue
+
+            _, _, length, _, published = HEADER.unpack_from(shared, 0)
+            payload = shared[HEADER.size:HEADER.size + length]
+            if SEQUENCE.unpack_from(shared, SEQUENCE_OFFSET)[0] != sequence:
+                continue
+
+            self._cached = (sequence, payload.decode('utf-8'), published)
+            return json.loads(self._cached[1]), published
+        return None, None
+
+    def _read_fresh(self):
+        """Returns the published data like read, or None when nothing was published within max_age"""
+        data, published = self.read()
+        if data is None or time.time() - published > self.max_age:
+            return None
+        return data
+
+    def rolemappings(self):
+        """Returns a copy of the replicated role mappings, or None when nothing was published within max_age"""
+        data = self._read_fresh()
+        return None if data is None else data['rolemappings']
+
+    def roles(self):
+        """Returns a copy of the replicated roles, or None when they are not replicated or nothing was
+        published within max_age
+        """
+        data = self._read_fresh()
+        return None if data is None else data.get('roles')
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            self._tick()
+
+    def _tick(self):
+        try:
+            if self.leader:
+                self.refresh()
+            else:
+                self.elect()
+        except Exception as e:
+            # Keep serving the last published copy until it is stale, the next interval retries
+            self.errors += 1
+            if self.on_error is not None:
+                self.on_error(e)
+
+    def _create(self, capacity, sequence):
+        """Private function creating a new, larger file and marking the mapped one as moved"""
+        temporary = '{}.{}.tmp'.format(self.path, os.getpid())
+        with open(temporary, 'wb') as new_file:
+            new_file.truncate(HEADER.size + capacity)
+            new_file.write(HEADER.pack(MAGIC, sequence, 0, capacity, 0.0))
+        os.replace(temporary, self.path)
+
+        if self._map is not None:
+            # Other threads may still be reading the old mapping, it is closed once unreferenced
+            SEQUENCE.pack_into(self._map, SEQUENCE_OFFSET, MOVED)
+            self._map = None
+
+    def _open(self):
+        if self._map is None:
+            try:
+                with open(self.path, 'r+b') as shared_file:
+                    shared = mmap.mmap(shared_file.fileno(), 0)
+            except (IOError, OSError, ValueError):
+                return None
+            if shared[:4] != MAGIC:
+                return None
+            self._map = shared
+        return self._map
+
+
+_replica = None
+
+
+def enable(path, interval=30, roles=False, max_age=None, on_error=None):
+    """Serves view_all_rolemappings (and with roles=True list_roles) from a SharedReplica, returns it
+    Every process of the host enables it with the same path, one of them becomes the leader.
+    Read-modify-write operations like teardown_tenant always read from the API.
+
+    :param str path: path of the shared file, for example /dev/shm/searchguard-replica
+    :param float interval: seconds between refreshes
+    :param bool roles: also replicate all roles
+    :param float max_age: seconds after which published data is stale (default: three intervals)
+    :param on_error: optional callback(exception), called for every failed background refresh or election
+    """
+    global _replica
+
+    disable()
+    _replica = SharedReplica(path, interval, roles, max_age, on_error).start()
+    return _replica
+
+
+def disable():
+    global _replica
+
+    replica, _replica = _replica, None
+    if replica is not None:
+        replica.stop()
+
+
+def get_replica():
+    """Returns the active SharedReplica, or None when it is disabled"""
+    return _replica
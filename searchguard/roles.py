@@ -1,15 +1,35 @@
 #!/usr/bin/python3
 
-import requests
 import warnings
 import json
 from searchguard.exceptions import *
 import searchguard.settings as settings
+import searchguard.transport as transport
+import searchguard.fingerprints as fingerprints
+import searchguard.existence as existence
+import searchguard.validation as validation
+import searchguard.replica as replica
+from searchguard.streaming import iter_json_object
+from searchguard.batchread import read_batch
+
+
+def _remember(role, permissions):
+    """Private function to record the written permissions when compare-before-write is enabled"""
+    cache = fingerprints.get_cache()
+    if cache is not None:
+        cache.set('roles', role, permissions)
+
+
+def _forget(role):
+    """Private function to drop the fingerprint of a deleted role"""
+    cache = fingerprints.get_cache()
+    if cache is not None:
+        cache.discard('roles', role)
 
 
 def check_role_exists(role):
     """Returns True of False depending on whether the requested role exists in Search Guard"""
-    role_exists_check = requests.get('{}/roles/{}'.format(settings.SEARCHGUARD_API_URL, role), auth=settings.SEARCHGUARD_API_AUTH)
+    role_exists_check = transport.send('get', 'roles/{}'.format(role), hedge=True)
 
     if role_exists_check.status_code == 200:
         # Role exists in SearchGuard
@@ -25,23 +45,38 @@ def check_role_exists(role):
 def create_role(role, permissions=None):
     """Creates a Search Guard role. Returns when successfully created
     When no permissions are specified, we use some default cluster permissions.
+    When the existence filter is enabled (see searchguard.existence), the check request is skipped for
+    names that definitely do not exist.
 
     :param str role: Name of the role to create in Search Guard
     :param dict permissions: Search Guard role permissions (default is read access to cluster)
-    :raises: RoleAlreadyExistsException, CreateRoleException
+    :raises: RoleAlreadyExistsException, CreateRoleException, ValidationException
     """
-    if not check_role_exists(role):
+    if permissions:
+        validation.check('roles', role, permissions)
+
+    existence_filter = existence.get_filter()
+    checked = existence_filter is None or existence_filter.might_exist('roles', role)
+    if not checked or not check_role_exists(role):
         # The role does not exist, let's create it
         # When no permissions are requested, we only add basic cluster perms, no indice perms.
         payload = {'cluster': ["indices:data/read/mget", "indices:data/read/msearch"]}
         if permissions:
             payload = permissions
-        create_sg_role = requests.put('{}/roles/{}'.format(settings.SEARCHGUARD_API_URL, role),
-                                      data=json.dumps(payload), headers=settings.HEADER, auth=settings.SEARCHGUARD_API_AUTH)
+        create_sg_role = transport.send('put', 'roles/{}'.format(role),
+                                        data=json.dumps(payload), headers=settings.HEADER)
 
         if create_sg_role.status_code == 201:
             # Role created successfully
+            _remember(role, payload)
+            if existence_filter is not None:
+                existence_filter.add('roles', role)
             return
+        elif create_sg_role.status_code == 200 and not checked:
+            # The role was created by someone else after the existence filter was loaded, the PUT updated it
+            _remember(role, payload)
+            existence_filter.add('roles', role)
+            raise RoleAlreadyExistsException('Role {} already exists'.format(role))
         else:
             # Raise exception because we received an error when creating the role
             raise CreateRoleException('Error creating role {} - msg: {}'.format(role, create_sg_role.text))
@@ -50,51 +85,149 @@ def create_role(role, permissions=None):
 
 
 def modify_role(role, permissions):
-    """Modifies a Search Guard role. Returns when successfully modified"""
+    """Modifies a Search Guard role. Returns when successfully modified
+    When compare-before-write is enabled (see searchguard.fingerprints), the write is skipped if the
+    permissions match the last known state of the role.
+    When validation is enabled (see searchguard.validation), invalid permissions are rejected before any
+    request is sent.
+    """
+    validation.check('roles', role, permissions)
+
+    cache = fingerprints.get_cache()
+    if cache is not None and cache.skip_write('roles', role, permissions):
+        # Nothing changed, skip the existence check, the write and the security config reload
+        return
+
     if check_role_exists(role):
         # The role does exist, let's modify it
-        modify_sg_role = requests.put('{}/roles/{}'.format(settings.SEARCHGUARD_API_URL, role),
-                                      data=json.dumps(permissions), headers=settings.HEADER, auth=settings.SEARCHGUARD_API_AUTH)
+        modify_sg_role = transport.send('put', 'roles/{}'.format(role),
+                                        data=json.dumps(permissions), headers=settings.HEADER)
 
         if modify_sg_role.status_code == 200:
             # Role modified successfully
+            _remember(role, permissions)
             return
         else:
             # Raise exception because we received an error when modifying the role
             raise ModifyRoleException('Error modifying role {} - msg: {}'.format(role, modify_sg_role.text))
     else:
         # Raise exception because the role does not exist
-        raise ModifyRoleException('Role {} does not exist'.format(role))
+        raise RoleNotFoundException('Role {} does not exist'.format(role))
 
 
 def delete_role(role):
     """Deletes a Search Guard roles. Returns when successfully deleted"""
     if check_role_exists(role):
         # The role does exist, let's delete it
-        delete_sg_role = requests.delete('{}/roles/{}'.format(settings.SEARCHGUARD_API_URL, role), auth=settings.SEARCHGUARD_API_AUTH)
+        delete_sg_role = transport.send('delete', 'roles/{}'.format(role))
 
         if delete_sg_role.status_code == 200:
             # Role deleted successfully
+            _forget(role)
             return
         else:
             # Raise exception because we could not delete the role
             raise DeleteRoleException('Error deleting the role {} - msg: {}'.format(role, delete_sg_role.text))
     else:
         # Raise exception because the role does not exist
-        raise DeleteRoleException('Error deleting the role {}, does not exist'.format(role))
+        raise RoleNotFoundException('Error deleting the role {}, does not exist'.format(role))
 
 
 def view_role(role):
     """Returns the permissions for the requested role if it exists"""
     if check_role_exists(role):
         # The role does exist, let's view it
-        view_sg_role = requests.get('{}/roles/{}'.format(settings.SEARCHGUARD_API_URL, role), auth=settings.SEARCHGUARD_API_AUTH)
+        view_sg_role = transport.send('get', 'roles/{}'.format(role))
 
         if view_sg_role.status_code == 200:
+            cache = fingerprints.get_cache()
+            if cache is not None:
+                cache.set('roles', role, transport.parse_json(view_sg_role)[role])
             return view_sg_role.text
         else:
             # Raise exception because we could not view the role
             raise ViewRoleException('Error viewing the role {} - msg {}'.format(role, view_sg_role.text))
     else:
         # Raise exception because the role does not exist
-        raise ViewRoleException('Error viewing the role {}, does not exist'.format(role))
+        raise RoleNotFoundException('Error viewing the role {}, does not exist'.format(role))
+
+
+def view_roles(roles, concurrency=8, strategy=None):
+    """Returns the permissions of many Search Guard roles at once
+    Reads them with a concurrent GET per role or with a single GET of all roles, whichever the cost model
+    (see searchguard.batchread) estimates to be cheaper. Unlike view_role no existence checks are sent.
+
+    :param list roles: names of the roles to view
+    :param int concurrency: number of parallel GETs
+    :param str strategy: force per_name or bulk
+    :returns BatchReadResult: found (role -> permissions), missing roles and the chosen strategy
+    :raises: ViewRoleException
+    """
+    def loaded(listing):
+        cache = fingerprints.get_cache()
+        if cache is not None:
+            cache.refresh('roles', listing)
+        existence_filter = existence.get_filter()
+        if existence_filter is not None:
+            existence_filter.load('roles', listing)
+
+    result = read_batch('roles', roles, ViewRoleException, concurrency, strategy, on_listing=loaded)
+    if result.strategy == 'per_name':
+        for role, permissions in result.found.items():
+            _remember(role, permissions)
+    return result
+
+
+def list_roles(fresh=False):
+    """Returns all Search Guard roles and their permissions
+    When compare-before-write is enabled, the fingerprints of all roles are refreshed from the result,
+    when the existence filter is enabled it is loaded with all roles.
+    When the shared replica replicates roles (see searchguard.replica), its copy is returned without a request.
+
+    :param bool fresh: always read from the API, for callers that write back what they read
+    :raises: ListRolesException
+    """
+    shared = None if fresh else replica.get_replica()
+    roles = shared.roles() if shared is not None else None
+    if roles is not None:
+        cache = fingerprints.get_cache()
+        if cache is not None:
+            for role, permissions in roles.items():
+                cache.check('roles', role, permissions)
+        return roles
+
+    response = transport.send('get', 'roles/')
+
+    if response.status_code == 200:
+        roles = transport.parse_json(response)
+        cache = fingerprints.get_cache()
+        if cache is not None:
+            cache.refresh('roles', roles)
+        existence_filter = existence.get_filter()
+        if existence_filter is not None:
+            existence_filter.load('roles', roles)
+        return roles
+    else:
+        # Raise exception because the API did not return code 200
+        raise ListRolesException('Error listing roles. status: {} - body: {}'.format(response.status_code, response.text))
+
+
+def iter_roles():
+    """Yields (role, permissions) for every Search Guard role while the response is being downloaded
+
+    :raises: ListRolesException
+    """
+    response = transport.send('get', 'roles/', stream=True)
+
+    try:
+        if response.status_code != 200:
+            # Raise exception because the API did not return code 200
+            raise ListRolesException('Error listing roles. status: {} - body: {}'.format(response.status_code, response.text))
+
+        cache = fingerprints.get_cache()
+        for role, permissions in iter_json_object(response.iter_content(transport.STREAM_CHUNK_SIZE)):
+            if cache is not None:
+                cache.check('roles', role, permissions)
+            yield role, permissions
+    finally:
+        response.close()
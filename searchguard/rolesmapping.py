@@ -1,12 +1,16 @@
 #!/usr/bin/python3
 
-import requests
 import json
 import searchguard.settings as settings
+import searchguard.transport as transport
+import searchguard.fingerprints as fingerprints
+import searchguard.validation as validation
+import searchguard.replica as replica
 from searchguard.exceptions import RoleMappingException, CheckRoleMappingExistsException, ViewRoleMappingException, \
-    DeleteRoleMappingException, CreateRoleMappingException, ModifyRoleMappingException, CheckRoleExistsException, \
-    ViewAllRoleMappingException
+    DeleteRoleMappingException, CreateRoleMappingException, ModifyRoleMappingException, \
+    ViewAllRoleMappingException, RoleMappingNotFoundException, RoleNotFoundException
 from searchguard.roles import check_role_exists
+from searchguard.streaming import iter_json_object
 
 
 PROPERTIES_KEYS = {"users", "backendroles", "hosts"}
@@ -14,13 +18,15 @@ PROPERTIES_KEYS = {"users", "backendroles", "hosts"}
 
 def _send_api_request(role, properties):
     """Private function to process API calls for the rolemapping module"""
-    create_sg_rolemapping = requests.put('{}/rolesmapping/{}'.format(settings.SEARCHGUARD_API_URL, role),
-                                         data=json.dumps(properties),
-                                         headers=settings.HEADER,
-                                         auth=settings.SEARCHGUARD_API_AUTH)
+    create_sg_rolemapping = transport.send('put', 'rolesmapping/{}'.format(role),
+                                           data=json.dumps(properties),
+                                           headers=settings.HEADER)
 
     if create_sg_rolemapping.status_code in (200, 201):
         # Role mapping created or updated successfully
+        cache = fingerprints.get_cache()
+        if cache is not None:
+            cache.set('rolesmapping', role, properties)
         return
 
     # Error when creating/updating the role mapping
@@ -30,8 +36,7 @@ def _send_api_request(role, properties):
 
 def check_rolemapping_exists(role):
     """Returns True of False depending on whether the requested role mapping exists in Search Guard"""
-    rolemapping_exists_check = requests.get('{}/rolesmapping/{}'.format(settings.SEARCHGUARD_API_URL, role),
-                                            auth=settings.SEARCHGUARD_API_AUTH)
+    rolemapping_exists_check = transport.send('get', 'rolesmapping/{}'.format(role))
 
     if rolemapping_exists_check.status_code == 200:
         # Role mapping exists in SearchGuard
@@ -44,28 +49,68 @@ def check_rolemapping_exists(role):
         raise CheckRoleMappingExistsException('Unknown error checking whether role mapping for {} exists'.format(role))
 
 
-def view_all_rolemappings():
-    """Returns the properties for the requested role mappings if it exists"""
-    view_all_sg_rolemapping = requests.get('{}/rolesmapping/'.format(settings.SEARCHGUARD_API_URL),
-                                           auth=settings.SEARCHGUARD_API_AUTH)
+def view_all_rolemappings(fresh=False):
+    """Returns the properties for the requested role mappings if it exists
+    When the shared replica is enabled (see searchguard.replica), its copy is returned without a request.
+
+    :param bool fresh: always read from the API, for callers that write back what they read
+    """
+    shared = None if fresh else replica.get_replica()
+    rolemappings = shared.rolemappings() if shared is not None else None
+    if rolemappings is not None:
+        cache = fingerprints.get_cache()
+        if cache is not None:
+            for role, properties in rolemappings.items():
+                cache.check('rolesmapping', role, properties)
+        return rolemappings
+
+    view_all_sg_rolemapping = transport.send('get', 'rolesmapping/', hedge=True)
 
     if view_all_sg_rolemapping.status_code == 200:
-        return json.loads(view_all_sg_rolemapping.text)
+        rolemappings = transport.parse_json(view_all_sg_rolemapping)
+        cache = fingerprints.get_cache()
+        if cache is not None:
+            cache.refresh('rolesmapping', rolemappings)
+        return rolemappings
     else:
         # Could not fetch valid output
         raise ViewAllRoleMappingException('Unknown error retrieving all role mappings')
 
 
+def iter_rolemappings():
+    """Yields (role, properties) for every role mapping while the response is being downloaded
+
+    :raises: ViewAllRoleMappingException
+    """
+    response = transport.send('get', 'rolesmapping/', stream=True)
+
+    try:
+        if response.status_code != 200:
+            # Could not fetch valid output
+            raise ViewAllRoleMappingException('Unknown error retrieving all role mappings')
+
+        cache = fingerprints.get_cache()
+        for role, properties in iter_json_object(response.iter_content(transport.STREAM_CHUNK_SIZE)):
+            if cache is not None:
+                cache.check('rolesmapping', role, properties)
+            yield role, properties
+    finally:
+        response.close()
+
+
 def view_rolemapping(role):
     """Returns the properties for the requested role mapping if it exists"""
-    view_sg_rolemapping = requests.get('{}/rolesmapping/{}'.format(settings.SEARCHGUARD_API_URL, role),
-                                       auth=settings.SEARCHGUARD_API_AUTH)
+    view_sg_rolemapping = transport.send('get', 'rolesmapping/{}'.format(role), hedge=True)
 
     if view_sg_rolemapping.status_code == 200:
-        return json.loads(view_sg_rolemapping.text)
+        rolemapping = transport.parse_json(view_sg_rolemapping)
+        cache = fingerprints.get_cache()
+        if cache is not None:
+            cache.set('rolesmapping', role, rolemapping[role])
+        return rolemapping
     elif view_sg_rolemapping.status_code == 404:
         # Raise exception because the role mapping does not exist
-        raise ViewRoleMappingException('Error viewing the role mapping for {}, does not exist'.format(role))
+        raise RoleMappingNotFoundException('Error viewing the role mapping for {}, does not exist'.format(role))
     else:
         # Could not fetch valid output
         raise ViewRoleMappingException('Unknown error checking whether role mapping for {} exists'.format(role))
@@ -75,11 +120,13 @@ def delete_rolemapping(role):
     """Deletes a Search Guard role mapping. Returns when successfully deleted"""
     if check_rolemapping_exists(role):
         # The role mapping does exist, let's delete it
-        delete_sg_rolemapping = requests.delete('{}/rolesmapping/{}'.format(settings.SEARCHGUARD_API_URL, role),
-                                                auth=settings.SEARCHGUARD_API_AUTH)
+        delete_sg_rolemapping = transport.send('delete', 'rolesmapping/{}'.format(role))
 
         if delete_sg_rolemapping.status_code == 200:
             # Role mapping deleted successfully
+            cache = fingerprints.get_cache()
+            if cache is not None:
+                cache.discard('rolesmapping', role)
             return
         else:
             # Raise exception because we could not delete the role mapping
@@ -87,7 +134,7 @@ def delete_rolemapping(role):
                                              '- msg: {}'.format(role, delete_sg_rolemapping.text))
     else:
         # Raise exception because the role mapping does not exist
-        raise DeleteRoleMappingException('Error deleting the role mapping for role {}, does not exist'.format(role))
+        raise RoleMappingNotFoundException('Error deleting the role mapping for role {}, does not exist'.format(role))
 
 
 def create_rolemapping(role, properties):
@@ -97,10 +144,12 @@ def create_rolemapping(role, properties):
 
     :param str role: Name of the role mapping to create in Search Guard
     :param dict properties: Search Guard role mapping fields (users, backendroles and/or hosts)
-    :raises: CreateRoleMappingException, CheckRoleExistsException
+    :raises: CreateRoleMappingException, CheckRoleExistsException, ValidationException
     """
+    validation.check('rolesmapping', role, properties)
+
     if not check_role_exists(role):
-        raise CheckRoleExistsException('Role {} does not exist'.format(role))
+        raise RoleNotFoundException('Role {} does not exist'.format(role))
 
     if not any(key in properties for key in PROPERTIES_KEYS):
         # Raise exception because we did not receive valid properties
@@ -121,10 +170,21 @@ def modify_rolemapping(role, properties, action="replace"):
     :param str action: Defines what to do with the properties. Defaults to replace (overwrites existing
     properties). Other options are merge (combine the properties with existing ones) or split
     (removes the properties from existing ones)
-    :raises: ModifyRoleMappingException
+    When compare-before-write is enabled (see searchguard.fingerprints), the write is skipped if the
+    resulting role mapping matches its last known state.
+    When validation is enabled (see searchguard.validation), invalid properties are rejected before any
+    request is sent.
+    :raises: ModifyRoleMappingException, ValidationException
     """
+    validation.check('rolesmapping', role, properties)
+
+    cache = fingerprints.get_cache()
+    if action not in ("merge", "split") and cache is not None and cache.skip_write('rolesmapping', role, properties):
+        # Nothing changed, skip the existence check, the write and the security config reload
+        return
+
     if not check_rolemapping_exists(role):
-        raise ModifyRoleMappingException('Mapping for role {} does not exist'.format(role))
+        raise RoleMappingNotFoundException('Mapping for role {} does not exist'.format(role))
 
     if not any(key in properties for key in PROPERTIES_KEYS):
         # Raise exception because we did not receive valid properties
@@ -137,7 +197,7 @@ def modify_rolemapping(role, properties, action="replace"):
         if property not in rolemapping[role]:
             rolemapping[role][property] = list()
 
-    if action is "merge":
+    if action == "merge":
         # Merge the requested properties with existing properties in the role mapping.
 
         rolemapping[role]['users'] = \
@@ -147,10 +207,11 @@ def modify_rolemapping(role, properties, action="replace"):
         rolemapping[role]['hosts'] = \
             sorted(set(rolemapping[role]['hosts'] + properties.get('hosts', [])))
 
-        _send_api_request(role, rolemapping[role])
+        if cache is None or not cache.skip_write('rolesmapping', role, rolemapping[role]):
+            _send_api_request(role, rolemapping[role])
         return
 
-    if action is "split":
+    if action == "split":
         # Remove the requested properties from existing properties in the role mapping.
 
         rolemapping[role]['users'] = [item for item in rolemapping[role]['users']
@@ -160,7 +221,8 @@ def modify_rolemapping(role, properties, action="replace"):
         rolemapping[role]['hosts'] = [item for item in rolemapping[role]['hosts']
                                       if item not in properties['hosts']]
 
-        _send_api_request(role, rolemapping[role])
+        if cache is None or not cache.skip_write('rolesmapping', role, rolemapping[role]):
+            _send_api_request(role, rolemapping[role])
         return
 
     # No merge or split action, overwrite existing properties:
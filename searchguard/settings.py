@@ -1,5 +1,18 @@
 import os
 
+
+def _seconds(name):
+    value = os.environ.get(name)
+    return float(value) if value else None
+
+
 HEADER = {'content-type': 'application/json'}
+# One or more (comma separated) node URLs
 SEARCHGUARD_API_URL = os.environ.get('SEARCHGUARD_API_URL', '')
 SEARCHGUARD_API_AUTH = (os.environ.get('SEARCHGUARD_API_USER', ''), os.environ.get('SEARCHGUARD_API_PASS', ''))
+SEARCHGUARD_TRANSPORT = os.environ.get('SEARCHGUARD_TRANSPORT', 'requests')
+SEARCHGUARD_CONNECT_TIMEOUT = _seconds('SEARCHGUARD_CONNECT_TIMEOUT')
+SEARCHGUARD_READ_TIMEOUT = _seconds('SEARCHGUARD_READ_TIMEOUT')
+SEARCHGUARD_LOAD_BALANCING = os.environ.get('SEARCHGUARD_LOAD_BALANCING', 'round_robin')
+SEARCHGUARD_BULK_CHUNK_SIZE = int(os.environ.get('SEARCHGUARD_BULK_CHUNK_SIZE', '500'))
+SEARCHGUARD_VERSION = os.environ.get('SEARCHGUARD_VERSION', '6')
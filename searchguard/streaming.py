@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+
+import codecs
+import json
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+
+class _Buffer(object):
+    """Text buffer that is refilled from an iterator of byte chunks"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self.text = ''
+        self.pos = 0
+        self.exhausted = False
+
+    def fill(self):
+        """Reads the next chunk, returns False when the input is exhausted"""
+        if self.exhausted:
+            return False
+        # Drop the consumed part so the buffer only holds the entry being parsed
+        self.text, self.pos = self.text[self.pos:], 0
+        for chunk in self._chunks:
+            if chunk:
+                self.text += self._decoder.decode(chunk)
+                return True
+        self.text += self._decoder.decode(b'', final=True)
+        self.exhausted = True
+        return False
+
+    def skip_whitespace(self):
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text) or not self.fill():
+                return
+
+    def expect(self, *chars):
+        self.skip_whitespace()
+        if self.pos >= len(self.text) or self.text[self.pos] not in chars:
+            raise ValueError('Invalid JSON object, expected {} at position {}'.format(' or '.join(chars), self.pos))
+        self.pos += 1
+        return self.text[self.pos - 1]
+
+    def decode_value(self):
+        self.skip_whitespace()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+                # A value ending at the end of the buffer (e.g. a number) might continue in the next chunk
+                if end < len(self.text) or self.exhausted:
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.exhausted:
+                    raise
+            self.fill()
+
+
+def iter_json_object(chunks):
+    """Incrementally parses a JSON object from an iterable of byte chunks and yields its (key, value) pairs
+    Only a single entry of the object is kept in memory at a time.
+
+    :param chunks: iterable of bytes, for example a streamed response body
+    :raises: ValueError
+    """
+    buffer = _Buffer(chunks)
+    buffer.expect('{')
+
+    buffer.skip_whitespace()
+    if buffer.text[buffer.pos:buffer.pos + 1] == '}':
+        return
+
+    while True:
+        key = buffer.decode_value()
+        buffer.expect(':')
+        yield key, buffer.decode_value()
+
+        if buffer.expect(',', '}') == '}':
+            return
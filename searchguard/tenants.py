@@ -0,0 +1,102 @@
+#!/usr/bin/python3
+
+import searchguard.transport as transport
+from searchguard.exceptions import DeleteUserException
+from searchguard.concurrency import run_bounded
+from searchguard.internalusers import list_users
+from searchguard.rolesmapping import PROPERTIES_KEYS, view_all_rolemappings, _send_api_request
+
+
+class TeardownReport(object):
+    """Result of teardown_tenant
+
+    :ivar list users: usernames that matched the prefix
+    :ivar dict rolemappings: role -> sorted list of matched users referenced by its mapping
+    :ivar list deleted: users that were deleted
+    :ivar list missing: users that were already gone when deleting them
+    :ivar list updated_rolemappings: roles whose mapping was rewritten without the matched users
+    :ivar dict failed_users: username -> error message for every user that could not be deleted
+    :ivar dict failed_rolemappings: role -> error message for every mapping that could not be rewritten
+    """
+
+    def __init__(self, prefix, dry_run):
+        self.prefix = prefix
+        self.dry_run = dry_run
+        self.users = []
+        self.rolemappings = {}
+        self.deleted = []
+        self.missing = []
+        self.updated_rolemappings = []
+        self.failed_users = {}
+        self.failed_rolemappings = {}
+
+    @property
+    def ok(self):
+        return not self.failed_users and not self.failed_rolemappings
+
+    def __repr__(self):
+        return '<TeardownReport prefix={} users={} deleted={} rolemappings={} failed={}{}>'.format(
+            self.prefix, len(self.users), len(self.deleted), len(self.updated_rolemappings),
+            len(self.failed_users) + len(self.failed_rolemappings),
+            ' dry-run' if self.dry_run else '')
+
+
+def _delete_user(username):
+    # The snapshot already tells the user exists, so skip the check request of delete_user
+    response = transport.send('delete', 'internalusers/{}'.format(username))
+    if response.status_code not in (200, 404):
+        raise DeleteUserException('Error deleting the user {} - msg: {}'.format(username, response.text))
+    return response.status_code == 200
+
+
+def teardown_tenant(prefix, dry_run=False, concurrency=8):
+    """Removes all users of a tenant (username prefix, underscore is used as delimiter) and strips them
+    from every role mapping. Works from a single snapshot of the users and role mappings: the users are
+    deleted concurrently without a check request each, and every affected role mapping is written once.
+    Failures do not stop the teardown, they are collected in the report.
+
+    :param str prefix: the tenant prefix, as used by list_users
+    :param bool dry_run: only report what would be deleted and rewritten
+    :param concurrency: number of parallel API calls, or an AdaptiveLimiter (see searchguard.limiter)
+    :returns TeardownReport:
+    :raises: ListUsersException, ViewAllRoleMappingException
+    """
+    report = TeardownReport(prefix, dry_run)
+    report.users = sorted(list_users(prefix=prefix))
+    users = set(report.users)
+
+    rolemappings = dict()
+    # Written back below, so never from a possibly stale replica
+    for role, properties in view_all_rolemappings(fresh=True).items():
+        matched = users.intersection(properties.get('users', []))
+        if matched:
+            report.rolemappings[role] = sorted(matched)
+            rolemappings[role] = {key: properties.get(key, []) for key in PROPERTIES_KEYS}
+            rolemappings[role]['users'] = [user for user in properties['users'] if user not in users]
+
+    if dry_run:
+        return report
+
+    def run(task):
+        kind, name = task
+        if kind == 'user':
+            return _delete_user(name)
+        return _send_api_request(name, rolemappings[name])
+
+    tasks = [('user', username) for username in report.users] + [('role', role) for role in sorted(rolemappings)]
+    for outcome in run_bounded(run, tasks, concurrency):
+        kind, name = outcome.item
+        if outcome.error is not None:
+            failed = report.failed_users if kind == 'user' else report.failed_rolemappings
+            failed[name] = str(outcome.error)
+        elif kind == 'role':
+            report.updated_rolemappings.append(name)
+        elif outcome.result:
+            report.deleted.append(name)
+        else:
+            report.missing.append(name)
+
+    report.deleted.sort()
+    report.missing.sort()
+    report.updated_rolemappings.sort()
+    return report
@@ -0,0 +1,379 @@
+#!/usr/bin/python3
+
+import json
+import time
+import requests
+import searchguard.settings as settings
+import searchguard.circuitbreaker as circuitbreaker
+import searchguard.profiler as profiler
+import searchguard.deadline as deadline
+import searchguard.nodes as nodes
+import searchguard.hedging as hedging
+import searchguard.limiter as limiter
+import searchguard.priority as priority
+from searchguard.exceptions import DeadlineExceededException, TransportException
+
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class Response(object):
+    """Minimal response object returned by the non-requests transports
+    It exposes the attributes the library relies on: status_code, text, headers and for streamed
+    responses iter_content and close.
+    """
+
+    def __init__(self, status_code, content=None, headers=None, chunks=None, close=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self._content = content
+        self._chunks = chunks
+        self._close = close
+
+    @property
+    def content(self):
+        if self._content is None:
+            self._content = b''.join(self.iter_content())
+        return self._content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def iter_content(self, chunk_size=None):
+        """Yields the body in chunks, without loading it completely when the response is streamed"""
+        if self._content is not None or self._chunks is None:
+            yield self.content
+            return
+
+        chunks, self._chunks = self._chunks, None
+        for chunk in chunks:
+            yield chunk
+        self.close()
+
+    def close(self):
+        if self._close is not None:
+            self._close()
+
+
+class RequestsConnectionError(TransportException, requests.ConnectionError):
+    """TransportException of the requests backend, still caught by except requests.ConnectionError"""
+
+
+class RequestsTimeout(TransportException, requests.Timeout):
+    """TransportException of the requests backend, still caught by except requests.Timeout"""
+
+
+class RequestsConnectTimeout(TransportException, requests.ConnectTimeout):
+    """TransportException of the requests backend, caught by requests.ConnectionError and requests.Timeout"""
+
+
+def _failed(method, url, error, exception=TransportException):
+    """Private function returning the TransportException for a connection or timeout error of a backend"""
+    return exception('{} {} failed: {}: {}'.format(method.upper(), url, type(error).__name__, error))
+
+
+def _requests_exception(error):
+    """Private function returning the TransportException subclass matching an error of requests"""
+    if isinstance(error, requests.ConnectTimeout):
+        return RequestsConnectTimeout
+    if isinstance(error, requests.Timeout):
+        return RequestsTimeout
+    return RequestsConnectionError
+
+
+class Transport(object):
+    """Base class for the HTTP backends used by the internalusers, roles and rolesmapping modules"""
+
+    def request(self, method, url, data=None, headers=None, auth=None, stream=False, timeout=None):
+        """Performs a single HTTP request and returns an object with status_code and text attributes
+        Connection errors and timeouts of the backend are raised as TransportException. The requests
+        backend raises subclasses that are also requests.ConnectionError or requests.Timeout, so code
+        written against requests keeps working.
+
+        :param str method: lowercase HTTP method (get, put, patch, delete)
+        :param str url: absolute URL of the API resource
+        :param str data: request body
+        :param dict headers: request headers
+        :param tuple auth: (username, password) used for basic authentication
+        :param bool stream: do not read the body upfront, it is read with iter_content(chunk_size)
+        :param tuple timeout: (connect, read) timeouts in seconds, None for either means no timeout
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Releases the pooled connections of the transport"""
+        pass
+
+
+class RequestsTransport(Transport):
+    """Default transport, calls the module level functions of requests (no connection reuse)"""
+
+    def request(self, method, url, data=None, headers=None, auth=None, stream=False, timeout=None):
+        kwargs = dict(auth=auth)
+        if data is not None:
+            kwargs['data'] = data
+        if headers is not None:
+            kwargs['headers'] = headers
+        if stream:
+            kwargs['stream'] = True
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+
+        try:
+            return getattr(requests, method)(url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise _failed(method, url, e, _requests_exception(e)) from e
+
+
+class Urllib3Transport(Transport):
+    """Transport on top of a pooled urllib3 PoolManager, keeps connections alive between calls
+
+    :param int maxsize: number of connections kept per host
+    :param dict pool_kwargs: extra keyword arguments for urllib3.PoolManager (ca_certs, cert_reqs, etc)
+    """
+
+    def __init__(self, maxsize=10, **pool_kwargs):
+        import urllib3
+
+        self._urllib3 = urllib3
+        pool_kwargs.setdefault('retries', False)
+        self.pool = urllib3.PoolManager(maxsize=maxsize, block=False, **pool_kwargs)
+
+    def request(self, method, url, data=None, headers=None, auth=None, stream=False, timeout=None):
+        request_headers = dict(headers or {})
+        if auth:
+            request_headers.update(self._urllib3.make_headers(basic_auth='{}:{}'.format(*auth)))
+
+        kwargs = dict()
+        if timeout is not None:
+            kwargs['timeout'] = self._urllib3.Timeout(connect=timeout[0], read=timeout[1])
+
+        exceptions = self._urllib3.exceptions
+        try:
+            response = self.pool.request(method.upper(), url, body=data, headers=request_headers, redirect=False,
+                                         preload_content=not stream, **kwargs)
+        except (exceptions.MaxRetryError, exceptions.NewConnectionError, exceptions.TimeoutError,
+                exceptions.ProtocolError) as e:
+            raise _failed(method, url, e) from e
+        if stream:
+            return Response(response.status, headers=response.headers, chunks=response.stream(STREAM_CHUNK_SIZE),
+                            close=response.release_conn)
+        return Response(response.status, response.data, response.headers)
+
+    def close(self):
+        self.pool.clear()
+
+
+class HttpxTransport(Transport):
+    """Transport on top of an httpx client with HTTP/2 enabled
+    Concurrent requests from multiple threads share one multiplexed connection per node.
+    Requires the optional httpx[http2] dependency.
+
+    :param bool http2: negotiate HTTP/2 (falls back to HTTP/1.1 when the server does not support it)
+    :param dict client_kwargs: extra keyword arguments for httpx.Client (verify, limits, etc)
+    """
+
+    def __init__(self, http2=True, **client_kwargs):
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError('The httpx transport requires httpx, install it with: pip install searchguard[http2]')
+
+        client_kwargs.setdefault('timeout', None)
+        self._httpx = httpx
+        self.client = httpx.Client(http2=http2, **client_kwargs)
+
+    def request(self, method, url, data=None, headers=None, auth=None, stream=False, timeout=None):
+        kwargs = dict()
+        if timeout is not None:
+            kwargs['timeout'] = self._httpx.Timeout(None, connect=timeout[0], read=timeout[1])
+
+        request = self.client.build_request(method.upper(), url, content=data, headers=headers, **kwargs)
+        httpx = self._httpx
+        try:
+            response = self.client.send(request, auth=auth, stream=stream)
+        except (httpx.NetworkError, httpx.TimeoutException, httpx.RemoteProtocolError) as e:
+            raise _failed(method, url, e) from e
+        if stream:
+            return Response(response.status_code, headers=response.headers,
+                            chunks=response.iter_bytes(STREAM_CHUNK_SIZE), close=response.close)
+        return response
+
+    def close(self):
+        self.client.close()
+
+
+TRANSPORTS = {
+    'requests': RequestsTransport,
+    'urllib3': Urllib3Transport,
+    'httpx': HttpxTransport,
+}
+
+_transport = None
+
+
+def get_transport():
+    """Returns the active transport, creating the one configured in SEARCHGUARD_TRANSPORT on first use"""
+    global _transport
+
+    if _transport is None:
+        set_transport(settings.SEARCHGUARD_TRANSPORT)
+    return _transport
+
+
+def set_transport(transport):
+    """Replaces the active transport. Accepts a Transport instance or one of the names in TRANSPORTS
+
+    :param transport: Transport instance or name (requests, urllib3 or httpx)
+    :raises: ValueError
+    """
+    global _transport
+
+    if not isinstance(transport, Transport):
+        if transport not in TRANSPORTS:
+            raise ValueError('Unknown transport {}, choose one of: {}'.format(transport, ', '.join(sorted(TRANSPORTS))))
+        transport = TRANSPORTS[transport]()
+
+    previous, _transport = _transport, transport
+    if previous is not None and previous is not transport:
+        previous.close()
+
+
+def _timeout():
+    """Private function returning the (connect, read) timeouts, capped to the remaining deadline budget"""
+    connect, read = settings.SEARCHGUARD_CONNECT_TIMEOUT, settings.SEARCHGUARD_READ_TIMEOUT
+    remaining = deadline.remaining()
+    if remaining is not None:
+        connect = remaining if connect is None else min(connect, remaining)
+        read = remaining if read is None else min(read, remaining)
+
+    if connect is None and read is None:
+        return None
+    return connect, read
+
+
+def _request(method, url, data, headers, stream, timeout):
+    """Private function performing the request with the active transport, profiled when a profile is active"""
+    try:
+        if profiler.active() is None:
+            return get_transport().request(method, url, data=data, headers=headers,
+                                           auth=settings.SEARCHGUARD_API_AUTH, stream=stream, timeout=timeout)
+        return profiler.measure_request(get_transport().request, method, url, data=data, headers=headers,
+                                        auth=settings.SEARCHGUARD_API_AUTH, stream=stream, timeout=timeout)
+    except Exception:
+        active = deadline.current()
+        if active is not None and active.expired():
+            # The request timed out (or failed) because the budget ran out
+            raise DeadlineExceededException('Deadline exceeded during {} {}'.format(method.upper(), url))
+        raise
+
+
+def _send_to_node(pool, node, method, path, data, headers, stream):
+    """Private function sending a request to one node, in a slot of the priority dispatcher when enabled"""
+    dispatcher = priority.get_dispatcher()
+    if dispatcher is None:
+        return _send_to_node_now(pool, node, method, path, data, headers, stream)
+    with dispatcher.slot():
+        return _send_to_node_now(pool, node, method, path, data, headers, stream)
+
+
+def _send_to_node_now(pool, node, method, path, data, headers, stream):
+    """Private function sending a request to one node, tracking its health and circuit"""
+    url = '{}/{}'.format(node.url, path)
+    # An exhausted budget fails here, before the node or its circuit is involved
+    timeout = _timeout()
+
+    breaker = circuitbreaker.get_breaker(node.url)
+    if breaker is not None:
+        breaker.before_request()
+
+    pool.acquire(node)
+    started = time.time()
+    try:
+        response = _request(method, url, data, headers, stream, timeout)
+    except DeadlineExceededException:
+        # The caller ran out of time, which says nothing about the health of the node
+        pool.release(node, None)
+        if breaker is not None:
+            breaker.cancel_request()
+        raise
+    except Exception:
+        pool.release(node, False)
+        limiter.observe(method, None, started)
+        if breaker is not None:
+            breaker.record_failure()
+        raise
+
+    limiter.observe(method, response.status_code, started)
+    success = response.status_code < 500
+    pool.release(node, success)
+    if breaker is not None:
+        if success:
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+    return response
+
+
+def _send_with_failover(pool, method, path, data, headers, stream, tried):
+    """Private function sending a request to the next node not in tried, retrying GETs on the other nodes"""
+    while True:
+        node = pool.select(exclude=tried)
+        tried.append(node)
+        can_fail_over = method == 'get' and len(tried) < len(pool.nodes)
+
+        try:
+            response = _send_to_node(pool, node, method, path, data, headers, stream)
+        except DeadlineExceededException:
+            raise
+        except Exception:
+            if can_fail_over:
+                continue
+            raise
+
+        if response.status_code >= 500 and can_fail_over:
+            response.close()
+            continue
+        return response
+
+
+def send(method, path, data=None, headers=None, stream=False, hedge=False, node=None):
+    """Sends a request for an API path through the active transport to one of the configured nodes
+    SEARCHGUARD_API_URL can hold several comma separated node URLs, requests are spread over them (see
+    searchguard.nodes). A GET that fails with a connection error, an open circuit or a 5xx response is
+    transparently retried on the next node. Idempotent reads sent with hedge=True are duplicated to a
+    second node when they are slow and hedging is enabled (see searchguard.hedging).
+    The request uses the configured connect and read timeouts, capped to the remaining budget of the
+    current deadline (see searchguard.deadline).
+    When circuit breaking is enabled, connection errors and 5xx responses count as failures and requests
+    fail fast with CircuitOpenException while the circuit of the node is open.
+    When priority scheduling is enabled, the request waits for a slot of its priority class (see
+    searchguard.priority).
+    With node set the request is sent to that node only, without failover or hedging.
+
+    :param str method: lowercase HTTP method (get, put, patch, delete)
+    :param str path: API path, for example internalusers/username
+    :param str data: request body
+    :param dict headers: request headers
+    :param bool stream: return without reading the body, see Transport.request
+    :param bool hedge: the request is an idempotent read that may be hedged
+    :param str node: URL of the node to send the request to (one of SEARCHGUARD_API_URL)
+    :raises: CircuitOpenException, DeadlineExceededException, TransportException
+    """
+    pool = nodes.get_pool()
+    if node is not None:
+        target = next((candidate for candidate in pool.nodes if candidate.url == node), None) or nodes.Node(node)
+        return _send_to_node(pool, target, method, path, data, headers, stream)
+
+    policy = hedging.get_policy()
+    if hedge and policy is not None and len(pool.nodes) > 1:
+        return policy.run(lambda tried: _send_with_failover(pool, method, path, data, headers, stream, tried))
+    return _send_with_failover(pool, method, path, data, headers, stream, [])
+
+
+def parse_json(response):
+    """Returns the decoded JSON body of a response, timed as the parse phase when a profile is active"""
+    if profiler.active() is None:
+        return json.loads(response.text)
+    return profiler.measure_parse(json.loads, response.text)
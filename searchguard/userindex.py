@@ -0,0 +1,146 @@
+#!/usr/bin/python3
+
+from bisect import bisect_right
+from searchguard.internalusers import list_users
+
+
+def prefix_of(username):
+    """Returns the prefix of a username, with the underscore delimiter semantics of list_users"""
+    return username.split('_')[0]
+
+
+class UserIndex(object):
+    """In-memory index over the internal users, grouping them by prefix and answering substring searches
+    Built from a single list_users() download, so per-prefix counts and listings for every customer don't
+    need a download each. Filtering follows list_users: the prefix is the part before the first underscore.
+
+    :param dict users: users as returned by list_users
+    """
+
+    def __init__(self, users):
+        self.users = dict()
+        self.groups = dict()
+        self._search_table = None
+        for username, properties in users.items():
+            self.add(username, properties)
+
+    @classmethod
+    def fetch(cls):
+        """Builds the index from the current users in Search Guard
+
+        :raises: ListUsersException
+        """
+        return cls(list_users())
+
+    def add(self, username, properties):
+        """Adds or updates a user in the index"""
+        if username not in self.users:
+            self.groups.setdefault(prefix_of(username), dict())[username] = properties
+            self._search_table = None
+        else:
+            self.groups[prefix_of(username)][username] = properties
+        self.users[username] = properties
+
+    def remove(self, username):
+        """Removes a user from the index, unknown users are ignored"""
+        if username not in self.users:
+            return
+
+        del self.users[username]
+        prefix = prefix_of(username)
+        group = self.groups[prefix]
+        del group[username]
+        if not group:
+            del self.groups[prefix]
+        self._search_table = None
+
+    def refresh(self, users=None):
+        """Brings the index up to date with a new user list, only touching the users that changed
+
+        :param dict users: users as returned by list_users (default: fetch them)
+        :returns: tuple of sorted lists (added, removed, changed)
+        :raises: ListUsersException
+        """
+        if users is None:
+            users = list_users()
+
+        removed = sorted(set(self.users) - set(users))
+        added, changed = [], []
+        for username, properties in users.items():
+            known = self.users.get(username)
+            if username not in self.users:
+                added.append(username)
+            elif known != properties:
+                changed.append(username)
+            else:
+                continue
+            self.add(username, properties)
+        for username in removed:
+            self.remove(username)
+        return sorted(added), removed, sorted(changed)
+
+    def group_by_prefix(self):
+        """Returns a dict of prefix -> {username: properties}"""
+        return {prefix: dict(group) for prefix, group in self.groups.items()}
+
+    def count_by_prefix(self):
+        """Returns a dict of prefix -> number of users"""
+        return {prefix: len(group) for prefix, group in self.groups.items()}
+
+    def users_for_prefixes(self, prefixes, search=None):
+        """Returns the users of several prefixes at once, optionally only those containing search
+
+        :param list prefixes: prefixes to return the users of
+        :param str search: return only users that contain this search string
+        :returns: dict of prefix -> {username: properties}, with an empty dict for unknown prefixes
+        """
+        matched = self.search(search) if search else None
+        result = dict()
+        for prefix in prefixes:
+            group = self.groups.get(prefix, {})
+            result[prefix] = {k: v for k, v in group.items() if matched is None or k in matched}
+        return result
+
+    def search(self, text):
+        """Returns the set of usernames that contain text"""
+        if '\n' in text or not self.users:
+            return set()
+
+        # Without newlines in text every match lies within a single username
+        names, offsets, joined = self._get_search_table()
+        found = set()
+        position = joined.find(text)
+        while position >= 0:
+            index = bisect_right(offsets, position) - 1
+            found.add(names[index])
+            if index + 1 == len(names):
+                break
+            # Continue with the next username, a username is only reported once
+            position = joined.find(text, offsets[index + 1])
+        return found
+
+    def list_users(self, prefix=None, search=None):
+        """Returns the users that match the filter criteria, like searchguard.internalusers.list_users
+
+        :param str prefix: return only users that match this prefix (underscore is used as delimiter)
+        :param str search: return only users that contain this search string
+        """
+        users = self.groups.get(prefix, {}) if prefix else self.users
+        if search:
+            matched = self.search(search)
+            return {k: v for k, v in users.items() if k in matched}
+        return dict(users)
+
+    def _get_search_table(self):
+        """Private function returning the sorted usernames, their offsets and the newline-joined usernames
+        A single str.find over the joined names is much faster than testing every username in Python.
+        """
+        if self._search_table is None:
+            names = sorted(self.users)
+            offsets = []
+            position = 0
+            for name in names:
+                offsets.append(position)
+                position += len(name) + 1
+            self._search_table = (names, offsets, '\n'.join(names))
+        return self._search_table
@@ -0,0 +1,248 @@
+#!/usr/bin/python3
+
+import searchguard.settings as settings
+from searchguard.exceptions import ValidationException
+
+
+_STRING_TYPES = (type(''), type(u''))
+
+
+def _string(value, path, errors):
+    if type(value) not in _STRING_TYPES:
+        errors.append('{}: expected a string'.format(path))
+
+
+def _boolean(value, path, errors):
+    if type(value) is not bool:
+        errors.append('{}: expected a boolean'.format(path))
+
+
+def _string_list(value, path, errors):
+    if type(value) is not list:
+        errors.append('{}: expected a list of strings'.format(path))
+        return
+    for string in value:
+        if type(string) not in _STRING_TYPES:
+            errors.append('{}: expected a list of strings, got {!r}'.format(path, string))
+            return
+
+
+def _one_of(*values):
+    def check(value, path, errors):
+        if value not in values:
+            errors.append('{}: expected one of {}'.format(path, ', '.join(values)))
+    return check
+
+
+def _dict_of(check_value):
+    """Returns a checker for a dict with string keys and values checked by check_value"""
+    def check(value, path, errors):
+        if type(value) is not dict:
+            errors.append('{}: expected an object'.format(path))
+            return
+        for key, item in value.items():
+            check_value(item, '{}.{}'.format(path, key), errors)
+    return check
+
+
+def _list_of(check_item):
+    def check(value, path, errors):
+        if type(value) is not list:
+            errors.append('{}: expected a list'.format(path))
+            return
+        for index, item in enumerate(value):
+            check_item(item, '{}[{}]'.format(path, index), errors)
+    return check
+
+
+def _object(fields, required=(), required_any=()):
+    """Compiles a checker for an object with the given fields (name -> checker)
+    Unknown fields are found with a single set difference, the field checkers only run for present fields.
+
+    :param dict fields: field name -> checker(value, path, errors)
+    :param tuple required: fields that have to be present
+    :param tuple required_any: at least one of these fields has to be present
+    """
+    known = frozenset(fields)
+    checkers = tuple(fields.items())
+    required = tuple(required)
+    required_any = tuple(required_any)
+
+    def check(value, path, errors):
+        if type(value) is not dict:
+            errors.append('{}: expected an object'.format(path or 'body'))
+            return
+        unknown = value.keys() - known
+        if unknown:
+            errors.append('{}: unknown fields {}'.format(path or 'body', ', '.join(sorted(unknown))))
+        for name in required:
+            if name not in value:
+                errors.append('{}: missing field {}'.format(path or 'body', name))
+        if required_any and not any(name in value for name in required_any):
+            errors.append('{}: include at least one of {}'.format(path or 'body', ', '.join(required_any)))
+        for name, checker in checkers:
+            if name in value:
+                checker(value[name], '{}.{}'.format(path, name) if path else name, errors)
+    return check
+
+
+# Read-only metadata Search Guard returns with every resource, accepted so read bodies can be written back
+_METADATA = {'readonly': _boolean, 'reserved': _boolean, 'hidden': _boolean, 'static': _boolean}
+
+
+def _with_metadata(fields):
+    fields = dict(fields)
+    fields.update(_METADATA)
+    return fields
+
+
+# Index permissions of Search Guard 6: index pattern -> document type -> permissions, plus DLS/FLS keys
+_SG6_INDEX_PERMISSIONS = {'_dls_': _string, '_fls_': _string_list, '_masked_fields_': _string_list}
+
+
+def _sg6_index(value, path, errors):
+    if type(value) is not dict:
+        errors.append('{}: expected an object'.format(path))
+        return
+    for key, item in value.items():
+        _SG6_INDEX_PERMISSIONS.get(key, _string_list)(item, '{}.{}'.format(path, key), errors)
+
+
+SCHEMAS = {
+    '6': {
+        'internalusers': _object(_with_metadata({
+            'hash': _string,
+            'password': _string,
+            'roles': _string_list,
+            'attributes': _dict_of(_string),
+        })),
+        'roles': _object(_with_metadata({
+            'cluster': _string_list,
+            'indices': _dict_of(_sg6_index),
+            'tenants': _dict_of(_one_of('RW', 'RO')),
+        })),
+        'rolesmapping': _object(_with_metadata({
+            'users': _string_list,
+            'backendroles': _string_list,
+            'hosts': _string_list,
+        }), required_any=('users', 'backendroles', 'hosts')),
+    },
+    '7': {
+        'internalusers': _object(_with_metadata({
+            'hash': _string,
+            'password': _string,
+            'backend_roles': _string_list,
+            'search_guard_roles': _string_list,
+            'attributes': _dict_of(_string),
+            'description': _string,
+        })),
+        'roles': _object(_with_metadata({
+            'cluster_permissions': _string_list,
+            'exclude_cluster_permissions': _string_list,
+            'index_permissions': _list_of(_object({
+                'index_patterns': _string_list,
+                'allowed_actions': _string_list,
+                'fls': _string_list,
+                'masked_fields': _string_list,
+                'dls': _string,
+            }, required=('index_patterns',))),
+            'exclude_index_permissions': _list_of(_object({
+                'index_patterns': _string_list,
+                'actions': _string_list,
+            }, required=('index_patterns',))),
+            'tenant_permissions': _list_of(_object({
+                'tenant_patterns': _string_list,
+                'allowed_actions': _string_list,
+            }, required=('tenant_patterns',))),
+            'description': _string,
+        })),
+        'rolesmapping': _object(_with_metadata({
+            'users': _string_list,
+            'backend_roles': _string_list,
+            'and_backend_roles': _string_list,
+            'hosts': _string_list,
+            'description': _string,
+        }), required_any=('users', 'backend_roles', 'and_backend_roles', 'hosts')),
+    },
+}
+
+
+class Validator(object):
+    """Validates request bodies against the compiled schemas of a Search Guard major version
+
+    :param str version: Search Guard major version, 6 or 7 (default SEARCHGUARD_VERSION)
+    """
+
+    def __init__(self, version=None):
+        version = str(version or settings.SEARCHGUARD_VERSION).split('.')[0]
+        if version not in SCHEMAS:
+            raise ValueError('No schemas for Search Guard version {}'.format(version))
+        self.version = version
+        self._schemas = SCHEMAS[version]
+
+    def errors(self, resource, body):
+        """Returns the list of errors of a body, empty when it is valid
+
+        :param str resource: internalusers, roles or rolesmapping
+        :param dict body: the request body
+        """
+        errors = []
+        self._schemas[resource](body, '', errors)
+        return errors
+
+    def validate(self, resource, name, body):
+        """Raises ValidationException with all errors when the body is invalid"""
+        errors = self.errors(resource, body)
+        if errors:
+            raise ValidationException('Invalid {} {}: {}'.format(resource, name, '; '.join(errors)),
+                                      {name: errors})
+
+    def validate_batch(self, resource, bodies):
+        """Validates many bodies at once and returns name -> errors for the invalid ones
+
+        :param dict bodies: name -> body
+        """
+        check = self._schemas[resource]
+        invalid = {}
+        for name, body in bodies.items():
+            errors = []
+            check(body, '', errors)
+            if errors:
+                invalid[name] = errors
+        return invalid
+
+
+_validator = None
+
+
+def enable(version=None):
+    """Enables validation of the bodies passed to the create and modify functions before any request
+    is sent, and returns the Validator
+
+    :param str version: Search Guard major version, 6 or 7 (default SEARCHGUARD_VERSION)
+    """
+    global _validator
+
+    _validator = Validator(version)
+    return _validator
+
+
+def disable():
+    global _validator
+
+    _validator = None
+
+
+def get_validator():
+    """Returns the active Validator, or None when validation is disabled"""
+    return _validator
+
+
+def check(resource, name, body):
+    """Validates body when validation is enabled
+
+    :raises: ValidationException
+    """
+    validator = _validator
+    if validator is not None:
+        validator.validate(resource, name, body)
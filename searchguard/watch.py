@@ -0,0 +1,254 @@
+#!/usr/bin/python3
+
+import asyncio
+import hashlib
+import queue
+import threading
+import time
+import weakref
+from collections import namedtuple
+import searchguard.priority as priority
+import searchguard.transport as transport
+from searchguard.exceptions import ListUsersException, ListRolesException, ViewAllRoleMappingException
+from searchguard.fingerprints import fingerprint
+
+
+RESOURCES = ('internalusers', 'roles', 'rolesmapping')
+EXCEPTIONS = {'roles': ListRolesException, 'rolesmapping': ViewAllRoleMappingException,
+              'internalusers': ListUsersException}
+
+ADDED = 'added'
+REMOVED = 'removed'
+CHANGED = 'changed'
+
+ChangeEvent = namedtuple('ChangeEvent', ['resource', 'kind', 'name', 'body', 'previous'])
+ChangeEvent.__doc__ = """A change of one entry: body is None for removed entries, previous is None for added ones"""
+# Seconds the polling thread waits for room in the queue of an iterator between checks whether it was stopped
+WAIT_INTERVAL = 0.1
+# Queued after the last event when the watcher stops
+_STOP = object()
+
+
+def diff(resource, previous, current):
+    """Returns the ChangeEvents between two states of a resource
+
+    :param str resource: internalusers, roles or rolesmapping
+    :param dict previous: name -> (fingerprint, body) of the earlier state
+    :param dict current: name -> (fingerprint, body) of the new state
+    """
+    events = []
+    for name in sorted(set(previous) | set(current)):
+        if name not in previous:
+            events.append(ChangeEvent(resource, ADDED, name, current[name][1], None))
+        elif name not in current:
+            events.append(ChangeEvent(resource, REMOVED, name, None, previous[name][1]))
+        elif previous[name][0] != current[name][0]:
+            events.append(ChangeEvent(resource, CHANGED, name, current[name][1], previous[name][1]))
+    return events
+
+
+class _Consumer(object):
+    """Private class holding the events queued for one iterator, at most max_queue of them
+    Events for an async iterator are handed to its event loop, which owns the asyncio.Queue.
+    """
+
+    def __init__(self, max_queue, loop=None):
+        self.slots = threading.Semaphore(max_queue)
+        self.loop = loop
+        self.queue = queue.Queue() if loop is None else asyncio.Queue()
+
+    def put(self, item):
+        """Queues an item, returns False when the event loop of the iterator is closed"""
+        if self.loop is None:
+            self.queue.put(item)
+            return True
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, item)
+        except RuntimeError:
+            return False
+        return True
+
+
+class _Iterator(object):
+    """Private class iterating the events of a Watcher, it stops receiving them once it is garbage collected"""
+
+    def __init__(self, watcher, consumer):
+        self._consumer = consumer
+        weakref.finalize(self, watcher._unregister, consumer)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        event = self._consumer.queue.get()
+        if event is _STOP:
+            self._consumer.queue.put(_STOP)
+            raise StopIteration
+        self._consumer.slots.release()
+        return event
+
+
+class _AsyncIterator(_Iterator):
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        # A cancelled get leaves the event in the queue for the next call
+        event = await self._consumer.queue.get()
+        if event is _STOP:
+            self._consumer.queue.put_nowait(_STOP)
+            raise StopAsyncIteration
+        self._consumer.slots.release()
+        return event
+
+
+class Watcher(object):
+    """Polls the bulk endpoints of users, roles and role mappings and emits an event per added, removed or
+    changed entry (compared like searchguard.fingerprints does). A response whose body hash did not change
+    since the last poll is not parsed. The first poll only records the current state.
+    Events are delivered to the subscribed callbacks in the polling thread and to every live iterator
+    (for event in watcher, or async for in an asyncio loop) through a bounded queue per iterator. When an
+    iterator falls behind and its queue is full, polling waits for it; an iterator that is no longer
+    referenced stops receiving events and holds nothing back. Iterating starts the watcher.
+
+    :param tuple resources: resources to watch
+    :param interval: seconds between polls, or a dict resource -> seconds
+    :param int max_queue: number of events buffered per iterator
+    :param on_error: optional callback(resource, exception), for failed polls and failing callbacks
+    """
+
+    def __init__(self, resources=RESOURCES, interval=10, max_queue=1000, on_error=None):
+        self.resources = tuple(resources)
+        self.intervals = {resource: interval.get(resource, 10) if isinstance(interval, dict) else interval
+                          for resource in self.resources}
+        self.on_error = on_error
+        self.max_queue = max_queue
+        self.polls = 0
+        self.parsed = 0
+        self.errors = 0
+
+        self._callbacks = []
+        self._consumers = []
+        self._consumers_lock = threading.Lock()
+        self._states = dict()
+        self._hashes = dict()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def subscribe(self, callback):
+        """Registers callback(event), called for every event in the polling thread"""
+        self._callbacks.append(callback)
+        return callback
+
+    def poll(self, resource):
+        """Polls one resource now and returns its events
+
+        :raises: ListUsersException, ListRolesException, ViewAllRoleMappingException
+        """
+        response = transport.send('get', '{}/'.format(resource), hedge=True)
+        if response.status_code != 200:
+            raise EXCEPTIONS[resource]('Error polling {}. status: {} - body: {}'.format(
+                resource, response.status_code, response.text))
+
+        self.polls += 1
+        text = response.text
+        digest = hashlib.sha1(text.encode('utf-8')).digest()
+        if self._hashes.get(resource) == digest:
+            return []
+
+        self.parsed += 1
+        state = {name: (fingerprint(resource, body), body) for name, body in transport.parse_json(response).items()}
+        previous, self._states[resource] = self._states.get(resource), state
+        self._hashes[resource] = digest
+        if previous is None:
+            return []
+        return diff(resource, previous, state)
+
+    def start(self):
+        """Takes the initial state of every resource and starts polling in a background thread"""
+        if self._thread is not None:
+            return self
+        self._stopping.clear()
+        for resource in self.resources:
+            self._poll_and_emit(resource)
+        self._thread = threading.Thread(target=self._run, name='searchguard-watch')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops polling, iterators end once they consumed the events that were already queued"""
+        self._stopping.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+        with self._consumers_lock:
+            consumers, self._consumers = self._consumers, []
+        for consumer in consumers:
+            consumer.put(_STOP)
+
+    def __iter__(self):
+        return self._iterate(_Iterator, None)
+
+    def __aiter__(self):
+        return self._iterate(_AsyncIterator, asyncio.get_event_loop())
+
+    def _iterate(self, iterator_class, loop):
+        """Private function registering a new iterator, which only receives the events emitted from now on"""
+        consumer = _Consumer(self.max_queue, loop)
+        iterator = iterator_class(self, consumer)
+        if self._stopping.is_set():
+            consumer.put(_STOP)
+            return iterator
+
+        with self._consumers_lock:
+            self._consumers.append(consumer)
+        self.start()
+        return iterator
+
+    def _unregister(self, consumer):
+        with self._consumers_lock:
+            if consumer in self._consumers:
+                self._consumers.remove(consumer)
+
+    def _put(self, consumer, event):
+        """Private function queueing an event for an iterator, waiting while its queue is full"""
+        while not self._stopping.is_set() and consumer in self._consumers:
+            if consumer.slots.acquire(timeout=WAIT_INTERVAL):
+                if not consumer.put(event):
+                    self._unregister(consumer)
+                return
+
+    def _emit(self, resource, event):
+        for callback in self._callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                self._error(resource, e)
+        for consumer in list(self._consumers):
+            self._put(consumer, event)
+
+    def _error(self, resource, error):
+        self.errors += 1
+        if self.on_error is not None:
+            self.on_error(resource, error)
+
+    def _poll_and_emit(self, resource):
+        try:
+            events = self.poll(resource)
+        except Exception as e:
+            self._error(resource, e)
+            return
+        for event in events:
+            self._emit(resource, event)
+
+    def _run(self):
+        due = {resource: time.time() + self.intervals[resource] for resource in self.resources}
+        with priority.priority(priority.BATCH):
+            while not self._stopping.wait(max(0, min(due.values()) - time.time())):
+                for resource in self.resources:
+                    if due[resource] <= time.time():
+                        self._poll_and_emit(resource)
+                        due[resource] = time.time() + self.intervals[resource]
@@ -0,0 +1,339 @@
+#!/usr/bin/python3
+
+import json
+import sqlite3
+import threading
+import time
+import searchguard.internalusers as internalusers
+import searchguard.rolesmapping as rolesmapping
+import searchguard.priority as priority
+from searchguard.exceptions import WriteBehindException, UserAlreadyExistsException, NotFoundException, \
+    ValidationException
+
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def _modify_rolemapping(name, payload):
+    rolesmapping.modify_rolemapping(name, payload['properties'], payload['action'])
+
+
+# Errors a retry cannot fix, the write is marked as failed at once
+PERMANENT_ERRORS = (UserAlreadyExistsException, NotFoundException, ValidationException, ValueError)
+
+
+def retryable(error):
+    """Returns whether a failed write may succeed when it is sent again: connection errors, timeouts,
+    overload (429, 5xx) and other errors of the API are retried, a create of an existing entity, a write
+    to an entity or role that does not exist (NotFoundException) and invalid properties are not.
+    """
+    return not isinstance(error, PERMANENT_ERRORS)
+
+
+# (resource, operation) -> function(name, payload) performing the write
+OPERATIONS = {
+    ('rolesmapping', 'create'): lambda name, payload: rolesmapping.create_rolemapping(name, payload),
+    ('rolesmapping', 'modify'): _modify_rolemapping,
+    ('rolesmapping', 'delete'): lambda name, payload: rolesmapping.delete_rolemapping(name),
+    ('internalusers', 'create'): lambda name, payload: internalusers.create_user(name, properties=payload),
+    ('internalusers', 'modify'): lambda name, payload: internalusers.modify_user(name, payload),
+    ('internalusers', 'delete'): lambda name, payload: internalusers.delete_user(name),
+}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS intents (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    resource TEXT NOT NULL,
+    name TEXT NOT NULL,
+    operation TEXT NOT NULL,
+    payload TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    superseded_by INTEGER,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS intents_status ON intents (status, id);
+CREATE INDEX IF NOT EXISTS intents_resource ON intents (resource, name, status);
+'''
+
+
+def coalesce(resource, earlier, later):
+    """Returns the payload of a single write with the effect of the pending write earlier followed by later,
+    or None when they cannot be combined. Both are (operation, payload) tuples.
+    A full replacement supersedes an earlier modification, merges and splits of the same role mapping
+    combine into one merge or split of the union of their properties.
+    """
+    (operation, payload), (later_operation, later_payload) = earlier, later
+    if operation != 'modify' or later_operation != 'modify':
+        return None
+    if resource == 'internalusers' or later_payload['action'] == 'replace':
+        return later_payload
+    if payload['action'] != later_payload['action']:
+        return None
+
+    properties = {}
+    for key in set(payload['properties']) | set(later_payload['properties']):
+        properties[key] = sorted(set(payload['properties'].get(key, [])) | set(later_payload['properties'].get(key, [])))
+    return {'properties': properties, 'action': payload['action']}
+
+
+class WriteQueue(object):
+    """Durable write-behind queue: write intents are stored in a local SQLite database (in WAL mode) and
+    return immediately, a background worker sends them to Search Guard.
+    Pending writes to the same resource are coalesced into one write. Writes to the same resource are
+    sent in the order they were queued; a failed write is retried with exponential backoff and blocks
+    the later writes to that resource until it succeeds or is given up after max_attempts. Writes that
+    cannot succeed on a retry (see retryable) are marked as failed after the first attempt.
+    Intents that were running when the process stopped are picked up again on start, so run a single
+    worker per database.
+
+    :param str path: path of the SQLite database
+    :param float retry_delay: seconds before the first retry, doubled on every next attempt
+    :param int max_attempts: attempts after which a write is marked as failed (None retries forever)
+    :param float poll_interval: seconds between checks for intents queued by other processes
+    """
+
+    def __init__(self, path, retry_delay=1.0, max_attempts=10, poll_interval=0.5):
+        self.path = path
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._changed = threading.Condition()
+        self._stopping = False
+        self._worker = None
+        # Highest intent id whose failure was already reported by wait() without ids
+        self._reported = 0
+
+    def start(self):
+        """Starts the background worker, resuming intents interrupted by a previous stop or crash"""
+        with self._lock:
+            self._db.execute('UPDATE intents SET status = ? WHERE status = ?', (PENDING, RUNNING))
+        self._stopping = False
+        self._worker = threading.Thread(target=self._run, name='searchguard-write-behind')
+        self._worker.daemon = True
+        self._worker.start()
+        return self
+
+    def stop(self, timeout=None):
+        """Stops the background worker after the write it is sending, pending intents stay queued"""
+        with self._changed:
+            self._stopping = True
+            self._changed.notify_all()
+        if self._worker is not None:
+            self._worker.join(timeout)
+            self._worker = None
+
+    def close(self):
+        self.stop()
+        self._db.close()
+
+    def enqueue(self, resource, name, operation, payload=None):
+        """Queues a write and returns its intent id
+
+        :param str resource: rolesmapping or internalusers
+        :param str name: role or username
+        :param str operation: create, modify or delete
+        :param dict payload: properties of the write (see OPERATIONS)
+        """
+        if (resource, operation) not in OPERATIONS:
+            raise ValueError('Unknown operation {} on {}'.format(operation, resource))
+
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                intent_id = self._db.execute(
+                    'INSERT INTO intents (resource, name, operation, payload, status) VALUES (?, ?, ?, ?, ?)',
+                    (resource, name, operation, json.dumps(payload), PENDING)).lastrowid
+                self._coalesce(intent_id, resource, name, operation, payload)
+                self._db.execute('COMMIT')
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+
+        with self._changed:
+            self._changed.notify_all()
+        return intent_id
+
+    def modify_rolemapping(self, role, properties, action='replace'):
+        """Queues modify_rolemapping(role, properties, action) and returns the intent id"""
+        return self.enqueue('rolesmapping', role, 'modify', {'properties': properties, 'action': action})
+
+    def create_rolemapping(self, role, properties):
+        return self.enqueue('rolesmapping', role, 'create', properties)
+
+    def delete_rolemapping(self, role):
+        return self.enqueue('rolesmapping', role, 'delete')
+
+    def create_user(self, username, properties):
+        """Queues create_user(username, properties=properties) and returns the intent id
+        A password generated by the worker could not be returned, so properties has to hold a password or hash.
+
+        :raises: ValueError when properties has neither password nor hash
+        """
+        if not properties or ('password' not in properties and 'hash' not in properties):
+            raise ValueError('A queued user needs a password or hash, {} has neither'.format(username))
+        return self.enqueue('internalusers', username, 'create', properties)
+
+    def modify_user(self, username, properties):
+        return self.enqueue('internalusers', username, 'modify', properties)
+
+    def delete_user(self, username):
+        return self.enqueue('internalusers', username, 'delete')
+
+    def status(self, intent_id):
+        """Returns the status of an intent (pending, running, done or failed), following coalesced intents"""
+        with self._lock:
+            return self._resolve(intent_id)[1]
+
+    def pending(self):
+        """Returns the number of intents that are not done or failed"""
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM intents WHERE status IN (?, ?)',
+                                    (PENDING, RUNNING)).fetchone()[0]
+
+    def wait(self, intent_ids=None, timeout=None):
+        """Blocks until the given intents (default: everything queued so far) are sent, for read-your-writes
+        Without intent ids, the intents that failed since the previous wait() without ids are reported.
+
+        :param intent_ids: intent id or list of intent ids
+        :param float timeout: maximum seconds to wait
+        :returns: True when all intents are done, False on timeout
+        :raises: WriteBehindException when one of the intents failed permanently
+        """
+        if intent_ids is None:
+            with self._lock:
+                intent_ids = [self._db.execute('SELECT COALESCE(MAX(id), 0) FROM intents').fetchone()[0]]
+                wait_all = True
+        else:
+            wait_all = False
+            if not isinstance(intent_ids, (list, tuple, set)):
+                intent_ids = [intent_ids]
+
+        deadline = None if timeout is None else time.time() + timeout
+        with self._changed:
+            while True:
+                if self._finished(intent_ids, wait_all):
+                    return True
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._changed.wait(self.poll_interval if remaining is None else min(remaining, self.poll_interval))
+
+    def _finished(self, intent_ids, wait_all):
+        with self._lock:
+            if wait_all:
+                last = intent_ids[0]
+                if self._db.execute('SELECT COUNT(*) FROM intents WHERE id <= ? AND status IN (?, ?)',
+                                    (last, PENDING, RUNNING)).fetchone()[0]:
+                    return False
+                states = self._db.execute('SELECT id, status, error FROM intents WHERE id > ? AND id <= ? AND status = ?',
+                                          (self._reported, last, FAILED)).fetchall()
+                self._reported = max(self._reported, last)
+            else:
+                states = [self._resolve(intent_id) for intent_id in intent_ids]
+
+        failed = ['Write {} failed: {}'.format(intent_id, error) for intent_id, status, error in states if status == FAILED]
+        if failed:
+            raise WriteBehindException('; '.join(failed))
+        return all(status == DONE for _, status, _ in states)
+
+    def _resolve(self, intent_id):
+        """Private function returning (id, status, error) of an intent, following superseded_by"""
+        while True:
+            row = self._db.execute('SELECT status, superseded_by, error FROM intents WHERE id = ?',
+                                   (intent_id,)).fetchone()
+            if row is None:
+                raise KeyError(intent_id)
+            if row[1] is None:
+                return intent_id, row[0], row[2]
+            intent_id = row[1]
+
+    def _coalesce(self, intent_id, resource, name, operation, payload):
+        """Private function folding the last pending intent of the same resource into the new one"""
+        previous = self._db.execute(
+            'SELECT id, operation, payload, status FROM intents WHERE resource = ? AND name = ? AND id < ? '
+            'AND status IN (?, ?) ORDER BY id DESC LIMIT 1', (resource, name, intent_id, PENDING, RUNNING)).fetchone()
+        if previous is None or previous[3] != PENDING:
+            # A write that is being sent can no longer be changed
+            return
+
+        combined = coalesce(resource, (previous[1], json.loads(previous[2])), (operation, payload))
+        if combined is None:
+            return
+        self._db.execute('UPDATE intents SET payload = ? WHERE id = ?', (json.dumps(combined), intent_id))
+        self._db.execute('UPDATE intents SET status = ?, superseded_by = ? WHERE id = ?',
+                         (DONE, intent_id, previous[0]))
+        self._db.execute('UPDATE intents SET superseded_by = ? WHERE superseded_by = ?', (intent_id, previous[0]))
+
+    def _claim(self):
+        """Private function marking the oldest intent that is due and not blocked by an earlier intent of the
+        same resource as running, returns (id, resource, name, operation, payload, attempts) or None
+        """
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._db.execute(
+                    'SELECT id, resource, name, operation, payload, attempts FROM intents AS intent '
+                    'WHERE status = ? AND not_before <= ? AND NOT EXISTS ('
+                    '  SELECT 1 FROM intents AS earlier WHERE earlier.resource = intent.resource '
+                    '  AND earlier.name = intent.name AND earlier.id < intent.id AND earlier.status IN (?, ?)) '
+                    'ORDER BY id LIMIT 1', (PENDING, time.time(), PENDING, RUNNING)).fetchone()
+                if row is not None:
+                    self._db.execute('UPDATE intents SET status = ? WHERE id = ?', (RUNNING, row[0]))
+                self._db.execute('COMMIT')
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+        return row
+
+    def _finish(self, intent_id, attempts, error, permanent=False):
+        with self._lock:
+            if error is None:
+                self._db.execute('UPDATE intents SET status = ?, attempts = ?, error = NULL WHERE id = ?',
+                                 (DONE, attempts, intent_id))
+            elif permanent or (self.max_attempts is not None and attempts >= self.max_attempts):
+                self._db.execute('UPDATE intents SET status = ?, attempts = ?, error = ? WHERE id = ?',
+                                 (FAILED, attempts, error, intent_id))
+            else:
+                self._db.execute('UPDATE intents SET status = ?, attempts = ?, error = ?, not_before = ? WHERE id = ?',
+                                 (PENDING, attempts, error, time.time() + self.retry_delay * 2 ** (attempts - 1),
+                                  intent_id))
+        with self._changed:
+            self._changed.notify_all()
+
+    def run_once(self):
+        """Sends the next due intent, returns False when there was nothing to send"""
+        row = self._claim()
+        if row is None:
+            return False
+
+        intent_id, resource, name, operation, payload, attempts = row
+        error, permanent = None, False
+        try:
+            OPERATIONS[(resource, operation)](name, json.loads(payload))
+        except Exception as e:
+            error, permanent = '{}: {}'.format(type(e).__name__, e), not retryable(e)
+        self._finish(intent_id, attempts + 1, error, permanent)
+        return True
+
+    def _run(self):
+        with priority.priority(priority.BATCH):
+            self._drain()
+
+    def _drain(self):
+        while not self._stopping:
+            if self.run_once():
+                continue
+            with self._changed:
+                if not self._stopping:
+                    self._changed.wait(self.poll_interval)
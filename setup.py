@@ -10,11 +10,7 @@ classifiers = [
     "License :: OSI Approved :: MIT License",
     "Operating System :: OS Independent",
     "Programming Language :: Python",
-    "Programming Language :: Python :: 2",
-    "Programming Language :: Python :: 2.7",
     "Programming Language :: Python :: 3",
-    "Programming Language :: Python :: 3.4",
-    "Programming Language :: Python :: 3.5",
     "Programming Language :: Python :: 3.6",
     "Programming Language :: Python :: 3.7",
     "Programming Language :: Python :: Implementation :: CPython",
@@ -43,8 +39,16 @@ setup(
     classifiers=classifiers,
     long_description=long_description,
     long_description_content_type="text/markdown",
+    python_requires='>=3.6',
     install_requires=[
         'requests>=2.20'
     ],
+    extras_require={
+        'http2': ['httpx[http2]'],
+        'analytics': ['numpy', 'scipy'],
+    },
+    entry_points={
+        'console_scripts': ['sgctl = searchguard.cli:main'],
+    },
 )
 
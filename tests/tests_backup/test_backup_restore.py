@@ -0,0 +1,190 @@
+#!/usr/bin/python3
+
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+from mock import Mock
+from tests.helper import BaseTestCase
+import searchguard.existence as existence
+import searchguard.priority as priority
+from searchguard.backup import backup, restore, verify, iter_backup, CHECKPOINT
+from searchguard.cli import main
+from searchguard.exceptions import BackupException
+
+
+class TestBackupRestore(BaseTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+        self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "fake_api_url")
+        self.set_up_patch('searchguard.cli.sys.stderr')
+        self.data = {
+            'roles': {"role1": {"cluster": ["CLUSTER_COMPOSITE_OPS_RO"]}, "role2": {"readonly": True},
+                      "builtin": {"static": True}},
+            'rolesmapping': {"role1": {"users": ["john"]}, "role2": {"backendroles": ["staff"]}},
+            'internalusers': {"john": {"hash": "$2y$12$abc", "roles": ["staff"]}, "jane": {"hash": ""}},
+        }
+        self.existing = set()
+        self.mocked_requests_get = self.set_up_patch('searchguard.transport.requests.get')
+        self.mocked_requests_get.side_effect = self.get
+        self.mocked_requests_put = self.set_up_patch('searchguard.transport.requests.put')
+        self.put_status = {}
+        self.puts = []
+        self.lock = threading.Lock()
+        self.mocked_requests_put.side_effect = self.put
+
+    def get(self, url, **kwargs):
+        resource, name = url.split('/')[-2:]
+        if name:
+            return Mock(status_code=200 if name in self.existing else 404)
+        body = json.dumps(self.data[resource]).encode('utf-8')
+        return Mock(status_code=200, iter_content=lambda size: iter([body[:10], body[10:]]))
+
+    def put(self, url, data=None, **kwargs):
+        path = url.split('/', 1)[1]
+        with self.lock:
+            self.puts.append((path, json.loads(data)))
+        return Mock(status_code=self.put_status.get(path, 201), text='')
+
+    def test_backup_writes_compressed_file_per_resource_and_manifest(self):
+        manifest = backup(self.directory)
+
+        self.assertEqual(manifest['resources']['roles']['entries'], 3)
+        with gzip.open(os.path.join(self.directory, 'rolesmapping.jsonl.gz'), 'rb') as fh:
+            self.assertEqual(len(fh.read().splitlines()), 2)
+        self.assertEqual(dict(iter_backup(self.directory, 'internalusers')), self.data['internalusers'])
+        self.assertEqual(verify(self.directory), manifest)
+
+    def test_backup_and_restore_send_batch_requests(self):
+        dispatcher = priority.enable(capacity=4, reserved=1)
+        self.addCleanup(priority.disable)
+
+        backup(self.directory)
+        restore(self.directory)
+
+        self.assertEqual(dispatcher.stats()[priority.INTERACTIVE]['requests'], 0)
+        self.assertGreater(dispatcher.stats()[priority.BATCH]['requests'], 0)
+
+    def test_verify_detects_damaged_file(self):
+        backup(self.directory)
+        with open(os.path.join(self.directory, 'roles.jsonl.gz'), 'ab') as fh:
+            fh.write(b'x')
+
+        with self.assertRaises(BackupException):
+            verify(self.directory)
+
+    def test_verify_rejects_backup_without_manifest(self):
+        with self.assertRaises(BackupException):
+            restore(self.directory)
+        self.mocked_requests_put.assert_not_called()
+
+    def test_restore_writes_roles_and_users_before_mappings(self):
+        backup(self.directory)
+
+        result = restore(self.directory, concurrency=4)
+
+        self.assertTrue(result.ok)
+        self.assertEqual(result.restored, {'roles': 2, 'rolesmapping': 2, 'internalusers': 2})
+        self.assertEqual(result.skipped, 1)
+        paths = [path for path, _ in self.puts]
+        self.assertEqual(set(paths[4:]), {'rolesmapping/role1', 'rolesmapping/role2'})
+        self.assertFalse(os.path.exists(os.path.join(self.directory, CHECKPOINT)))
+
+    def test_restore_drops_metadata_and_generates_passwords_without_hash(self):
+        backup(self.directory)
+
+        result = restore(self.directory)
+
+        bodies = dict(self.puts)
+        self.assertEqual(bodies['roles/role2'], {})
+        self.assertEqual(bodies['internalusers/john'], {"hash": "$2y$12$abc", "roles": ["staff"]})
+        self.assertEqual(bodies['internalusers/jane'], {"password": result.passwords['jane']})
+
+    def test_restored_entries_are_added_to_the_existence_filter(self):
+        backup(self.directory)
+        existence_filter = existence.enable(single_writer=True)
+        self.addCleanup(existence.disable)
+        existence_filter.load('roles', [])
+        existence_filter.load('internalusers', [])
+
+        restore(self.directory)
+
+        self.assertTrue(existence_filter.might_exist('roles', 'role1'))
+        self.assertTrue(existence_filter.might_exist('internalusers', 'jane'))
+
+    def test_failed_role_skips_its_mapping_and_keeps_checkpoint(self):
+        backup(self.directory)
+        self.put_status['roles/role1'] = 500
+
+        result = restore(self.directory)
+
+        self.assertEqual(set(result.failed), {('roles', 'role1'), ('rolesmapping', 'role1')})
+        self.assertNotIn('rolesmapping/role1', [path for path, _ in self.puts])
+        self.assertTrue(os.path.exists(os.path.join(self.directory, CHECKPOINT)))
+
+    def test_interrupted_restore_resumes_from_checkpoint(self):
+        backup(self.directory)
+        self.put_status['roles/role1'] = 500
+        restore(self.directory)
+        del self.put_status['roles/role1']
+        self.puts = []
+
+        result = restore(self.directory)
+
+        self.assertTrue(result.ok)
+        self.assertEqual(sorted(path for path, _ in self.puts), ['roles/role1', 'rolesmapping/role1'])
+
+    def test_existing_users_without_hash_keep_their_password(self):
+        backup(self.directory)
+        self.existing.add('jane')
+
+        result = restore(self.directory)
+
+        self.assertNotIn('internalusers/jane', [path for path, _ in self.puts])
+        self.assertEqual(result.passwords, {})
+        self.assertEqual(result.skipped, 2)
+
+    def test_reset_passwords_gives_existing_users_a_new_password(self):
+        backup(self.directory)
+        self.existing.add('jane')
+
+        result = restore(self.directory, reset_passwords=True)
+
+        self.assertEqual(dict(self.puts)['internalusers/jane'], {"password": result.passwords['jane']})
+
+    def test_password_is_only_reported_when_the_user_was_written(self):
+        backup(self.directory)
+        self.put_status['internalusers/jane'] = 500
+        on_password = Mock()
+
+        result = restore(self.directory, on_password=on_password)
+
+        self.assertEqual(result.passwords, {})
+        on_password.assert_not_called()
+
+    def test_checkpoint_does_not_contain_passwords(self):
+        backup(self.directory)
+        self.put_status['roles/role1'] = 500
+        on_password = Mock()
+
+        result = restore(self.directory, on_password=on_password)
+
+        on_password.assert_called_once_with('jane', result.passwords['jane'])
+        with open(os.path.join(self.directory, CHECKPOINT)) as fh:
+            checkpoint = [json.loads(line) for line in fh]
+        self.assertIn(['internalusers', 'jane'], checkpoint)
+        self.assertNotIn(result.passwords['jane'], json.dumps(checkpoint))
+
+    def test_cli_backup_and_restore(self):
+        passwords = os.path.join(self.directory, 'passwords.jsonl')
+
+        self.assertEqual(main(['backup', self.directory]), 0)
+        self.assertEqual(main(['restore', self.directory, '--passwords', passwords]), 0)
+
+        with open(passwords) as fh:
+            self.assertEqual(json.loads(fh.read())['username'], 'jane')
@@ -0,0 +1,85 @@
+#!/usr/bin/python3
+
+import json
+from mock import Mock
+from tests.helper import BaseTestCase
+from searchguard.batchread import CostModel, PER_NAME, BULK
+from searchguard.internalusers import view_users
+from searchguard.roles import view_roles
+from searchguard.exceptions import ViewUserException
+
+
+class TestCostModel(BaseTestCase):
+
+    def setUp(self):
+        self.model = CostModel(initial_latency=0.01)
+
+    def test_few_names_are_read_per_name_before_a_bulk_read_was_observed(self):
+        self.assertEqual(self.model.choose(8, 8)[0], PER_NAME)
+        self.assertEqual(self.model.choose(9, 8)[0], BULK)
+
+    def test_large_listing_makes_per_name_reads_cheaper(self):
+        self.model.observe_bulk(2.01, 10 * 1000 * 1000)
+
+        strategy, estimates = self.model.choose(100, 10)
+        self.assertEqual(strategy, PER_NAME)
+        self.assertAlmostEqual(estimates[BULK], 2.01)
+        self.assertAlmostEqual(estimates[PER_NAME], 0.1)
+
+    def test_small_listing_makes_bulk_read_cheaper(self):
+        self.model.observe_bulk(0.02, 1000)
+
+        self.assertEqual(self.model.choose(100, 10)[0], BULK)
+
+
+class TestViewUsers(BaseTestCase):
+
+    def setUp(self):
+        self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "fake_api_url")
+        self.set_up_patch('searchguard.batchread._models', {})
+        self.users = {"user1": {"hash": "a"}, "user2": {"hash": "b"}, "other": {}}
+
+        def get(url, **kwargs):
+            name = url.split('/')[-1]
+            if not name:
+                return Mock(status_code=200, text=json.dumps(self.users))
+            if name not in self.users:
+                return Mock(status_code=404)
+            return Mock(status_code=200, text=json.dumps({name: self.users[name]}))
+        self.mocked_requests_get = self.set_up_patch('searchguard.transport.requests.get')
+        self.mocked_requests_get.side_effect = get
+
+    def test_view_users_reads_per_name(self):
+        result = view_users(["user1", "user2", "missing"], strategy=PER_NAME)
+
+        self.assertEqual(result.found, {"user1": {"hash": "a"}, "user2": {"hash": "b"}})
+        self.assertEqual(result.missing, ["missing"])
+        self.assertEqual(self.mocked_requests_get.call_count, 3)
+
+    def test_view_users_reads_bulk(self):
+        result = view_users(["user1", "user2", "missing"], strategy=BULK)
+
+        self.assertEqual(result.found, {"user1": {"hash": "a"}, "user2": {"hash": "b"}})
+        self.assertEqual(result.missing, ["missing"])
+        self.mocked_requests_get.assert_called_once()
+
+    def test_view_users_reports_chosen_strategy(self):
+        self.assertEqual(view_users(["user1"]).strategy, PER_NAME)
+        self.assertEqual(view_users(["user1", "user2"], concurrency=1).strategy, BULK)
+
+    def test_view_users_raises_on_errors(self):
+        self.mocked_requests_get.side_effect = None
+        self.mocked_requests_get.return_value = Mock(status_code=500)
+
+        with self.assertRaises(ViewUserException):
+            view_users(["user1"])
+
+    def test_view_roles_reads_roles(self):
+        self.mocked_requests_get.side_effect = None
+        self.mocked_requests_get.return_value = Mock(status_code=200, text=json.dumps({"role1": {"cluster": []}}))
+
+        result = view_roles(["role1", "role2"], strategy=BULK)
+
+        self.assertEqual(self.mocked_requests_get.call_args[0][0], 'fake_api_url/roles/')
+        self.assertEqual(result.found, {"role1": {"cluster": []}})
+        self.assertEqual(result.missing, ["role2"])
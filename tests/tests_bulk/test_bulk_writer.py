@@ -0,0 +1,146 @@
+#!/usr/bin/python3
+
+import json
+from mock import Mock
+from tests.helper import BaseTestCase
+import searchguard.fingerprints as fingerprints
+from searchguard.bulk import bulk_users, bulk_roles
+
+
+class TestBulkWriter(BaseTestCase):
+
+    def setUp(self):
+        self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "fake_api_url")
+        self.mocked_requests_patch = self.set_up_patch('searchguard.transport.requests.patch')
+        self.mocked_requests_patch.return_value = Mock(status_code=200)
+        self.mocked_requests_put = self.set_up_patch('searchguard.transport.requests.put')
+        self.mocked_requests_put.return_value = Mock(status_code=201)
+        self.mocked_requests_delete = self.set_up_patch('searchguard.transport.requests.delete')
+        self.mocked_requests_delete.return_value = Mock(status_code=200)
+
+    def patch_bodies(self):
+        return [json.loads(kwargs['data']) for _, kwargs in self.mocked_requests_patch.call_args_list]
+
+    def test_operations_are_sent_as_one_patch(self):
+        writer = bulk_roles()
+        writer.put('role1', {'cluster': ['a']})
+        writer.update('role2', {'cluster': ['b']})
+        writer.delete('role/3')
+        result = writer.flush()
+
+        self.mocked_requests_patch.assert_called_once()
+        self.assertEqual(self.mocked_requests_patch.call_args[0][0], 'fake_api_url/roles')
+        self.assertEqual(self.patch_bodies(), [[
+            {'op': 'add', 'path': '/role1', 'value': {'cluster': ['a']}},
+            {'op': 'replace', 'path': '/role2', 'value': {'cluster': ['b']}},
+            {'op': 'remove', 'path': '/role~13'},
+        ]])
+        self.assertEqual(result.succeeded, ['role1', 'role2', 'role/3'])
+        self.assertTrue(result.ok)
+
+    def test_operations_are_chunked(self):
+        writer = bulk_roles(chunk_size=2)
+        for i in range(5):
+            writer.delete('role{}'.format(i))
+        result = writer.flush()
+
+        self.assertEqual([len(body) for body in self.patch_bodies()], [2, 2, 1])
+        self.assertEqual(result.requests, 3)
+
+    def test_rejected_chunk_is_bisected_to_the_failing_entity(self):
+        def patch(url, **kwargs):
+            paths = [operation['path'] for operation in json.loads(kwargs['data'])]
+            return Mock(status_code=400 if '/role2' in paths else 200, text='not found')
+        self.mocked_requests_patch.side_effect = patch
+
+        writer = bulk_roles()
+        for i in range(4):
+            writer.delete('role{}'.format(i))
+        result = writer.flush()
+
+        self.assertEqual(sorted(result.succeeded), ['role0', 'role1', 'role3'])
+        self.assertEqual(list(result.failed), ['role2'])
+        self.assertIn('not found', result.failed['role2'])
+
+    def test_server_error_fails_the_whole_chunk(self):
+        self.mocked_requests_patch.return_value = Mock(status_code=500, text='error')
+
+        writer = bulk_roles()
+        writer.delete('role1')
+        writer.delete('role2')
+        result = writer.flush()
+
+        self.assertEqual(sorted(result.failed), ['role1', 'role2'])
+        self.assertEqual(result.requests, 1)
+
+    def test_authorization_error_fails_the_whole_chunk_without_splitting(self):
+        self.mocked_requests_patch.return_value = Mock(status_code=403, text='forbidden')
+
+        writer = bulk_roles()
+        for i in range(4):
+            writer.delete('role{}'.format(i))
+        result = writer.flush()
+
+        self.assertEqual(len(result.failed), 4)
+        self.assertEqual(result.requests, 1)
+
+    def test_overloaded_chunk_is_sent_again_after_backing_off(self):
+        mocked_sleep = self.set_up_patch('searchguard.bulk.time.sleep')
+        self.mocked_requests_patch.side_effect = [Mock(status_code=429, headers={'Retry-After': '2'}),
+                                                  Mock(status_code=429, headers={}), Mock(status_code=200)]
+
+        writer = bulk_roles()
+        writer.delete('role1')
+        writer.delete('role2')
+        result = writer.flush()
+
+        self.assertEqual(sorted(result.succeeded), ['role1', 'role2'])
+        self.assertEqual(self.patch_bodies()[0], self.patch_bodies()[2])
+        self.assertEqual([args[0] for args, _ in mocked_sleep.call_args_list], [2.0, 1.0])
+
+    def test_overloaded_chunk_fails_after_the_last_retry(self):
+        self.set_up_patch('searchguard.bulk.time.sleep')
+        self.mocked_requests_patch.return_value = Mock(status_code=429, headers={}, text='too many requests')
+
+        writer = bulk_roles()
+        writer.delete('role1')
+        writer.delete('role2')
+        result = writer.flush()
+
+        self.assertEqual(sorted(result.failed), ['role1', 'role2'])
+        self.assertEqual(result.requests, 6)
+
+    def test_falls_back_to_per_entity_calls_without_patch_support(self):
+        self.mocked_requests_patch.return_value = Mock(status_code=405)
+
+        writer = bulk_users(chunk_size=1)
+        writer.put('user1', {'password': 'secret'})
+        writer.delete('user2')
+        result = writer.flush()
+
+        self.mocked_requests_patch.assert_called_once()
+        self.mocked_requests_put.assert_called_once()
+        self.assertEqual(self.mocked_requests_put.call_args[0][0], 'fake_api_url/internalusers/user1')
+        self.mocked_requests_delete.assert_called_once()
+        self.assertFalse(result.patched)
+        self.assertEqual(result.succeeded, ['user1', 'user2'])
+
+    def test_put_users_without_password_get_a_generated_password(self):
+        with bulk_users() as writer:
+            writer.put('user1')
+            writer.put('user2', {'hash': 'xyz'})
+
+        self.assertEqual(list(writer.result.passwords), ['user1'])
+        self.assertEqual(self.patch_bodies()[0][0]['value'], {'password': writer.result.passwords['user1']})
+
+    def test_role_fingerprints_are_updated(self):
+        cache = fingerprints.enable()
+        self.addCleanup(fingerprints.disable)
+        cache.set('roles', 'role2', {'cluster': ['b']})
+
+        with bulk_roles() as writer:
+            writer.put('role1', {'cluster': ['a']})
+            writer.delete('role2')
+
+        self.assertIsNotNone(cache.get('roles', 'role1'))
+        self.assertIsNone(cache.get('roles', 'role2'))
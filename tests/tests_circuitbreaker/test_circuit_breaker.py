@@ -0,0 +1,131 @@
+#!/usr/bin/python3
+
+from mock import Mock
+from tests.helper import BaseTestCase
+from searchguard import circuitbreaker
+from searchguard.circuitbreaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+from searchguard.exceptions import CircuitOpenException, CheckUserExistsException
+from searchguard.internalusers import check_user_exists
+
+
+class TestCircuitBreaker(BaseTestCase):
+
+    def setUp(self):
+        self.mocked_time = self.set_up_patch('searchguard.circuitbreaker.time.time')
+        self.mocked_time.return_value = 1000.0
+        self.listener = Mock()
+
+        self.breaker = CircuitBreaker('fake_api_url', failure_rate=0.5, min_requests=4, window=10, cooldown=30)
+        self.breaker.add_listener(self.listener)
+
+    def trip(self):
+        for _ in range(4):
+            self.breaker.before_request()
+            self.breaker.record_failure()
+
+    def test_circuit_breaker_stays_closed_below_min_requests(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_circuit_breaker_stays_closed_below_failure_rate(self):
+        for _ in range(3):
+            self.breaker.record_success()
+        self.breaker.record_failure()
+
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_circuit_breaker_opens_when_failure_rate_is_reached(self):
+        self.trip()
+
+        self.assertEqual(self.breaker.state, OPEN)
+        self.listener.assert_called_once_with('fake_api_url', CLOSED, OPEN)
+
+    def test_circuit_breaker_forgets_failures_outside_window(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.mocked_time.return_value = 1011.0
+        self.breaker.record_failure()
+
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_circuit_breaker_raises_exception_when_open(self):
+        self.trip()
+
+        with self.assertRaises(CircuitOpenException):
+            self.breaker.before_request()
+
+    def test_circuit_breaker_allows_one_trial_request_after_cooldown(self):
+        self.trip()
+        self.mocked_time.return_value = 1030.0
+
+        self.breaker.before_request()
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        with self.assertRaises(CircuitOpenException):
+            self.breaker.before_request()
+
+    def test_circuit_breaker_closes_after_successful_trial(self):
+        self.trip()
+        self.mocked_time.return_value = 1030.0
+
+        self.breaker.before_request()
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_circuit_breaker_reopens_after_failed_trial(self):
+        self.trip()
+        self.mocked_time.return_value = 1030.0
+
+        self.breaker.before_request()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, OPEN)
+        self.listener.assert_called_with('fake_api_url', HALF_OPEN, OPEN)
+
+
+class TestCircuitBreakerTransport(BaseTestCase):
+
+    def setUp(self):
+        self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "fake_api_url")
+        self.mocked_requests_get = self.set_up_patch('searchguard.transport.requests.get')
+        self.mocked_requests_get.return_value = Mock(status_code=503)
+
+        circuitbreaker.enable(min_requests=2, cooldown=30)
+        self.addCleanup(circuitbreaker.disable)
+
+    def test_check_user_exists_fails_fast_when_circuit_is_open(self):
+        for _ in range(2):
+            with self.assertRaises(CheckUserExistsException):
+                check_user_exists("DummyUser")
+
+        with self.assertRaises(CircuitOpenException):
+            check_user_exists("DummyUser")
+        self.assertEqual(self.mocked_requests_get.call_count, 2)
+
+    def test_connection_errors_count_as_failures(self):
+        self.mocked_requests_get.side_effect = IOError
+
+        for _ in range(2):
+            with self.assertRaises(IOError):
+                check_user_exists("DummyUser")
+
+        self.assertEqual(circuitbreaker.states(), {"fake_api_url": OPEN})
+
+    def test_listeners_are_notified_of_state_changes(self):
+        listener = Mock()
+        circuitbreaker.add_listener(listener)
+        self.addCleanup(circuitbreaker._listeners.remove, listener)
+
+        for _ in range(2):
+            with self.assertRaises(CheckUserExistsException):
+                check_user_exists("DummyUser")
+
+        listener.assert_called_once_with("fake_api_url", CLOSED, OPEN)
+
+    def test_client_errors_do_not_open_the_circuit(self):
+        self.mocked_requests_get.return_value = Mock(status_code=404)
+
+        for _ in range(3):
+            check_user_exists("DummyUser")
+
+        self.assertEqual(circuitbreaker.states(), {"fake_api_url": CLOSED})
@@ -0,0 +1,92 @@
+#!/usr/bin/python3
+
+import json
+import os
+import shutil
+import tempfile
+from mock import Mock, call
+from tests.helper import BaseTestCase
+from searchguard.cli import main
+from searchguard.exceptions import UserAlreadyExistsException
+
+
+class TestCli(BaseTestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.mocked_stderr = self.set_up_patch('searchguard.cli.sys.stderr')
+
+        self.mocked_create_user = self.set_up_patch('searchguard.cli.create_user')
+        self.mocked_create_user.return_value = 'generated'
+        self.mocked_modify_rolemapping = self.set_up_patch('searchguard.cli.modify_rolemapping')
+        self.mocked_iter_users = self.set_up_patch('searchguard.cli.iter_users')
+        self.mocked_iter_users.return_value = iter([("user1", {"hash": "123", "roles": ["a", "b"]}),
+                                                    ("user2", {"hash": "456"})])
+
+    def path(self, name, content=None):
+        path = os.path.join(self.tmpdir, name)
+        if content is not None:
+            with open(path, 'w') as fh:
+                fh.write(content)
+        return path
+
+    def test_import_users_creates_user_for_every_jsonl_record(self):
+        records = self.path('users.jsonl', '{"username": "user1", "password": "secret"}\n\n'
+                                           '{"username": "user2", "roles": ["a"]}\n')
+
+        ret = main(['import-users', records, '--passwords', self.path('passwords.jsonl')])
+
+        self.assertEqual(ret, 0)
+        self.assertCountEqual(self.mocked_create_user.call_args_list, [call('user1', 'secret', {}),
+                                                                       call('user2', None, {'roles': ['a']})])
+
+    def test_import_users_reads_lists_from_csv(self):
+        records = self.path('users.csv', 'username,password,roles\nuser1,,a;b\n')
+
+        main(['import-users', records, '--passwords', self.path('passwords.csv')])
+
+        self.mocked_create_user.assert_called_once_with('user1', None, {'roles': ['a', 'b']})
+
+    def test_import_users_writes_passwords_of_created_users(self):
+        records = self.path('users.jsonl', '{"username": "user1"}\n')
+
+        main(['import-users', records, '--passwords', self.path('passwords.jsonl')])
+
+        with open(self.path('passwords.jsonl')) as fh:
+            self.assertEqual(json.loads(fh.read()), {"username": "user1", "password": "generated"})
+
+    def test_import_users_returns_1_and_counts_errors(self):
+        self.mocked_create_user.side_effect = [UserAlreadyExistsException('User user1 already exists'), 'pw']
+        records = self.path('users.jsonl', '{"username": "user1"}\n{"username": "user2"}\n')
+
+        ret = main(['--concurrency', '1', 'import-users', records, '--passwords', self.path('passwords.jsonl')])
+
+        self.assertEqual(ret, 1)
+        self.mocked_stderr.write.assert_any_call('\rerror: user1: User user1 already exists\n')
+
+    def test_export_users_writes_jsonl(self):
+        output = self.path('users.jsonl')
+
+        main(['export-users', output])
+
+        with open(output) as fh:
+            lines = [json.loads(line) for line in fh]
+        self.assertEqual(lines, [{"username": "user1", "hash": "123", "roles": ["a", "b"]},
+                                 {"username": "user2", "hash": "456"}])
+
+    def test_export_users_writes_csv(self):
+        output = self.path('users.csv')
+
+        main(['export-users', output])
+
+        with open(output) as fh:
+            self.assertEqual(fh.read().splitlines(), ['username,password,hash,roles,attributes',
+                                                      'user1,,123,a;b,', 'user2,,456,,'])
+
+    def test_import_rolemappings_passes_action(self):
+        records = self.path('mappings.jsonl', '{"role": "role1", "users": ["user1"]}\n')
+
+        main(['import-rolemappings', records, '--action', 'split'])
+
+        self.mocked_modify_rolemapping.assert_called_once_with('role1', {'users': ['user1']}, 'split')
@@ -0,0 +1,40 @@
+#!/usr/bin/python3
+
+import itertools
+import threading
+from tests.helper import BaseTestCase
+from searchguard.concurrency import run_bounded
+
+
+class TestRunBounded(BaseTestCase):
+
+    def test_run_bounded_returns_outcome_for_every_item(self):
+        outcomes = list(run_bounded(lambda item: item * 2, range(100), concurrency=4))
+
+        self.assertEqual(sorted(outcome.result for outcome in outcomes), [item * 2 for item in range(100)])
+
+    def test_run_bounded_returns_exceptions_as_errors(self):
+        def func(item):
+            if item == 3:
+                raise ValueError('bad item')
+            return item
+
+        outcomes = {outcome.item: outcome for outcome in run_bounded(func, range(5), concurrency=2)}
+
+        self.assertIsInstance(outcomes[3].error, ValueError)
+        self.assertIsNone(outcomes[2].error)
+
+    def test_run_bounded_consumes_items_lazily(self):
+        consumed = itertools.count()
+        lock = threading.Lock()
+
+        def items():
+            for item in range(1000):
+                with lock:
+                    next(consumed)
+                yield item
+
+        outcomes = run_bounded(lambda item: item, items(), concurrency=2)
+        next(outcomes)
+
+        self.assertLessEqual(next(consumed), 5)
@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+
+from mock import Mock, ANY
+from tests.helper import BaseTestCase
+from searchguard.concurrency import run_bounded
+import searchguard.circuitbreaker as circuitbreaker
+from searchguard.deadline import deadline, current
+from searchguard.limiter import AdaptiveLimiter
+from searchguard.nodes import get_pool
+from searchguard.exceptions import DeadlineExceededException
+from searchguard.internalusers import check_user_exists, create_user
+
+
+class TestDeadline(BaseTestCase):
+
+    def setUp(self):
+        self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "fake_api_url")
+        self.mocked_time = self.set_up_patch('searchguard.deadline.time.monotonic')
+        self.mocked_time.return_value = 1000.0
+
+        self.mocked_requests_get = self.set_up_patch('searchguard.transport.requests.get')
+        self.mocked_requests_get.return_value = Mock(status_code=404)
+        self.mocked_requests_put = self.set_up_patch('searchguard.transport.requests.put')
+        self.mocked_requests_put.return_value = Mock(status_code=201)
+
+    def test_requests_are_sent_without_timeout_by_default(self):
+        check_user_exists("DummyUser")
+
+        self.mocked_requests_get.assert_called_once_with('fake_api_url/internalusers/DummyUser', auth=(ANY, ANY))
+
+    def test_requests_are_sent_with_configured_timeouts(self):
+        self.set_up_patch('searchguard.settings.SEARCHGUARD_CONNECT_TIMEOUT', 2.0)
+        self.set_up_patch('searchguard.settings.SEARCHGUARD_READ_TIMEOUT', 10.0)
+
+        check_user_exists("DummyUser")
+
+        self.mocked_requests_get.assert_called_once_with(ANY, auth=ANY, timeout=(2.0, 10.0))
+
+    def test_timeouts_are_capped_to_remaining_deadline(self):
+        self.set_up_patch('searchguard.settings.SEARCHGUARD_CONNECT_TIMEOUT', 2.0)
+
+        with deadline(5):
+            self.mocked_time.return_value = 1004.0
+            check_user_exists("DummyUser")
+
+        self.mocked_requests_get.assert_called_once_with(ANY, auth=ANY, timeout=(1.0, 1.0))
+
+    def test_compound_operation_fails_fast_when_budget_is_spent(self):
+        def slow_check(*args, **kwargs):
+            self.mocked_time.return_value = 1006.0
+            return Mock(status_code=404)
+        self.mocked_requests_get.side_effect = slow_check
+
+        with deadline(5):
+            with self.assertRaises(DeadlineExceededException):
+                create_user("DummyUser")
+
+        self.mocked_requests_put.assert_not_called()
+
+    def test_transport_error_after_deadline_raises_deadline_exceeded(self):
+        def timing_out(*args, **kwargs):
+            self.mocked_time.return_value = 1006.0
+            raise IOError('read timed out')
+        self.mocked_requests_get.side_effect = timing_out
+
+        with deadline(5):
+            with self.assertRaises(DeadlineExceededException):
+                check_user_exists("DummyUser")
+
+    def test_nested_deadline_cannot_extend_outer_deadline(self):
+        with deadline(5):
+            with deadline(60) as inner:
+                self.assertEqual(inner.expires_at, 1005.0)
+
+        self.assertIsNone(current())
+
+    def test_run_bounded_workers_share_the_deadline(self):
+        with deadline(5) as active:
+            outcomes = list(run_bounded(lambda item: current(), range(4), concurrency=2))
+
+        self.assertTrue(all(outcome.result is active for outcome in outcomes))
+
+    def test_expired_deadline_fails_before_touching_nodes_and_circuits(self):
+        self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "node1,node2")
+        circuitbreaker.enable(min_requests=1)
+        self.addCleanup(circuitbreaker.disable)
+
+        with deadline(5):
+            self.mocked_time.return_value = 1006.0
+            for _ in range(6):
+                with self.assertRaises(DeadlineExceededException):
+                    check_user_exists("DummyUser")
+
+        self.mocked_requests_get.assert_not_called()
+        self.assertTrue(all(node.failures == 0 and node.outstanding == 0 for node in get_pool().nodes))
+        self.assertNotIn(circuitbreaker.OPEN, circuitbreaker.states().values())
+
+    def test_deadline_exceeded_during_request_is_not_a_node_failure(self):
+        def timing_out(*args, **kwargs):
+            self.mocked_time.return_value = 1006.0
+            raise IOError('read timed out')
+        self.mocked_requests_get.side_effect = timing_out
+        circuitbreaker.enable(min_requests=1)
+        self.addCleanup(circuitbreaker.disable)
+        limiter = AdaptiveLimiter(initial=4)
+        check = limiter.wrap(check_user_exists)
+
+        with deadline(5):
+            with self.assertRaises(DeadlineExceededException):
+                check("DummyUser")
+
+        self.assertEqual(get_pool().nodes[0].failures, 0)
+        self.assertEqual(circuitbreaker.states(), {'fake_api_url': circuitbreaker.CLOSED})
+        self.assertEqual(limiter.metrics()['limit'], 4)
+
+    def test_deadline_exceeded_gives_back_the_half_open_trial(self):
+        breaker = circuitbreaker.CircuitBreaker('node', min_requests=1, cooldown=0)
+        breaker.record_failure()
+        breaker.before_request()
+
+        breaker.cancel_request()
+
+        breaker.before_request()
+        self.assertEqual(breaker.state, circuitbreaker.HALF_OPEN)
@@ -0,0 +1,134 @@
+#!/usr/bin/python3
+
+import importlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from mock import Mock, patch
+from tests.helper import BaseTestCase
+import searchguard.diskindex as diskindex
+from searchguard.diskindex import DiskIndex, load, write_index
+from searchguard.exceptions import ListUsersException
+
+
+class TestDiskIndex(BaseTestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'index')
+
+        self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "fake_api_url")
+        self.users = {"999_john": {"hash": ""}, "999_jane": {"hash": ""}, "12_joe": {"hash": ""}, "admin": {}}
+        self.rolemappings = {
+            "readall": {"users": ["999_john", "999_jane", "external"], "backendroles": ["staff"]},
+            "kibana": {"users": ["999_john"]},
+            "empty": {"hosts": ["*"]},
+        }
+        self.mocked_requests_get = self.set_up_patch('searchguard.transport.requests.get')
+        self.mocked_requests_get.side_effect = lambda url, **kwargs: Mock(
+            status_code=200, text=json.dumps(self.rolemappings if 'rolesmapping' in url else self.users))
+
+    def load(self, max_age=60):
+        index = load(self.path, max_age)
+        self.addCleanup(index.close)
+        return index
+
+    def test_load_builds_missing_index(self):
+        index = self.load()
+
+        self.assertTrue(index.loaded)
+        self.assertEqual(index.roles_for("999_john"), ["kibana", "readall"])
+        self.assertEqual(index.members("readall"), ["999_jane", "999_john", "external"])
+        self.assertEqual(index.users_for_prefix("999"), ["999_jane", "999_john"])
+        self.assertEqual(index.prefixes(), ["12", "999", "admin", "external"])
+
+    def test_lookups_of_unknown_names_return_empty_results(self):
+        index = self.load()
+
+        self.assertEqual(index.roles_for("nobody"), [])
+        self.assertEqual(index.roles_for("12_joe"), [])
+        self.assertEqual(index.members("unknown"), [])
+        self.assertEqual(index.members("empty"), [])
+        self.assertEqual(index.users_for_prefix("external"), [])
+        self.assertEqual(index.users_for_prefix("nope"), [])
+
+    def test_user_exists_only_for_internal_users(self):
+        index = self.load()
+
+        self.assertTrue(index.user_exists("admin"))
+        self.assertFalse(index.user_exists("external"))
+        self.assertFalse(index.user_exists("nobody"))
+
+    def test_recently_verified_index_is_used_without_requests(self):
+        self.load().close()
+        self.mocked_requests_get.reset_mock()
+
+        index = self.load()
+
+        self.assertEqual(index.roles_for("999_jane"), ["readall"])
+        self.mocked_requests_get.assert_not_called()
+
+    def test_unchanged_cluster_keeps_the_index_file(self):
+        self.load().close()
+        inode = os.stat(self.path).st_ino
+        os.utime(self.path, (time.time() - 120, time.time() - 120))
+
+        index = self.load()
+
+        self.assertEqual(os.stat(self.path).st_ino, inode)
+        self.assertGreater(index.verified(), time.time() - 60)
+        self.assertEqual(index.roles_for("999_john"), ["kibana", "readall"])
+        self.assertEqual(self.mocked_requests_get.call_count, 4)
+
+    def test_unchanged_index_is_used_without_fcntl(self):
+        self.load()
+
+        with patch.dict(sys.modules, {'fcntl': None}):
+            importlib.reload(diskindex)
+            index = diskindex.load(self.path, max_age=0)
+            self.addCleanup(index.close)
+
+            self.assertEqual(index.roles_for("999_john"), ["kibana", "readall"])
+
+    def test_changed_cluster_rebuilds_index(self):
+        index = self.load()
+        self.rolemappings["kibana"]["users"].append("12_joe")
+
+        self.assertTrue(index.ensure_fresh(max_age=0))
+
+        self.assertEqual(index.roles_for("12_joe"), ["kibana"])
+
+    def test_open_index_picks_up_file_replaced_by_another_process(self):
+        index = self.load()
+        write_index(self.path, self.users, {"kibana": {"users": ["admin"]}})
+
+        index.ensure_fresh(max_age=60)
+
+        self.assertEqual(index.roles_for("admin"), ["kibana"])
+        self.assertEqual(index.roles_for("999_john"), [])
+
+    def test_incompatible_file_is_rebuilt(self):
+        with open(self.path, 'wb') as index_file:
+            index_file.write(b'garbage')
+
+        index = self.load()
+
+        self.assertEqual(index.roles_for("999_jane"), ["readall"])
+
+    def test_empty_cluster(self):
+        self.users, self.rolemappings = {}, {}
+
+        index = self.load()
+
+        self.assertEqual(index.prefixes(), [])
+        self.assertEqual(index.roles_for("john"), [])
+
+    def test_failed_download_raises(self):
+        self.mocked_requests_get.side_effect = lambda url, **kwargs: Mock(status_code=500, text='error')
+
+        with self.assertRaises(ListUsersException):
+            DiskIndex(self.path).ensure_fresh()
@@ -0,0 +1,99 @@
+#!/usr/bin/python3
+
+import copy
+import json
+import os
+import shutil
+import tempfile
+from mock import Mock
+from tests.helper import BaseTestCase
+from searchguard.drift import MerkleTree, Snapshot, Drift, check_drift, compare, fetch_snapshot
+from searchguard.exceptions import ListRolesException
+
+
+class TestDrift(BaseTestCase):
+
+    def setUp(self):
+        self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "https://a:9200/api")
+        self.roles = {"role{}".format(i): {"cluster": ["perm{}".format(i), "other"]} for i in range(50)}
+        self.rolemappings = {"role1": {"users": ["john", "jane"]}, "role2": {"backendroles": ["staff"]}}
+        self.clusters = {"https://a:9200/api": {"roles": self.roles, "rolesmapping": self.rolemappings}}
+        self.clusters["https://b:9200/api"] = copy.deepcopy(self.clusters["https://a:9200/api"])
+
+        self.mocked_requests_get = self.set_up_patch('searchguard.transport.requests.get')
+        self.mocked_requests_get.side_effect = self.get
+
+    def get(self, url, **kwargs):
+        cluster, resource = url.rsplit('/', 2)[:2]
+        if resource not in self.clusters[cluster]:
+            return Mock(status_code=500, text='error')
+        body = json.dumps(self.clusters[cluster][resource]).encode('utf-8')
+        return Mock(status_code=200, iter_content=lambda size: iter([body]))
+
+    def test_entry_hashes_ignore_list_order_and_metadata(self):
+        first = MerkleTree.from_bodies('rolesmapping', [("role1", {"users": ["a", "b"]})])
+        second = MerkleTree.from_bodies('rolesmapping', [("role1", {"users": ["b", "a"], "hosts": [], "reserved": False})])
+
+        self.assertEqual(first.root, second.root)
+
+    def test_identical_clusters_are_clean_after_comparing_roots(self):
+        reports = check_drift(list(self.clusters), resources=('roles', 'rolesmapping'))
+
+        report = reports["https://b:9200/api"]
+        self.assertTrue(report.clean)
+        self.assertEqual(report.compared, 2)
+
+    def test_drift_reports_missing_extra_and_changed_entries(self):
+        other = self.clusters["https://b:9200/api"]
+        del other["roles"]["role3"]
+        other["roles"]["role7"]["cluster"].append("new")
+        other["roles"]["extra"] = {}
+        other["rolesmapping"]["role1"]["users"].append("joe")
+
+        report = check_drift(list(self.clusters), resources=('roles', 'rolesmapping'))["https://b:9200/api"]
+
+        self.assertCountEqual(report.drift, [Drift('roles', 'role3', 'missing'), Drift('roles', 'role7', 'changed'),
+                                             Drift('roles', 'extra', 'extra'), Drift('rolesmapping', 'role1', 'changed')])
+        self.assertEqual(report.summary()['roles'], {'missing': 1, 'changed': 1, 'extra': 1})
+
+    def test_diff_only_descends_into_differing_subtrees(self):
+        changed = dict(self.roles, role7={"cluster": []})
+        baseline = MerkleTree.from_bodies('roles', self.roles.items())
+
+        drift, compared = baseline.diff(MerkleTree.from_bodies('roles', changed.items()))
+
+        self.assertEqual(drift, [Drift('roles', 'role7', 'changed')])
+        self.assertLess(compared, 1 + 16 + 16 + 1)
+
+    def test_saved_baseline_compares_like_a_live_snapshot(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'baseline.json')
+        fetch_snapshot(resources=('roles',)).save(path)
+        self.clusters["https://b:9200/api"]["roles"].pop("role1")
+
+        baseline = Snapshot.load(path)
+        reports = check_drift(["https://b:9200/api"], baseline=baseline, resources=('roles',))
+
+        self.assertEqual(baseline.roots(), fetch_snapshot(resources=('roles',)).roots())
+        self.assertEqual(reports["https://b:9200/api"].drift, [Drift('roles', 'role1', 'missing')])
+
+    def test_resources_are_fetched_from_every_cluster(self):
+        check_drift(list(self.clusters), resources=('roles', 'rolesmapping'))
+
+        urls = sorted(call[0][0] for call in self.mocked_requests_get.call_args_list)
+        self.assertEqual(urls, ["https://a:9200/api/roles/", "https://a:9200/api/rolesmapping/",
+                                "https://b:9200/api/roles/", "https://b:9200/api/rolesmapping/"])
+
+    def test_failed_fetch_raises(self):
+        self.clusters["https://b:9200/api"].pop("roles")
+
+        with self.assertRaises(ListRolesException):
+            check_drift(list(self.clusters), resources=('roles',))
+
+    def test_compare_against_empty_snapshot(self):
+        baseline = fetch_snapshot(resources=('rolesmapping',))
+
+        report = compare(baseline, Snapshot('empty', {}))
+
+        self.assertEqual(sorted(drift.name for drift in report.drift), ["role1", "role2"])
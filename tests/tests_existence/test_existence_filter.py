@@ -0,0 +1,137 @@
+#!/usr/bin/python3
+
+import json
+from mock import Mock
+from tests.helper import BaseTestCase
+import searchguard.existence as existence
+from searchguard.bulk import bulk_users
+from searchguard.existence import BloomFilter, ExistenceFilter
+from searchguard.internalusers import create_user, list_users
+from searchguard.roles import create_role, list_roles
+from searchguard.exceptions import UserAlreadyExistsException, RoleAlreadyExistsException
+
+
+class TestBloomFilter(BaseTestCase):
+
+    def test_added_names_are_always_contained(self):
+        bloom = BloomFilter(1000)
+        names = ['user{}'.format(i) for i in range(1000)]
+        for name in names:
+            bloom.add(name)
+
+        self.assertTrue(all(name in bloom for name in names))
+
+    def test_false_positive_rate_is_close_to_error_rate(self):
+        bloom = BloomFilter(1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add('user{}'.format(i))
+
+        false_positives = sum('other{}'.format(i) in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class TestExistenceFilter(BaseTestCase):
+
+    def setUp(self):
+        self.mocked_time = self.set_up_patch('searchguard.existence.time.time')
+        self.mocked_time.return_value = 1000.0
+        self.filter = ExistenceFilter(max_age=60)
+
+    def test_everything_might_exist_without_listing(self):
+        self.assertTrue(self.filter.might_exist('internalusers', 'user1'))
+
+    def test_listed_and_added_names_might_exist(self):
+        self.filter.load('internalusers', ['user1'])
+        self.filter.add('internalusers', 'user2')
+
+        self.assertTrue(self.filter.might_exist('internalusers', 'user1'))
+        self.assertTrue(self.filter.might_exist('internalusers', 'user2'))
+        self.assertFalse(self.filter.might_exist('internalusers', 'user3'))
+        self.assertEqual(self.filter.skipped, 1)
+
+    def test_stale_filter_is_not_trusted(self):
+        self.filter.load('internalusers', ['user1'])
+        self.mocked_time.return_value = 1061.0
+
+        self.assertTrue(self.filter.might_exist('internalusers', 'user3'))
+
+    def test_filter_is_not_trusted_forever_by_default(self):
+        default = ExistenceFilter()
+        default.load('internalusers', ['user1'])
+        self.mocked_time.return_value = 1000.0 + existence.DEFAULT_MAX_AGE + 1
+
+        self.assertTrue(default.might_exist('internalusers', 'user3'))
+
+    def test_enable_requires_single_writer(self):
+        with self.assertRaises(ValueError):
+            existence.enable()
+
+        self.assertIsNone(existence.get_filter())
+
+
+class TestCreateWithExistenceFilter(BaseTestCase):
+
+    def setUp(self):
+        self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "fake_api_url")
+        self.mocked_requests_get = self.set_up_patch('searchguard.transport.requests.get')
+        self.mocked_requests_put = self.set_up_patch('searchguard.transport.requests.put')
+        self.mocked_requests_put.return_value = Mock(status_code=201)
+        self.filter = existence.enable(single_writer=True)
+        self.addCleanup(existence.disable)
+
+    def test_list_users_loads_the_filter(self):
+        self.mocked_requests_get.return_value = Mock(status_code=200, text=json.dumps({"100_user1": {}}))
+
+        list_users(prefix='200')
+
+        self.assertTrue(self.filter.might_exist('internalusers', '100_user1'))
+        self.assertFalse(self.filter.might_exist('internalusers', '100_user2'))
+
+    def test_create_user_skips_check_for_new_name(self):
+        self.filter.load('internalusers', ['user1'])
+
+        create_user('user2', password='secret')
+
+        self.mocked_requests_get.assert_not_called()
+        self.assertTrue(self.filter.might_exist('internalusers', 'user2'))
+
+    def test_create_user_checks_names_that_might_exist(self):
+        self.filter.load('internalusers', ['user1'])
+        self.mocked_requests_get.return_value = Mock(status_code=200)
+
+        with self.assertRaises(UserAlreadyExistsException):
+            create_user('user1')
+        self.mocked_requests_put.assert_not_called()
+
+    def test_create_user_reports_existing_user_when_put_updated_it(self):
+        self.filter.load('internalusers', [])
+        self.mocked_requests_put.return_value = Mock(status_code=200)
+
+        with self.assertRaises(UserAlreadyExistsException):
+            create_user('user1')
+
+    def test_create_role_skips_check_for_new_name(self):
+        self.mocked_requests_get.return_value = Mock(status_code=200, text=json.dumps({"role1": {}}))
+        list_roles()
+        self.mocked_requests_get.reset_mock()
+
+        create_role('role2')
+
+        self.mocked_requests_get.assert_not_called()
+        self.mocked_requests_put.assert_called_once()
+
+    def test_create_role_reports_existing_role_when_put_updated_it(self):
+        self.filter.load('roles', [])
+        self.mocked_requests_put.return_value = Mock(status_code=200)
+
+        with self.assertRaises(RoleAlreadyExistsException):
+            create_role('role1')
+
+    def test_bulk_writes_are_added_to_the_filter(self):
+        self.filter.load('internalusers', [])
+        self.set_up_patch('searchguard.transport.requests.patch').return_value = Mock(status_code=200)
+
+        with bulk_users() as writer:
+            writer.put('user1', {'hash': 'x'})
+
+        self.assertTrue(self.filter.might_exist('internalusers', 'user1'))
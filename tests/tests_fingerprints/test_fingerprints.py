@@ -0,0 +1,134 @@
+#!/usr/bin/python3
+
+import json
+from mock import Mock
+from tests.helper import BaseTestCase
+from searchguard import fingerprints
+from searchguard.fingerprints import canonicalize, fingerprint, SkippedWrite
+from searchguard.roles import modify_role
+from searchguard.rolesmapping import modify_rolemapping, view_all_rolemappings, iter_rolemappings
+
+
+class TestCanonicalize(BaseTestCase):
+
+    def test_canonicalize_ignores_key_order_list_order_and_metadata(self):
+        written = {"indices": {"idx": {"*": ["READ", "WRITE"]}}, "cluster": ["b", "a"]}
+        read = {"cluster": ["a", "b"], "readonly": True, "indices": {"idx": {"*": ["WRITE", "READ"]}}}
+
+        self.assertEqual(canonicalize('roles', written), canonicalize('roles', read))
+
+    def test_canonicalize_keeps_nested_keys_named_like_metadata(self):
+        self.assertNotEqual(fingerprint('internalusers', {"attributes": {"hidden": "a"}}),
+                            fingerprint('internalusers', {"attributes": {"hidden": "b"}}))
+
+    def test_canonicalize_adds_missing_rolemapping_keys(self):
+        self.assertEqual(fingerprint('rolesmapping', {"users": ["a"]}),
+                         fingerprint('rolesmapping', {"users": ["a"], "hosts": [], "backendroles": []}))
+
+    def test_fingerprint_differs_for_different_content(self):
+        self.assertNotEqual(fingerprint('roles', {"cluster": ["a"]}), fingerprint('roles', {"cluster": ["b"]}))
+
+
+class TestFingerprintCache(BaseTestCase):
+
+    def test_skipped_writes_are_bounded(self):
+        cache = fingerprints.FingerprintCache(max_skipped=2)
+        for name in ('role1', 'role2', 'role3'):
+            cache.set('roles', name, {})
+            cache.skip_write('roles', name, {})
+
+        self.assertEqual([skipped.name for skipped in cache.pop_skipped()], ['role2', 'role3'])
+        self.assertEqual(cache.pop_skipped(), [])
+
+    def test_fingerprint_is_not_trusted_forever_by_default(self):
+        mocked_time = self.set_up_patch('searchguard.fingerprints.time.time', return_value=1000.0)
+        cache = fingerprints.FingerprintCache()
+        cache.set('roles', 'role1', {})
+        mocked_time.return_value = 1000.0 + fingerprints.DEFAULT_MAX_AGE + 1
+
+        self.assertIsNone(cache.get('roles', 'role1'))
+
+    def test_check_drops_fingerprint_of_a_different_body(self):
+        cache = fingerprints.FingerprintCache()
+        cache.set('roles', 'role1', {"cluster": ["a"]})
+        cache.set('roles', 'role2', {"cluster": ["a"]})
+
+        cache.check('roles', 'role1', {"cluster": ["b"]})
+        cache.check('roles', 'role2', {"cluster": ["a"], "static": False})
+
+        self.assertIsNone(cache.get('roles', 'role1'))
+        self.assertIsNotNone(cache.get('roles', 'role2'))
+
+
+class TestCompareBeforeWrite(BaseTestCase):
+
+    def setUp(self):
+        self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "fake_api_url")
+        self.on_skip = Mock()
+        self.cache = fingerprints.enable(on_skip=self.on_skip)
+        self.addCleanup(fingerprints.disable)
+
+        self.permissions = {"cluster": ["dummyperm"]}
+        self.mapping = {"users": ["DummyUser"], "backendroles": [], "hosts": []}
+
+        self.mocked_requests_get = self.set_up_patch('searchguard.transport.requests.get')
+        self.mocked_requests_get.return_value = Mock(status_code=200, text=json.dumps({"DummyRole": self.mapping}))
+        self.mocked_requests_put = self.set_up_patch('searchguard.transport.requests.put')
+        self.mocked_requests_put.return_value = Mock(status_code=200)
+
+    def test_modify_role_skips_write_when_permissions_are_unchanged(self):
+        self.cache.set('roles', 'DummyRole', self.permissions)
+
+        modify_role('DummyRole', {"cluster": ["dummyperm"], "readonly": False})
+
+        self.mocked_requests_get.assert_not_called()
+        self.mocked_requests_put.assert_not_called()
+        self.on_skip.assert_called_once_with(SkippedWrite('roles', 'DummyRole', fingerprint('roles', self.permissions)))
+
+    def test_modify_role_writes_and_remembers_changed_permissions(self):
+        self.cache.set('roles', 'DummyRole', {"cluster": ["other"]})
+
+        modify_role('DummyRole', self.permissions)
+        modify_role('DummyRole', self.permissions)
+
+        self.assertEqual(self.mocked_requests_put.call_count, 1)
+        self.assertEqual(len(self.cache.pop_skipped()), 1)
+
+    def test_modify_role_writes_when_fingerprint_expired(self):
+        self.cache.max_age = -1
+        self.cache.set('roles', 'DummyRole', self.permissions)
+
+        modify_role('DummyRole', self.permissions)
+
+        self.mocked_requests_put.assert_called_once()
+
+    def test_modify_rolemapping_skips_replace_after_bulk_read(self):
+        view_all_rolemappings()
+
+        modify_rolemapping('DummyRole', {"users": ["DummyUser"]})
+
+        self.mocked_requests_get.assert_called_once()
+        self.mocked_requests_put.assert_not_called()
+
+    def test_streamed_read_of_a_changed_mapping_invalidates_its_fingerprint(self):
+        self.cache.set('rolesmapping', 'DummyRole', {"users": ["OtherUser"]})
+        body = json.dumps({"DummyRole": self.mapping}).encode('utf-8')
+        self.mocked_requests_get.return_value = Mock(status_code=200, text=body.decode('utf-8'),
+                                                     iter_content=lambda size: iter([body]))
+
+        list(iter_rolemappings())
+        modify_rolemapping('DummyRole', {"users": ["OtherUser"]})
+
+        self.mocked_requests_put.assert_called_once()
+
+    def test_modify_rolemapping_skips_merge_that_adds_nothing(self):
+        modify_rolemapping('DummyRole', {"users": ["DummyUser"]}, "merge")
+
+        self.mocked_requests_put.assert_not_called()
+        self.assertEqual([skipped.name for skipped in self.cache.pop_skipped()], ['DummyRole'])
+
+    def test_modify_rolemapping_writes_merge_that_adds_users(self):
+        modify_rolemapping('DummyRole', {"users": ["OtherUser"]}, "merge")
+
+        self.mocked_requests_put.assert_called_once()
+        self.on_skip.assert_not_called()
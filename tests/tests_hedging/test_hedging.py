@@ -0,0 +1,157 @@
+#!/usr/bin/python3
+
+import threading
+import time
+from mock import Mock
+from tests.helper import BaseTestCase
+import searchguard.hedging as hedging
+from searchguard.hedging import HedgingPolicy
+from searchguard.internalusers import check_user_exists
+
+
+class TestHedgingPolicy(BaseTestCase):
+
+    def setUp(self):
+        self.policy = HedgingPolicy(delay=0.01)
+        self.addCleanup(self.policy.shutdown)
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def attempt(self, responses):
+        """Returns an attempt answering with the next response, 'slow' blocks until self.release is set"""
+        responses = iter(responses)
+
+        def attempt(tried):
+            tried.append(len(tried))
+            response = next(responses)
+            if response == 'slow':
+                self.release.wait(5)
+                return Mock(status_code=200, name='slow')
+            if isinstance(response, Exception):
+                raise response
+            return response
+        return attempt
+
+    def test_fast_request_is_not_hedged(self):
+        response = Mock(status_code=200)
+
+        self.assertIs(self.policy.run(self.attempt([response])), response)
+        self.assertEqual(self.policy.stats()['hedged'], 0)
+
+    def test_hedge_wins_when_first_request_is_slow(self):
+        response = Mock(status_code=200)
+        threading.Timer(0.1, self.release.set).start()
+
+        self.assertIs(self.policy.run(self.attempt(['slow', response])), response)
+        self.assertEqual(self.policy.stats()['hedge_wins'], 1)
+
+    def test_hedge_skips_nodes_tried_by_first_request(self):
+        seen = []
+
+        def attempt(tried):
+            seen.append(list(tried))
+            tried.append('node{}'.format(len(seen)))
+            if len(seen) == 1:
+                self.release.wait(5)
+            return Mock(status_code=200)
+
+        threading.Timer(0.1, self.release.set).start()
+        self.policy.run(attempt)
+        self.assertEqual(seen, [[], ['node1']])
+
+    def test_response_of_losing_request_is_closed(self):
+        slow = Mock(status_code=200)
+        done = threading.Event()
+        slow.close.side_effect = lambda: done.set()
+
+        def attempt(tried):
+            tried.append(None)
+            if len(tried) == 1:
+                self.release.wait(5)
+                return slow
+            return Mock(status_code=200)
+
+        threading.Timer(0.1, self.release.set).start()
+        self.policy.run(attempt)
+
+        self.assertTrue(done.wait(5))
+
+    def test_caller_does_not_wait_for_slow_first_request(self):
+        response = Mock(status_code=200)
+        started = time.time()
+
+        self.assertIs(self.policy.run(self.attempt(['slow', response])), response)
+        self.assertLess(time.time() - started, 1)
+        self.assertEqual(self.policy.stats()['hedge_wins'], 1)
+
+    def test_first_request_finishing_first_is_no_hedge_win(self):
+        def attempt(tried):
+            tried.append(len(tried))
+            if len(tried) == 1:
+                threading.Event().wait(0.05)
+                return Mock(status_code=200)
+            self.release.wait(5)
+            return Mock(status_code=200)
+
+        self.policy.run(attempt)
+        self.assertEqual(self.policy.stats(), dict(self.policy.stats(), hedged=1, hedge_wins=0))
+
+    def test_hedge_waits_until_first_request_picked_its_node(self):
+        seen = []
+        picked = threading.Event()
+
+        def attempt(tried):
+            seen.append(list(tried))
+            if len(seen) == 1:
+                # Slower than the hedge delay before the node is picked
+                picked.wait(0.05)
+                tried.append('node1')
+                self.release.wait(5)
+            else:
+                tried.append('node2')
+            return Mock(status_code=200)
+
+        threading.Timer(0.2, self.release.set).start()
+        self.policy.run(attempt)
+        self.assertEqual(seen, [[], ['node1']])
+
+    def test_server_error_of_hedge_does_not_win(self):
+        threading.Timer(0.1, self.release.set).start()
+        self.policy.run(self.attempt(['slow', Mock(status_code=503)]))
+
+        self.assertEqual(self.policy.stats()['hedge_wins'], 0)
+
+    def test_first_outcome_is_returned_when_both_fail(self):
+        with self.assertRaises(IOError):
+            self.policy.run(self.attempt([IOError('connection refused'), IOError('connection reset')]))
+
+    def test_delay_follows_observed_percentile(self):
+        policy = HedgingPolicy(percentile=50, initial_delay=1.0, min_samples=4)
+        self.addCleanup(policy.shutdown)
+        self.assertEqual(policy.hedge_delay(), 1.0)
+
+        for latency in (0.1, 0.2, 0.3, 0.4):
+            policy._observe(latency)
+
+        self.assertEqual(policy.hedge_delay(), 0.3)
+
+
+class TestHedgedSend(BaseTestCase):
+
+    def setUp(self):
+        self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "node1,node2")
+        self.set_up_patch('searchguard.settings.SEARCHGUARD_LOAD_BALANCING', "round_robin")
+        self.mocked_requests_get = self.set_up_patch('searchguard.transport.requests.get')
+        self.mocked_requests_get.return_value = Mock(status_code=200)
+        self.policy = hedging.enable(delay=1)
+        self.addCleanup(hedging.disable)
+
+    def test_reads_go_through_hedging_policy(self):
+        self.assertTrue(check_user_exists("DummyUser"))
+        self.assertEqual(self.policy.stats()['requests'], 1)
+
+    def test_single_node_is_not_hedged(self):
+        self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "node1")
+
+        self.assertTrue(check_user_exists("DummyUser"))
+        self.assertEqual(self.policy.stats()['requests'], 0)
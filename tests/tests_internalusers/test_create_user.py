@@ -22,7 +22,7 @@ class TestCreateUser(BaseTestCase):
         self.api_url = "fake_api_url/internalusers/"
         self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "fake_api_url")
 
-        self.mocked_requests_put = self.set_up_patch('searchguard.internalusers.requests.put')
+        self.mocked_requests_put = self.set_up_patch('searchguard.transport.requests.put')
         self.mocked_requests_put.return_value = Mock(status_code=201)
         self.mocked_check_user_exists = self.set_up_patch('searchguard.internalusers.check_user_exists')
         self.mocked_check_user_exists.return_value = False
@@ -13,7 +13,7 @@ class TestDeleteUser(BaseTestCase):
         self.api_url = "fake_api_url/internalusers/"
         self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "fake_api_url")
 
-        self.mocked_requests_delete = self.set_up_patch('searchguard.internalusers.requests.delete')
+        self.mocked_requests_delete = self.set_up_patch('searchguard.transport.requests.delete')
         self.mocked_requests_delete.return_value = Mock(status_code=200)
         self.mocked_check_user_exists = self.set_up_patch('searchguard.internalusers.check_user_exists')
         self.mocked_check_user_exists.return_value = True
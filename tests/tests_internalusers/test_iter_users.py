@@ -0,0 +1,37 @@
+#!/usr/bin/python3
+
+import json
+from mock import Mock, ANY
+from tests.helper import BaseTestCase
+from searchguard.internalusers import iter_users
+from searchguard.exceptions import ListUsersException
+
+
+class TestIterUsers(BaseTestCase):
+
+    def setUp(self):
+        self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "fake_api_url")
+
+        self.user_list = {"dummyuser1": {"hash": "123"}, "999_dummyuser2": {"hash": "456", "roles": ["dummyrole2"]}}
+        body = json.dumps(self.user_list).encode('utf-8')
+
+        self.mocked_response = Mock(status_code=200)
+        self.mocked_response.iter_content.return_value = iter([body[:10], body[10:]])
+        self.mocked_requests_get = self.set_up_patch('searchguard.transport.requests.get')
+        self.mocked_requests_get.return_value = self.mocked_response
+
+    def test_iter_users_yields_all_users(self):
+        self.assertEqual(dict(iter_users()), self.user_list)
+
+    def test_iter_users_streams_the_response(self):
+        list(iter_users())
+
+        self.mocked_requests_get.assert_called_once_with('fake_api_url/internalusers/', auth=(ANY, ANY), stream=True)
+        self.mocked_response.close.assert_called_once_with()
+
+    def test_iter_users_raises_exception_when_requests_return_code_not_200(self):
+        self.mocked_response.status_code = 999
+
+        with self.assertRaises(ListUsersException):
+            list(iter_users())
+        self.mocked_response.close.assert_called_once_with()
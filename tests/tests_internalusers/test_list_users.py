@@ -21,7 +21,7 @@ class TestListUsers(BaseTestCase):
         self.user_list = {}
         self.user_list.update(self.user_list_pt1, **dict(self.user_list_pt2, **self.user_list_pt3))
 
-        self.mocked_requests_get = self.set_up_patch('searchguard.internalusers.requests.get')
+        self.mocked_requests_get = self.set_up_patch('searchguard.transport.requests.get')
         self.mocked_requests_get.return_value = Mock(status_code=200, text=json.dumps(self.user_list))
 
     def test_list_users_returns_all_users_when_called_without_filters(self):
@@ -14,7 +14,7 @@ class TestViewUser(BaseTestCase):
         self.user_data = {"DummyUser": {"roles": ["BackendRole"], "hash": "hash1234"}}
         self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "fake_api_url")
 
-        self.mocked_requests_get = self.set_up_patch('searchguard.internalusers.requests.get')
+        self.mocked_requests_get = self.set_up_patch('searchguard.transport.requests.get')
         self.mocked_requests_get.return_value = Mock(status_code=200)
         self.mocked_check_user_exists = self.set_up_patch('searchguard.internalusers.check_user_exists')
         self.mocked_check_user_exists.return_value = True
@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+
+import threading
+from mock import Mock
+from tests.helper import BaseTestCase
+from searchguard.limiter import AdaptiveLimiter
+from searchguard.concurrency import run_bounded
+from searchguard.internalusers import delete_user
+
+
+class TestAdaptiveLimiter(BaseTestCase):
+
+    def setUp(self):
+        self.limiter = AdaptiveLimiter(initial=4, min_limit=1, max_limit=8)
+        self.changes = []
+        self.limiter.add_listener(self.changes.append)
+
+    def test_limit_grows_by_about_one_per_limit_successes(self):
+        for _ in range(5):
+            self.limiter.record('get', 200, 0.01, 0)
+
+        self.assertEqual(self.limiter.metrics()['limit'], 5)
+        self.assertEqual(self.changes, [5])
+
+    def test_limit_is_capped(self):
+        for _ in range(100):
+            self.limiter.record('get', 200, 0.01, 0)
+
+        self.assertEqual(self.limiter.metrics()['limit'], 8)
+
+    def test_limit_is_cut_on_overload(self):
+        for status_code in (429, 503, None):
+            limiter = AdaptiveLimiter(initial=4)
+            limiter.record('get', status_code, 0.01, 1e12)
+
+            self.assertEqual(limiter.metrics()['limit'], 2)
+
+    def test_limit_is_cut_on_latency_spike(self):
+        self.limiter.record('get', 200, 0.01, 0)
+        self.limiter.record('get', 200, 0.05, 1e12)
+
+        self.assertEqual(self.limiter.metrics()['limit'], 2)
+
+    def test_lasting_latency_shift_becomes_the_new_baseline(self):
+        for _ in range(20):
+            self.limiter.record('get', 200, 0.01, 0)
+        for _ in range(50):
+            self.limiter.record('get', 200, 0.05, 1e12)
+
+        self.assertEqual(self.limiter.metrics()['limit'], 8)
+        self.assertAlmostEqual(self.limiter.metrics()['latency']['get'], 0.05, places=3)
+
+    def test_mixed_fast_reads_and_slow_writes_do_not_cut_the_limit(self):
+        for i in range(100):
+            if i % 2:
+                self.limiter.record('put', 200, 0.2, 0)
+            else:
+                self.limiter.record('get', 200, 0.005, 0)
+
+        self.assertEqual(self.limiter.metrics()['limit'], 8)
+        self.assertEqual(sorted(self.limiter.metrics()['latency']), ['get', 'put'])
+
+    def test_requests_in_flight_at_a_decrease_do_not_cut_again(self):
+        self.limiter.record('get', 429, 0.01, 1e12)
+        self.limiter.record('get', 429, 0.01, 0)
+
+        self.assertEqual(self.limiter.metrics()['limit'], 2)
+
+    def test_run_bounded_keeps_in_flight_below_limit(self):
+        limiter = AdaptiveLimiter(initial=2, max_limit=8)
+        peak = []
+        lock = threading.Lock()
+
+        def work(item):
+            with lock:
+                peak.append(limiter.in_flight)
+            return item
+
+        outcomes = list(run_bounded(work, range(50), limiter))
+
+        self.assertEqual(len(outcomes), 50)
+        self.assertLessEqual(max(peak), 2)
+
+    def test_requests_sent_by_batch_calls_feed_the_limiter(self):
+        self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "fake_api_url")
+        self.set_up_patch('searchguard.transport.requests.get').return_value = Mock(status_code=200)
+        self.set_up_patch('searchguard.transport.requests.delete').return_value = Mock(status_code=429)
+        limiter = AdaptiveLimiter(initial=8)
+
+        for outcome in run_bounded(delete_user, ['user1'], limiter):
+            pass
+
+        self.assertEqual(limiter.metrics()['limit'], 4)
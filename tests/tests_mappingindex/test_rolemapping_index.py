@@ -0,0 +1,55 @@
+#!/usr/bin/python3
+
+from tests.helper import BaseTestCase
+from searchguard.mappingindex import RoleMappingIndex
+
+
+class TestRoleMappingIndex(BaseTestCase):
+
+    def setUp(self):
+        self.rolemappings = {
+            "exact_user": {"users": ["john"]},
+            "wildcard_user": {"users": ["999_*"], "backendroles": [], "hosts": []},
+            "regex_user": {"users": ["/adm[0-9]+/"]},
+            "backendrole": {"backendroles": ["admins", "ops-?"]},
+            "hostname": {"hosts": ["*.Example.com"]},
+            "ip": {"hosts": ["192.168.1.*"]},
+            "cidr": {"hosts": ["10.0.0.0/8"]},
+        }
+        self.index = RoleMappingIndex(self.rolemappings)
+
+    def test_roles_for_matches_exact_user(self):
+        self.assertEqual(self.index.roles_for(user="john"), {"exact_user"})
+
+    def test_roles_for_matches_wildcard_user(self):
+        self.assertEqual(self.index.roles_for(user="999_john"), {"wildcard_user"})
+
+    def test_roles_for_matches_regex_user(self):
+        self.assertEqual(self.index.roles_for(user="adm12"), {"regex_user"})
+        self.assertEqual(self.index.roles_for(user="adm12x"), set())
+
+    def test_roles_for_matches_backendroles(self):
+        self.assertEqual(self.index.roles_for(backendroles=["ops-1"]), {"backendrole"})
+        self.assertEqual(self.index.roles_for(backendroles=["ops-12", "users"]), set())
+
+    def test_roles_for_matches_hostname_case_insensitive(self):
+        self.assertEqual(self.index.roles_for(host="node1.example.COM"), {"hostname"})
+
+    def test_roles_for_matches_ip_wildcard_and_cidr(self):
+        self.assertEqual(self.index.roles_for(host="192.168.1.20"), {"ip"})
+        self.assertEqual(self.index.roles_for(host="10.1.2.3"), {"cidr"})
+        self.assertEqual(self.index.roles_for(host="11.1.2.3"), set())
+
+    def test_roles_for_combines_user_backendroles_and_host(self):
+        roles = self.index.roles_for(user="john", backendroles=["admins"], host="10.0.0.1")
+
+        self.assertEqual(roles, {"exact_user", "backendrole", "cidr"})
+
+    def test_roles_for_returns_empty_set_without_matches(self):
+        self.assertEqual(self.index.roles_for(user="nobody", host="nowhere"), set())
+
+    def test_fetch_builds_index_from_view_all_rolemappings(self):
+        mocked_view_all_rolemappings = self.set_up_patch('searchguard.mappingindex.view_all_rolemappings')
+        mocked_view_all_rolemappings.return_value = self.rolemappings
+
+        self.assertEqual(RoleMappingIndex.fetch().roles_for(user="john"), {"exact_user"})
@@ -0,0 +1,79 @@
+#!/usr/bin/python3
+
+import unittest
+from tests.helper import BaseTestCase
+
+try:
+    import numpy
+    import scipy.sparse
+except ImportError:
+    numpy = None
+
+from searchguard.membership import MembershipMatrix
+
+
+@unittest.skipIf(numpy is None, 'numpy and scipy are not installed')
+class TestMembershipMatrix(BaseTestCase):
+
+    def setUp(self):
+        self.rolemappings = {
+            "readall": {"users": ["john", "jane", "joe"], "backendroles": ["staff"]},
+            "kibana": {"users": ["john", "jane"], "backendroles": ["staff"]},
+            "admin": {"users": ["root"], "backendroles": ["admins", "staff"]},
+            "empty": {"users": [], "hosts": ["*.example.com"]},
+        }
+        self.matrix = MembershipMatrix(self.rolemappings)
+
+    def test_vocabularies_are_sorted(self):
+        self.assertEqual(self.matrix.roles, ["admin", "empty", "kibana", "readall"])
+        self.assertEqual(self.matrix.users, ["jane", "joe", "john", "root"])
+        self.assertEqual(self.matrix.backendroles, ["admins", "staff"])
+        self.assertEqual(self.matrix.matrix.shape, (4, 4))
+        self.assertEqual(self.matrix.user_index["john"], 2)
+
+    def test_users_per_role(self):
+        self.assertEqual(self.matrix.users_per_role(), {"admin": 1, "empty": 0, "kibana": 2, "readall": 3})
+
+    def test_backendrole_counts(self):
+        self.assertEqual(self.matrix.roles_per_backendrole(), {"admins": 1, "staff": 3})
+        self.assertEqual(self.matrix.backendroles_per_role(), {"admin": 2, "empty": 0, "kibana": 1, "readall": 1})
+
+    def test_roles_for_users_returns_sorted_roles_per_user(self):
+        roles = self.matrix.roles_for_users(["john", "nobody", "root", "joe"])
+
+        self.assertEqual(roles, {"john": ["kibana", "readall"], "nobody": [], "root": ["admin"], "joe": ["readall"]})
+
+    def test_roles_for_backendroles(self):
+        self.assertEqual(self.matrix.roles_for_backendroles(["admins", "staff"]),
+                         {"admins": ["admin"], "staff": ["admin", "kibana", "readall"]})
+
+    def test_co_membership_counts_users_in_both_roles(self):
+        counts = self.matrix.co_membership().toarray()
+        kibana, readall = self.matrix.role_index["kibana"], self.matrix.role_index["readall"]
+
+        self.assertEqual(counts[kibana, readall], 2)
+        self.assertEqual(counts[readall, readall], 3)
+        self.assertEqual(counts[self.matrix.role_index["admin"], readall], 0)
+
+    def test_jaccard_matches_overlap(self):
+        similarity = self.matrix.jaccard()
+        kibana, readall = self.matrix.role_index["kibana"], self.matrix.role_index["readall"]
+        empty = self.matrix.role_index["empty"]
+
+        self.assertAlmostEqual(similarity[kibana, readall], 2 / 3.0)
+        self.assertAlmostEqual(self.matrix.overlap("kibana", "readall"), 2 / 3.0)
+        self.assertEqual(similarity[empty, empty], 0)
+        self.assertEqual(self.matrix.overlap("empty", "empty"), 0.0)
+
+    def test_shared_role_sets_groups_users_with_identical_roles(self):
+        self.assertEqual(self.matrix.shared_role_sets(), [(["kibana", "readall"], ["jane", "john"])])
+        self.assertEqual(len(self.matrix.shared_role_sets(min_users=1)), 3)
+
+    def test_redundant_roles_returns_roles_contained_in_other_roles(self):
+        self.assertEqual(self.matrix.redundant_roles(), [("kibana", "readall")])
+
+    def test_fetch_builds_matrix_from_view_all_rolemappings(self):
+        mocked_view_all_rolemappings = self.set_up_patch('searchguard.membership.view_all_rolemappings')
+        mocked_view_all_rolemappings.return_value = self.rolemappings
+
+        self.assertEqual(MembershipMatrix.fetch().users_per_role()["readall"], 3)
@@ -0,0 +1,100 @@
+#!/usr/bin/python3
+
+from mock import Mock
+from tests.helper import BaseTestCase
+from searchguard.nodes import NodePool, parse_urls, get_pool, LEAST_OUTSTANDING
+from searchguard.internalusers import check_user_exists, delete_user
+from searchguard.exceptions import CheckUserExistsException
+
+
+class TestNodePool(BaseTestCase):
+
+    def setUp(self):
+        self.mocked_time = self.set_up_patch('searchguard.nodes.time.time')
+        self.mocked_time.return_value = 1000.0
+        self.pool = NodePool(['node1', 'node2', 'node3'], max_failures=2, ejection_time=30)
+
+    def test_parse_urls_splits_comma_separated_urls(self):
+        self.assertEqual(parse_urls('https://node1/api, https://node2/api'), ['https://node1/api', 'https://node2/api'])
+
+    def test_round_robin_cycles_through_nodes(self):
+        self.assertEqual([self.pool.select().url for _ in range(4)], ['node1', 'node2', 'node3', 'node1'])
+
+    def test_least_outstanding_picks_node_with_fewest_requests_in_flight(self):
+        pool = NodePool(['node1', 'node2'], strategy=LEAST_OUTSTANDING)
+        pool.acquire(pool.nodes[0])
+
+        self.assertEqual([pool.select().url for _ in range(2)], ['node2', 'node2'])
+
+    def test_node_is_ejected_after_consecutive_failures(self):
+        node1 = self.pool.nodes[0]
+        for _ in range(2):
+            self.pool.acquire(node1)
+            self.pool.release(node1, False)
+
+        self.assertNotIn(node1, self.pool.healthy_nodes())
+        self.assertNotIn('node1', [self.pool.select().url for _ in range(4)])
+
+    def test_success_resets_failure_count(self):
+        node1 = self.pool.nodes[0]
+        for success in (False, True, False):
+            self.pool.acquire(node1)
+            self.pool.release(node1, success)
+
+        self.assertIn(node1, self.pool.healthy_nodes())
+
+    def test_ejected_node_is_readmitted_after_ejection_time(self):
+        node1 = self.pool.nodes[0]
+        for _ in range(2):
+            self.pool.acquire(node1)
+            self.pool.release(node1, False)
+        self.mocked_time.return_value = 1030.0
+
+        self.assertIn(node1, self.pool.healthy_nodes())
+
+    def test_all_nodes_are_used_when_all_are_ejected(self):
+        for node in self.pool.nodes:
+            node.ejected_until = 2000.0
+
+        self.assertEqual(self.pool.select().url, 'node1')
+
+    def test_select_skips_excluded_nodes(self):
+        self.assertEqual(self.pool.select(exclude=self.pool.nodes[:2]).url, 'node3')
+
+
+class TestFailover(BaseTestCase):
+
+    def setUp(self):
+        self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "node1,node2")
+        self.set_up_patch('searchguard.settings.SEARCHGUARD_LOAD_BALANCING', "round_robin")
+        self.mocked_requests_get = self.set_up_patch('searchguard.transport.requests.get')
+        self.mocked_requests_delete = self.set_up_patch('searchguard.transport.requests.delete')
+
+    def test_get_pool_is_built_from_settings(self):
+        self.assertEqual([node.url for node in get_pool().nodes], ['node1', 'node2'])
+
+    def test_reads_fail_over_to_next_node_on_connection_error(self):
+        self.mocked_requests_get.side_effect = [IOError('connection refused'), Mock(status_code=200)]
+
+        self.assertTrue(check_user_exists("DummyUser"))
+        self.assertEqual(len({call[0][0] for call in self.mocked_requests_get.call_args_list}), 2)
+
+    def test_reads_fail_over_to_next_node_on_server_error(self):
+        self.mocked_requests_get.side_effect = [Mock(status_code=503), Mock(status_code=404)]
+
+        self.assertFalse(check_user_exists("DummyUser"))
+
+    def test_reads_raise_when_all_nodes_fail(self):
+        self.mocked_requests_get.return_value = Mock(status_code=503)
+
+        with self.assertRaises(CheckUserExistsException):
+            check_user_exists("DummyUser")
+        self.assertEqual(self.mocked_requests_get.call_count, 2)
+
+    def test_writes_do_not_fail_over(self):
+        self.set_up_patch('searchguard.internalusers.check_user_exists').return_value = True
+        self.mocked_requests_delete.side_effect = IOError('connection reset')
+
+        with self.assertRaises(IOError):
+            delete_user("DummyUser")
+        self.assertEqual(self.mocked_requests_delete.call_count, 1)
@@ -0,0 +1,104 @@
+#!/usr/bin/python3
+
+import threading
+import time
+from mock import Mock
+from tests.helper import BaseTestCase
+import searchguard.priority as priority
+from searchguard.priority import Dispatcher, INTERACTIVE, BATCH
+from searchguard.concurrency import run_bounded
+from searchguard.internalusers import check_user_exists
+from searchguard.exceptions import DeadlineExceededException
+
+
+class TestDispatcher(BaseTestCase):
+
+    def setUp(self):
+        self.dispatcher = Dispatcher(capacity=3, reserved=1)
+
+    def start(self, name, started):
+        def run():
+            self.dispatcher.acquire(name)
+            started.append(name)
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def wait_queued(self, name, depth):
+        for _ in range(500):
+            if self.dispatcher.stats()[name]['queued'] == depth:
+                return
+            time.sleep(0.001)
+        self.fail('{} queue never reached {}'.format(name, depth))
+
+    def test_batch_requests_cannot_use_reserved_slots(self):
+        self.dispatcher.acquire(BATCH)
+        self.dispatcher.acquire(BATCH)
+
+        with self.assertRaises(DeadlineExceededException):
+            self.dispatcher.acquire(BATCH, timeout=0.01)
+        self.dispatcher.acquire(INTERACTIVE, timeout=0.01)
+
+    def test_interactive_requests_are_served_before_queued_batch_requests(self):
+        for _ in range(3):
+            self.dispatcher.acquire(INTERACTIVE)
+        started = []
+        batch = self.start(BATCH, started)
+        self.wait_queued(BATCH, 1)
+        interactive = self.start(INTERACTIVE, started)
+        self.wait_queued(INTERACTIVE, 1)
+
+        self.dispatcher.release(INTERACTIVE)
+        interactive.join(1)
+        self.assertEqual(started, [INTERACTIVE])
+
+        self.dispatcher.release(INTERACTIVE)
+        self.dispatcher.release(INTERACTIVE)
+        batch.join(1)
+        self.assertEqual(started, [INTERACTIVE, BATCH])
+
+    def test_stats_report_queue_depth_and_wait(self):
+        self.dispatcher.acquire(BATCH)
+        self.dispatcher.release(BATCH)
+
+        stats = self.dispatcher.stats()
+        self.assertEqual(stats[BATCH]['requests'], 1)
+        self.assertEqual(stats[BATCH]['queued'], 0)
+        self.assertEqual(stats[INTERACTIVE]['requests'], 0)
+        self.assertGreaterEqual(stats[BATCH]['wait_max'], 0)
+
+    def test_reserved_has_to_leave_room_for_batch(self):
+        with self.assertRaises(ValueError):
+            Dispatcher(capacity=2, reserved=2)
+
+
+class TestPriorityClasses(BaseTestCase):
+
+    def setUp(self):
+        self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "fake_api_url")
+        self.set_up_patch('searchguard.transport.requests.get').return_value = Mock(status_code=200)
+        self.dispatcher = priority.enable(capacity=4, reserved=1)
+        self.addCleanup(priority.disable)
+
+    def test_requests_are_interactive_by_default(self):
+        check_user_exists("user1")
+
+        self.assertEqual(self.dispatcher.stats()[INTERACTIVE]['requests'], 1)
+
+    def test_run_bounded_workers_keep_the_class_of_the_caller(self):
+        list(run_bounded(check_user_exists, ["user1", "user2"]))
+        with priority.priority(BATCH):
+            list(run_bounded(check_user_exists, ["user3"]))
+
+        self.assertEqual(self.dispatcher.stats()[INTERACTIVE]['requests'], 2)
+        self.assertEqual(self.dispatcher.stats()[BATCH]['requests'], 1)
+
+    def test_priority_context_sets_the_class(self):
+        with priority.priority(BATCH):
+            check_user_exists("user1")
+        with priority.priority(INTERACTIVE):
+            list(run_bounded(check_user_exists, ["user1"]))
+
+        self.assertEqual(self.dispatcher.stats()[BATCH]['requests'], 1)
+        self.assertEqual(self.dispatcher.stats()[INTERACTIVE]['requests'], 1)
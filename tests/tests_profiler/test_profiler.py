@@ -0,0 +1,110 @@
+#!/usr/bin/python3
+
+import json
+import os
+import shutil
+import socket
+import tempfile
+import time
+from mock import Mock
+from io import StringIO
+from tests.helper import BaseTestCase
+import searchguard.hedging as hedging
+from searchguard import profiler
+from searchguard.profiler import profiling, Profile
+from searchguard.internalusers import create_user, list_users, check_user_exists
+
+
+class TestProfiler(BaseTestCase):
+
+    def setUp(self):
+        self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "fake_api_url")
+        self.addCleanup(profiler.stop)
+
+        def resolve_and_respond(*args, **kwargs):
+            socket.getaddrinfo('localhost', 80)
+            return Mock(status_code=404, text=json.dumps({"dummyuser": {"hash": "123"}}))
+
+        self.mocked_requests_get = self.set_up_patch('searchguard.transport.requests.get')
+        self.mocked_requests_get.side_effect = resolve_and_respond
+        self.mocked_requests_put = self.set_up_patch('searchguard.transport.requests.put')
+        self.mocked_requests_put.return_value = Mock(status_code=201)
+
+    def test_profiling_aggregates_requests_per_outermost_function(self):
+        with profiling(stream=False) as profile:
+            create_user("DummyUser", "password")
+            create_user("DummyUser", "password")
+
+        self.assertEqual(list(profile.functions), ['internalusers.create_user'])
+        self.assertEqual(profile.functions['internalusers.create_user']['requests'], 4)
+
+    def test_profiling_records_dns_phase(self):
+        with profiling(stream=False) as profile:
+            create_user("DummyUser", "password")
+
+        self.assertGreater(profile.functions['internalusers.create_user']['dns'], 0)
+
+    def test_profiling_records_parse_phase(self):
+        self.mocked_requests_get.side_effect = None
+        self.mocked_requests_get.return_value = Mock(status_code=200, text=json.dumps({"dummyuser": {}}))
+
+        with profiling(stream=False) as profile:
+            list_users()
+
+        self.assertGreater(profile.functions['internalusers.list_users']['parse'], 0)
+
+    def test_hedged_requests_are_attributed_to_the_calling_function(self):
+        self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "node1,node2")
+        hedging.enable(delay=0.01)
+        self.addCleanup(hedging.disable)
+        answered = []
+
+        def slow_first(*args, **kwargs):
+            answered.append(args[0])
+            if len(answered) == 1:
+                time.sleep(0.1)
+            return Mock(status_code=200)
+        self.mocked_requests_get.side_effect = slow_first
+
+        with profiling(stream=False) as profile:
+            check_user_exists("DummyUser")
+
+        # Both requests were sent from worker threads, the hedge answered while the profile was active
+        self.assertEqual(len(answered), 2)
+        self.assertEqual(list(profile.functions), ['internalusers.check_user_exists'])
+
+    def test_profiling_prints_report(self):
+        stream = StringIO()
+
+        with profiling(stream=stream):
+            create_user("DummyUser", "password")
+
+        self.assertIn('internalusers.create_user', stream.getvalue())
+
+    def test_profiling_writes_profile_that_can_be_loaded(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'profile.json')
+
+        with profiling(path, stream=False) as profile:
+            create_user("DummyUser", "password")
+
+        self.assertEqual(Profile.load(path).functions, profile.functions)
+
+    def test_profiling_restores_socket_functions(self):
+        getaddrinfo = socket.getaddrinfo
+
+        with profiling(stream=False):
+            self.assertIsNot(socket.getaddrinfo, getaddrinfo)
+
+        self.assertIs(socket.getaddrinfo, getaddrinfo)
+
+    def test_profiling_cannot_be_nested(self):
+        with profiling(stream=False):
+            with self.assertRaises(RuntimeError):
+                profiler.start()
+
+    def test_requests_are_not_recorded_without_active_profile(self):
+        create_user("DummyUser", "password")
+
+        self.assertIsNone(profiler.active())
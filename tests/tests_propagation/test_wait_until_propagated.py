@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+
+import json
+from mock import Mock
+from tests.helper import BaseTestCase
+from searchguard.propagation import wait_until_propagated
+from searchguard.transport import send
+
+
+class TestWaitUntilPropagated(BaseTestCase):
+
+    def setUp(self):
+        self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "node1,node2")
+        self.set_up_patch('searchguard.propagation._observed', [])
+        self.mocked_sleep = self.set_up_patch('searchguard.propagation.time.sleep')
+        self.mocked_requests_get = self.set_up_patch('searchguard.transport.requests.get')
+        self.bodies = {'node1': {"users": ["john"]}, 'node2': {"users": []}}
+
+        def get(url, **kwargs):
+            node = url.split('/')[0]
+            body = self.bodies[node]
+            if body is None:
+                return Mock(status_code=404)
+            return Mock(status_code=200, text=json.dumps({"role1": body}))
+        self.mocked_requests_get.side_effect = get
+
+    def make_visible_after_first_sleep(self):
+        def sleep(seconds):
+            self.bodies['node2'] = {"users": ["john"]}
+        self.mocked_sleep.side_effect = sleep
+
+    def test_send_to_a_specific_node(self):
+        send('get', 'rolesmapping/role1', node='node2')
+
+        self.mocked_requests_get.assert_called_once()
+        self.assertEqual(self.mocked_requests_get.call_args[0][0], 'node2/rolesmapping/role1')
+
+    def test_waits_until_every_node_shows_the_expected_body(self):
+        self.make_visible_after_first_sleep()
+
+        result = wait_until_propagated('rolesmapping', 'role1', expected={"users": ["john"]})
+
+        self.assertTrue(result.complete)
+        self.assertEqual(sorted(result.nodes), ['node1', 'node2'])
+        self.assertEqual(result.probes, 3)
+        self.assertEqual(result.latency, max(result.nodes.values()))
+
+    def test_confirmed_nodes_are_not_probed_again(self):
+        self.make_visible_after_first_sleep()
+
+        wait_until_propagated('rolesmapping', 'role1', expected={"users": ["john"]})
+
+        urls = [call[0][0].split('/')[0] for call in self.mocked_requests_get.call_args_list]
+        self.assertEqual(sorted(urls), ['node1', 'node2', 'node2'])
+
+    def test_delay_grows_with_backoff(self):
+        self.bodies['node2'] = None
+        self.set_up_patch('searchguard.propagation.deadline.Deadline.remaining').return_value = 10
+
+        def sleep(seconds):
+            if self.mocked_sleep.call_count == 3:
+                self.bodies['node2'] = {"users": ["john"]}
+        self.mocked_sleep.side_effect = sleep
+
+        wait_until_propagated('rolesmapping', 'role1', initial_delay=0.1, max_delay=0.3)
+
+        self.assertEqual([call[0][0] for call in self.mocked_sleep.call_args_list], [0.1, 0.2, 0.3])
+
+    def test_waits_for_deletion(self):
+        self.bodies = {'node1': None, 'node2': None}
+
+        self.assertTrue(wait_until_propagated('rolesmapping', 'role1', deleted=True).complete)
+
+    def test_gives_up_at_timeout(self):
+        result = wait_until_propagated('rolesmapping', 'role1', expected=lambda body: body["users"] == ["jane"],
+                                       timeout=0)
+
+        self.assertFalse(result.complete)
+        self.assertEqual(sorted(result.pending), ['node1', 'node2'])
+        self.assertIsNone(result.latency)
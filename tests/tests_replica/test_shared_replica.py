@@ -0,0 +1,143 @@
+#!/usr/bin/python3
+
+import importlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+from mock import Mock, patch
+from tests.helper import BaseTestCase
+import searchguard.replica as replica
+from searchguard.replica import SharedReplica, SEQUENCE, SEQUENCE_OFFSET
+from searchguard.exceptions import ViewAllRoleMappingException
+from searchguard.rolesmapping import view_all_rolemappings, list_rolemappings_for_user
+from searchguard.tenants import teardown_tenant
+
+
+class TestSharedReplica(BaseTestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'replica')
+
+        self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "fake_api_url")
+        self.rolemappings = {"role1": {"users": ["john"]}, "role2": {"users": ["jane"]}}
+        self.mocked_requests_get = self.set_up_patch('searchguard.transport.requests.get')
+        self.mocked_requests_get.side_effect = lambda url, **kwargs: Mock(
+            status_code=200, text=json.dumps(self.rolemappings if 'rolesmapping' in url else {"role1": {}}))
+
+        self.leader = SharedReplica(self.path, interval=60, roles=True)
+        self.addCleanup(self.leader.stop)
+        self.follower = SharedReplica(self.path, interval=60)
+        self.addCleanup(self.follower.stop)
+
+    def test_only_one_process_leads(self):
+        self.assertTrue(self.leader.elect())
+        self.assertFalse(self.follower.elect())
+
+    def test_follower_reads_published_data_without_requests(self):
+        self.leader.elect()
+        self.mocked_requests_get.reset_mock()
+
+        self.assertEqual(self.follower.rolemappings(), self.rolemappings)
+        self.assertEqual(self.follower.roles(), {"role1": {}})
+        self.mocked_requests_get.assert_not_called()
+
+    def test_follower_sees_refreshed_data(self):
+        self.leader.elect()
+        self.follower.rolemappings()
+        self.rolemappings = {"role3": {"users": ["joe"]}}
+
+        self.leader.refresh()
+
+        self.assertEqual(self.follower.rolemappings(), self.rolemappings)
+
+    def test_callers_get_their_own_copy(self):
+        self.leader.elect()
+        self.follower.rolemappings()['role1']['users'].append('joe')
+
+        self.assertEqual(self.follower.rolemappings(), self.rolemappings)
+
+    def test_stale_data_is_not_served(self):
+        self.leader.elect()
+        now = self.set_up_patch('searchguard.replica.time.time')
+        now.return_value = self.leader.read()[1] + 3 * 60 + 1
+
+        self.assertIsNone(self.follower.rolemappings())
+        self.assertIsNone(self.follower.roles())
+
+    def test_failed_refresh_is_reported(self):
+        on_error = Mock()
+        leader = SharedReplica(self.path, interval=60, on_error=on_error)
+        self.addCleanup(leader.stop)
+        leader.elect()
+        self.mocked_requests_get.side_effect = None
+        self.mocked_requests_get.return_value = Mock(status_code=500)
+
+        leader._tick()
+
+        self.assertEqual(leader.errors, 1)
+        self.assertIsInstance(on_error.call_args[0][0], ViewAllRoleMappingException)
+
+    def test_importing_does_not_need_fcntl(self):
+        with patch.dict(sys.modules, {'fcntl': None}):
+            importlib.reload(replica)
+
+            with self.assertRaises(ImportError):
+                replica.SharedReplica(self.path).elect()
+
+    def test_nothing_is_read_before_the_first_publish(self):
+        self.assertIsNone(self.follower.rolemappings())
+
+    def test_partial_update_is_never_read(self):
+        self.leader.elect()
+        shared = self.leader._open()
+        sequence = SEQUENCE.unpack_from(shared, SEQUENCE_OFFSET)[0]
+        SEQUENCE.pack_into(shared, SEQUENCE_OFFSET, sequence + 1)
+
+        self.assertIsNone(self.follower.rolemappings())
+
+    def test_payload_larger_than_file_moves_to_a_new_file(self):
+        self.set_up_patch('searchguard.replica.INITIAL_CAPACITY', 16)
+        self.leader.elect()
+        self.follower.rolemappings()
+        self.rolemappings = {"role{}".format(i): {"users": ["user{}".format(i)]} for i in range(100)}
+
+        self.leader.refresh()
+
+        self.assertEqual(self.follower.rolemappings(), self.rolemappings)
+
+
+class TestReplicaLookups(BaseTestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "fake_api_url")
+        self.mocked_requests_get = self.set_up_patch('searchguard.transport.requests.get')
+        self.mocked_requests_get.return_value = Mock(status_code=200, text=json.dumps({"role1": {"users": ["john"]}}))
+
+        replica.enable(os.path.join(directory, 'replica'), interval=60)
+        self.addCleanup(replica.disable)
+        self.mocked_requests_get.reset_mock()
+
+    def test_lookups_are_served_from_the_replica(self):
+        self.assertEqual(view_all_rolemappings(), {"role1": {"users": ["john"]}})
+        self.assertEqual(list_rolemappings_for_user("john"), ["role1"])
+        self.mocked_requests_get.assert_not_called()
+
+    def test_stale_replica_falls_back_to_the_api(self):
+        now = self.set_up_patch('searchguard.replica.time.time')
+        now.return_value = replica.get_replica().read()[1] + 3 * 60 + 1
+
+        self.assertEqual(view_all_rolemappings(), {"role1": {"users": ["john"]}})
+        self.mocked_requests_get.assert_called_once()
+
+    def test_teardown_reads_role_mappings_from_the_api(self):
+        self.set_up_patch('searchguard.tenants.list_users', return_value={})
+
+        teardown_tenant('acme', dry_run=True)
+
+        self.assertIn('rolesmapping/', self.mocked_requests_get.call_args[0][0])
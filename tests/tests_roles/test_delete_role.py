@@ -13,7 +13,7 @@ class TestDeleteRole(BaseTestCase):
         self.api_url = "fake_api_url/roles/"
         self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "fake_api_url")
 
-        self.mocked_requests_delete = self.set_up_patch('searchguard.roles.requests.delete')
+        self.mocked_requests_delete = self.set_up_patch('searchguard.transport.requests.delete')
         self.mocked_requests_delete.return_value = Mock(status_code=200)
         self.mocked_check_role_exists = self.set_up_patch('searchguard.roles.check_role_exists')
         self.mocked_check_role_exists.return_value = True
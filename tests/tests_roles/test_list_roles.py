@@ -0,0 +1,44 @@
+#!/usr/bin/python3
+
+import json
+from mock import Mock, ANY
+from tests.helper import BaseTestCase
+from searchguard.roles import list_roles, iter_roles
+from searchguard.exceptions import ListRolesException
+
+
+class TestListRoles(BaseTestCase):
+
+    def setUp(self):
+        self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "fake_api_url")
+        self.roles = {"role1": {"cluster": ["dummyperm"]}, "role2": {"cluster": []}}
+
+        self.mocked_requests_get = self.set_up_patch('searchguard.transport.requests.get')
+        self.mocked_requests_get.return_value = Mock(status_code=200, text=json.dumps(self.roles))
+
+    def test_list_roles_returns_all_roles(self):
+        self.assertEqual(list_roles(), self.roles)
+
+    def test_list_roles_raises_exception_when_requests_return_code_not_200(self):
+        self.mocked_requests_get.return_value = Mock(status_code=999)
+
+        with self.assertRaises(ListRolesException):
+            list_roles()
+
+    def test_list_roles_calls_requests_with_correct_arguments(self):
+        list_roles()
+
+        self.mocked_requests_get.assert_called_once_with("fake_api_url/roles/", auth=(ANY, ANY))
+
+    def test_iter_roles_streams_all_roles(self):
+        body = json.dumps(self.roles).encode('utf-8')
+        self.mocked_requests_get.return_value = Mock(status_code=200, iter_content=lambda size: iter([body[:7], body[7:]]))
+
+        self.assertEqual(dict(iter_roles()), self.roles)
+        self.mocked_requests_get.assert_called_once_with("fake_api_url/roles/", auth=(ANY, ANY), stream=True)
+
+    def test_iter_roles_raises_exception_when_requests_return_code_not_200(self):
+        self.mocked_requests_get.return_value = Mock(status_code=999)
+
+        with self.assertRaises(ListRolesException):
+            list(iter_roles())
@@ -14,7 +14,7 @@ class TestViewRole(BaseTestCase):
         self.api_url = "fake_api_url/roles/"
         self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "fake_api_url")
 
-        self.mocked_requests_get = self.set_up_patch('searchguard.roles.requests.get')
+        self.mocked_requests_get = self.set_up_patch('searchguard.transport.requests.get')
         self.mocked_requests_get.return_value = Mock(status_code=200)
         self.mocked_check_role_exists = self.set_up_patch('searchguard.roles.check_role_exists')
         self.mocked_check_role_exists.return_value = True
@@ -13,7 +13,7 @@ class TestCheckRoleMappingExists(BaseTestCase):
         self.api_url = "fake_api_url/rolesmapping/"
         self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "fake_api_url")
 
-        self.mocked_requests_get = self.set_up_patch('searchguard.rolesmapping.requests.get')
+        self.mocked_requests_get = self.set_up_patch('searchguard.transport.requests.get')
         self.mocked_requests_get.return_value = Mock(status_code=200)
 
     def test_check_rolemapping_exists_calls_requests_with_correct_arguments(self):
@@ -18,7 +18,7 @@ class TestCreateRoleMapping(BaseTestCase):
         self.api_url = "fake_api_url/rolesmapping/"
         self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "fake_api_url")
 
-        self.mocked_requests_put = self.set_up_patch('searchguard.rolesmapping.requests.put')
+        self.mocked_requests_put = self.set_up_patch('searchguard.transport.requests.put')
         self.mocked_requests_put.return_value = Mock(status_code=201)
 
         self.mocked_check_role_exists = self.set_up_patch('searchguard.rolesmapping.check_role_exists')
@@ -13,7 +13,7 @@ class TestDeleteRoleMapping(BaseTestCase):
         self.api_url = "fake_api_url/rolesmapping/"
         self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "fake_api_url")
 
-        self.mocked_requests_delete = self.set_up_patch('searchguard.rolesmapping.requests.delete')
+        self.mocked_requests_delete = self.set_up_patch('searchguard.transport.requests.delete')
         self.mocked_requests_delete.return_value = Mock(status_code=200)
         self.mocked_check_rolemapping_exists = self.set_up_patch('searchguard.rolesmapping.check_rolemapping_exists')
         self.mocked_check_rolemapping_exists.return_value = True
@@ -16,7 +16,7 @@ class TestViewAllRoleMapping(BaseTestCase):
                             "role2": {"users": ["doe"]}}
 
         self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "fake_api_url")
-        self.mocked_requests_get = self.set_up_patch('searchguard.rolesmapping.requests.get')
+        self.mocked_requests_get = self.set_up_patch('searchguard.transport.requests.get')
         self.mocked_requests_get.return_value = Mock(status_code=200, text=json.dumps(self.permissions))
 
     def test_view_rolemapping_returns_role_information_when_correctly_called(self):
@@ -15,7 +15,7 @@ class TestViewRoleMapping(BaseTestCase):
         self.api_url = "fake_api_url/rolesmapping/"
         self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "fake_api_url")
 
-        self.mocked_requests_get = self.set_up_patch('searchguard.rolesmapping.requests.get')
+        self.mocked_requests_get = self.set_up_patch('searchguard.transport.requests.get')
         self.mocked_requests_get.return_value = Mock(status_code=200, text=json.dumps(self.permissions))
 
     def test_view_rolemapping_returns_role_information_when_correctly_called(self):
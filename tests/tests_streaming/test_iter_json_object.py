@@ -0,0 +1,40 @@
+#!/usr/bin/python3
+
+import json
+from tests.helper import BaseTestCase
+from searchguard.streaming import iter_json_object
+
+
+def chunked(text, size):
+    data = text.encode('utf-8')
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class TestIterJsonObject(BaseTestCase):
+
+    def setUp(self):
+        self.users = {"dummyuser1": {"hash": "123", "roles": ["a", "b"]},
+                      u"d\xfcmmyuser2": {"hash": "456", "attributes": {"attr1": "value 1, with {braces}"}},
+                      "dummyuser3": {"count": 12345}}
+        self.body = json.dumps(self.users, indent=2)
+
+    def test_iter_json_object_yields_all_items(self):
+        self.assertEqual(dict(iter_json_object([self.body.encode('utf-8')])), self.users)
+
+    def test_iter_json_object_handles_items_split_over_chunks(self):
+        for size in (1, 3, 7, 64):
+            self.assertEqual(dict(iter_json_object(chunked(self.body, size))), self.users)
+
+    def test_iter_json_object_yields_nothing_for_empty_object(self):
+        self.assertEqual(list(iter_json_object(chunked(' { } ', 1))), [])
+
+    def test_iter_json_object_does_not_split_numbers_over_chunks(self):
+        self.assertEqual(list(iter_json_object([b'{"a": 12', b'34}'])), [("a", 1234)])
+
+    def test_iter_json_object_raises_value_error_on_truncated_input(self):
+        with self.assertRaises(ValueError):
+            list(iter_json_object(chunked(self.body[:-10], 5)))
+
+    def test_iter_json_object_raises_value_error_when_not_an_object(self):
+        with self.assertRaises(ValueError):
+            list(iter_json_object([b'["a", "b"]']))
@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+
+import json
+from mock import Mock, ANY
+from tests.helper import BaseTestCase
+from searchguard.tenants import teardown_tenant
+
+
+class TestTeardownTenant(BaseTestCase):
+
+    def setUp(self):
+        self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "fake_api_url")
+
+        self.mocked_list_users = self.set_up_patch('searchguard.tenants.list_users')
+        self.mocked_list_users.return_value = {"999_user1": {}, "999_user2": {}}
+        self.mocked_view_all_rolemappings = self.set_up_patch('searchguard.tenants.view_all_rolemappings')
+        self.mocked_view_all_rolemappings.return_value = {
+            "role1": {"users": ["999_user1", "other"], "backendroles": ["br"], "readonly": False},
+            "role2": {"users": ["999_user1", "999_user2"], "hosts": ["*.example.com"]},
+            "role3": {"users": ["other"]},
+        }
+
+        self.mocked_requests_delete = self.set_up_patch('searchguard.transport.requests.delete')
+        self.mocked_requests_delete.return_value = Mock(status_code=200)
+        self.mocked_requests_put = self.set_up_patch('searchguard.transport.requests.put')
+        self.mocked_requests_put.return_value = Mock(status_code=200)
+
+    def put_bodies(self):
+        return {args[0]: json.loads(kwargs['data']) for args, kwargs in self.mocked_requests_put.call_args_list}
+
+    def test_teardown_tenant_lists_users_by_prefix(self):
+        teardown_tenant('999')
+
+        self.mocked_list_users.assert_called_once_with(prefix='999')
+
+    def test_teardown_tenant_deletes_every_matched_user_once(self):
+        report = teardown_tenant('999')
+
+        self.assertEqual(sorted(args[0] for args, _ in self.mocked_requests_delete.call_args_list),
+                         ['fake_api_url/internalusers/999_user1', 'fake_api_url/internalusers/999_user2'])
+        self.assertEqual(report.deleted, ['999_user1', '999_user2'])
+
+    def test_teardown_tenant_writes_each_affected_rolemapping_once_without_tenant_users(self):
+        report = teardown_tenant('999')
+
+        self.assertEqual(self.put_bodies(), {
+            'fake_api_url/rolesmapping/role1': {"users": ["other"], "backendroles": ["br"], "hosts": []},
+            'fake_api_url/rolesmapping/role2': {"users": [], "backendroles": [], "hosts": ["*.example.com"]},
+        })
+        self.assertEqual(report.updated_rolemappings, ['role1', 'role2'])
+        self.assertTrue(report.ok)
+
+    def test_teardown_tenant_dry_run_does_not_write(self):
+        report = teardown_tenant('999', dry_run=True)
+
+        self.mocked_requests_delete.assert_not_called()
+        self.mocked_requests_put.assert_not_called()
+        self.assertEqual(report.users, ['999_user1', '999_user2'])
+        self.assertEqual(report.rolemappings, {'role1': ['999_user1'], 'role2': ['999_user1', '999_user2']})
+
+    def test_teardown_tenant_reports_already_deleted_users_as_missing(self):
+        self.mocked_requests_delete.side_effect = [Mock(status_code=404), Mock(status_code=200)]
+
+        report = teardown_tenant('999', concurrency=1)
+
+        self.assertEqual(report.missing, ['999_user1'])
+        self.assertEqual(report.deleted, ['999_user2'])
+
+    def test_teardown_tenant_collects_failures_and_continues(self):
+        self.mocked_requests_delete.return_value = Mock(status_code=500, text='boom')
+        self.mocked_requests_put.return_value = Mock(status_code=500, text='boom')
+
+        report = teardown_tenant('999')
+
+        self.assertFalse(report.ok)
+        self.assertEqual(sorted(report.failed_users), ['999_user1', '999_user2'])
+        self.assertEqual(sorted(report.failed_rolemappings), ['role1', 'role2'])
@@ -0,0 +1,129 @@
+#!/usr/bin/python3
+
+import unittest
+import requests
+import urllib3
+from mock import Mock, ANY, patch
+from tests.helper import BaseTestCase
+from searchguard.exceptions import SearchGuardException, TransportException
+from searchguard.transport import send, set_transport, get_transport, Transport, RequestsTransport, \
+    Urllib3Transport, HttpxTransport, Response
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+class TestTransport(BaseTestCase):
+
+    def setUp(self):
+        self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "fake_api_url")
+        self.set_up_patch('searchguard.settings.SEARCHGUARD_API_AUTH', ("user", "pass"))
+        patcher = patch('searchguard.transport._transport', None)
+        self.addCleanup(patcher.stop)
+        patcher.start()
+
+        self.mocked_requests_get = self.set_up_patch('searchguard.transport.requests.get')
+        self.mocked_requests_get.return_value = Mock(status_code=200)
+
+    def test_get_transport_returns_requests_transport_by_default(self):
+        self.assertIsInstance(get_transport(), RequestsTransport)
+
+    def test_set_transport_accepts_transport_name(self):
+        set_transport('urllib3')
+
+        self.assertIsInstance(get_transport(), Urllib3Transport)
+
+    def test_set_transport_raises_value_error_for_unknown_name(self):
+        with self.assertRaises(ValueError):
+            set_transport('carrier_pigeon')
+
+    def test_set_transport_closes_previous_transport(self):
+        previous = Mock(spec=Transport)
+        set_transport(previous)
+
+        set_transport(Mock(spec=Transport))
+        previous.close.assert_called_once_with()
+
+    def test_send_calls_active_transport_with_full_url_and_auth(self):
+        mocked_transport = Mock(spec=Transport)
+        mocked_transport.request.return_value = Mock(status_code=200)
+        set_transport(mocked_transport)
+
+        send('put', 'roles/DummyRole', data='{}', headers={'content-type': 'application/json'})
+        mocked_transport.request.assert_called_once_with('put', 'fake_api_url/roles/DummyRole', data='{}',
+                                                         headers={'content-type': 'application/json'},
+                                                         auth=("user", "pass"), stream=False, timeout=None)
+
+    def test_requests_transport_only_passes_given_arguments(self):
+        send('get', 'roles/DummyRole')
+
+        self.mocked_requests_get.assert_called_once_with('fake_api_url/roles/DummyRole', auth=(ANY, ANY))
+
+    def test_urllib3_transport_returns_response_with_status_code_and_text(self):
+        urllib3_transport = Urllib3Transport()
+        urllib3_transport.pool = Mock()
+        urllib3_transport.pool.request.return_value = Mock(status=201, data=b'{"status":"CREATED"}', headers={})
+
+        response = urllib3_transport.request('put', 'fake_api_url/roles/DummyRole', data='{}', auth=("user", "pass"))
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.text, '{"status":"CREATED"}')
+
+    def test_urllib3_transport_sends_basic_auth_header(self):
+        urllib3_transport = Urllib3Transport()
+        urllib3_transport.pool = Mock()
+        urllib3_transport.pool.request.return_value = Mock(status=200, data=b'', headers={})
+
+        urllib3_transport.request('get', 'fake_api_url/roles/DummyRole', auth=("user", "pass"))
+
+        headers = urllib3_transport.pool.request.call_args[1]['headers']
+        self.assertEqual(headers['authorization'], 'Basic dXNlcjpwYXNz')
+
+    def test_requests_connection_error_is_raised_as_transport_exception(self):
+        self.mocked_requests_get.side_effect = requests.ConnectionError('connection refused')
+
+        with self.assertRaises(TransportException) as raised:
+            send('get', 'roles/DummyRole')
+        self.assertIsInstance(raised.exception, SearchGuardException)
+        self.assertIsInstance(raised.exception.__cause__, requests.ConnectionError)
+
+    def test_requests_errors_are_still_caught_as_requests_exceptions(self):
+        for error, caught in ((requests.ConnectionError('refused'), requests.ConnectionError),
+                              (requests.ReadTimeout('read timed out'), requests.Timeout),
+                              (requests.ConnectTimeout('connect timed out'), requests.ConnectionError),
+                              (requests.ConnectTimeout('connect timed out'), requests.Timeout)):
+            self.mocked_requests_get.side_effect = error
+
+            with self.assertRaises(caught) as raised:
+                send('get', 'roles/DummyRole')
+            self.assertIsInstance(raised.exception, TransportException)
+
+    def test_urllib3_connection_error_is_raised_as_transport_exception(self):
+        urllib3_transport = Urllib3Transport()
+        urllib3_transport.pool = Mock()
+        urllib3_transport.pool.request.side_effect = urllib3.exceptions.NewConnectionError(None, 'refused')
+
+        with self.assertRaises(TransportException):
+            urllib3_transport.request('get', 'fake_api_url/roles/DummyRole')
+
+    @unittest.skipIf(httpx is None, 'httpx is not installed')
+    def test_httpx_connection_error_is_raised_as_transport_exception(self):
+        httpx_transport = HttpxTransport(http2=False)
+        self.addCleanup(httpx_transport.close)
+        httpx_transport.client = Mock()
+        httpx_transport.client.send.side_effect = httpx.ConnectError('refused')
+
+        with self.assertRaises(TransportException):
+            httpx_transport.request('get', 'fake_api_url/roles/DummyRole')
+
+    def test_response_text_decodes_content(self):
+        self.assertEqual(Response(200, u'caf\xe9'.encode('utf-8')).text, u'caf\xe9')
+
+    def test_response_iter_content_yields_streamed_chunks(self):
+        close = Mock()
+        response = Response(200, chunks=iter([b'{"a"', b': 1}']), close=close)
+
+        self.assertEqual(list(response.iter_content()), [b'{"a"', b': 1}'])
+        close.assert_called_once_with()
@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+
+from tests.helper import BaseTestCase
+from searchguard.userindex import UserIndex
+
+
+class TestUserIndex(BaseTestCase):
+
+    def setUp(self):
+        self.users = {
+            "100_alice": {"roles": ["a"]},
+            "100_bob": {},
+            "200_alice": {},
+            "200": {},
+            "300_carol_admin": {},
+        }
+        self.index = UserIndex(self.users)
+
+    def test_fetch_builds_index_from_list_users(self):
+        mocked_list_users = self.set_up_patch('searchguard.userindex.list_users')
+        mocked_list_users.return_value = self.users
+
+        self.assertEqual(UserIndex.fetch().count_by_prefix(), {"100": 2, "200": 2, "300": 1})
+        mocked_list_users.assert_called_once_with()
+
+    def test_group_by_prefix(self):
+        self.assertEqual(self.index.group_by_prefix()["100"], {"100_alice": {"roles": ["a"]}, "100_bob": {}})
+
+    def test_list_users_matches_list_users_semantics(self):
+        for prefix, search in ((None, None), ("100", None), (None, "alice"), ("200", "alice"), ("300", "carol_a")):
+            expected = self.users
+            if prefix:
+                expected = {k: v for k, v in expected.items() if k.split('_')[0] == prefix}
+            if search:
+                expected = {k: v for k, v in expected.items() if search in k}
+            self.assertEqual(self.index.list_users(prefix=prefix, search=search), expected)
+
+    def test_search_reports_every_matching_username_once(self):
+        self.assertEqual(self.index.search("a"), {"100_alice", "200_alice", "300_carol_admin"})
+        self.assertEqual(self.index.search("_"), {"100_alice", "100_bob", "200_alice", "300_carol_admin"})
+        self.assertEqual(self.index.search("bob\n200"), set())
+
+    def test_users_for_prefixes(self):
+        self.assertEqual(self.index.users_for_prefixes(["100", "200", "999"], search="alice"),
+                         {"100": {"100_alice": {"roles": ["a"]}}, "200": {"200_alice": {}}, "999": {}})
+
+    def test_refresh_applies_only_the_changes(self):
+        users = dict(self.users)
+        del users["100_bob"]
+        users["100_alice"] = {"roles": ["b"]}
+        users["400_dave"] = {}
+
+        self.assertEqual(self.index.refresh(users), (["400_dave"], ["100_bob"], ["100_alice"]))
+        self.assertEqual(self.index.count_by_prefix(), {"100": 1, "200": 2, "300": 1, "400": 1})
+        self.assertEqual(self.index.search("dave"), {"400_dave"})
+        self.assertEqual(self.index.search("bob"), set())
+
+    def test_empty_groups_are_dropped(self):
+        self.index.remove("300_carol_admin")
+
+        self.assertNotIn("300", self.index.count_by_prefix())
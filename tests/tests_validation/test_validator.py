@@ -0,0 +1,84 @@
+#!/usr/bin/python3
+
+from mock import Mock
+from tests.helper import BaseTestCase
+import searchguard.validation as validation
+from searchguard.validation import Validator
+from searchguard.internalusers import create_user
+from searchguard.roles import create_role
+from searchguard.rolesmapping import create_rolemapping
+from searchguard.exceptions import ValidationException
+
+
+class TestValidator(BaseTestCase):
+
+    def setUp(self):
+        self.validator = Validator('6')
+
+    def test_valid_bodies_have_no_errors(self):
+        self.assertEqual(self.validator.errors('internalusers', {"hash": "$2a$1234", "roles": ["DummyRole"]}), [])
+        self.assertEqual(self.validator.errors('roles', {
+            "cluster": ["dummyperm"],
+            "indices": {"dummyindice": {"dummytype": ["READ"], "_dls_": "{}"}},
+            "tenants": {"tenant": "RW"},
+        }), [])
+        self.assertEqual(self.validator.errors('rolesmapping', {"users": ["worf"], "readonly": True}), [])
+
+    def test_every_error_is_reported(self):
+        errors = self.validator.errors('roles', {"cluster": "dummyperm", "indices": {"i": {"t": [1]}}, "x": 1})
+
+        self.assertEqual(errors, ['body: unknown fields x', 'cluster: expected a list of strings',
+                                  'indices.i.t: expected a list of strings, got 1'])
+
+    def test_rolemapping_needs_users_backendroles_or_hosts(self):
+        self.assertEqual(self.validator.errors('rolesmapping', {}),
+                         ['body: include at least one of users, backendroles, hosts'])
+
+    def test_schemas_follow_the_version(self):
+        validator = Validator('7.x')
+
+        self.assertEqual(validator.errors('rolesmapping', {"backend_roles": ["admin"]}), [])
+        self.assertEqual(validator.errors('roles', {"index_permissions": [{"allowed_actions": ["READ"]}]}),
+                         ['index_permissions[0]: missing field index_patterns'])
+
+    def test_unknown_version_is_rejected(self):
+        with self.assertRaises(ValueError):
+            Validator('5')
+
+    def test_validate_batch_returns_errors_per_name(self):
+        invalid = self.validator.validate_batch('internalusers', {
+            "user1": {"password": "secret"},
+            "user2": {"password": 1},
+            "user3": [],
+        })
+
+        self.assertEqual(invalid, {"user2": ['password: expected a string'], "user3": ['body: expected an object']})
+
+
+class TestValidationBeforeRequests(BaseTestCase):
+
+    def setUp(self):
+        self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "fake_api_url")
+        self.mocked_requests_get = self.set_up_patch('searchguard.transport.requests.get')
+        self.mocked_requests_put = self.set_up_patch('searchguard.transport.requests.put')
+        validation.enable('6')
+        self.addCleanup(validation.disable)
+
+    def test_invalid_bodies_are_rejected_without_requests(self):
+        for create in (lambda: create_user("user", properties={"roles": "admin"}),
+                       lambda: create_role("role", {"cluster": [1]}),
+                       lambda: create_rolemapping("role", {"backend_roles": ["admin"]})):
+            with self.assertRaises(ValidationException) as context:
+                create()
+            self.assertEqual(len(context.exception.errors), 1)
+
+        self.mocked_requests_get.assert_not_called()
+        self.mocked_requests_put.assert_not_called()
+
+    def test_valid_bodies_are_sent(self):
+        self.mocked_requests_get.return_value = Mock(status_code=404)
+        self.mocked_requests_put.return_value = Mock(status_code=201)
+
+        create_user("user", properties={"roles": ["admin"]})
+
+        self.mocked_requests_put.assert_called_once()
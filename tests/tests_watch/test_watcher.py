@@ -0,0 +1,145 @@
+#!/usr/bin/python3
+
+import asyncio
+import json
+import threading
+from mock import Mock
+from tests.helper import BaseTestCase
+from searchguard.watch import Watcher, ChangeEvent, ADDED, REMOVED, CHANGED
+from searchguard.exceptions import ListRolesException
+
+
+class TestWatcher(BaseTestCase):
+
+    def setUp(self):
+        self.set_up_patch('searchguard.settings.SEARCHGUARD_API_URL', "fake_api_url")
+        self.data = {
+            'roles': {"role1": {"cluster": ["a", "b"]}, "role2": {}},
+            'rolesmapping': {"role1": {"users": ["john"]}},
+        }
+        self.mocked_requests_get = self.set_up_patch('searchguard.transport.requests.get')
+        self.mocked_requests_get.side_effect = lambda url, **kwargs: Mock(
+            status_code=200, text=json.dumps(self.data[url.split('/')[-2]]))
+        self.mocked_parse_json = self.set_up_patch('searchguard.transport.parse_json')
+        self.mocked_parse_json.side_effect = lambda response: json.loads(response.text)
+
+    def run_async(self, coroutine):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        return loop.run_until_complete(coroutine)
+
+    def watcher(self, **kwargs):
+        watcher = Watcher(resources=('roles', 'rolesmapping'), **kwargs)
+        self.addCleanup(watcher.stop)
+        return watcher
+
+    def test_first_poll_records_state_without_events(self):
+        self.assertEqual(self.watcher().poll('roles'), [])
+
+    def test_poll_emits_added_removed_and_changed_events(self):
+        watcher = self.watcher()
+        watcher.poll('roles')
+        self.data['roles'] = {"role1": {"cluster": ["a", "c"]}, "role3": {}}
+
+        events = watcher.poll('roles')
+
+        self.assertEqual(events, [ChangeEvent('roles', CHANGED, 'role1', {"cluster": ["a", "c"]}, {"cluster": ["a", "b"]}),
+                                  ChangeEvent('roles', REMOVED, 'role2', None, {}),
+                                  ChangeEvent('roles', ADDED, 'role3', {}, None)])
+
+    def test_unchanged_body_is_not_parsed(self):
+        watcher = self.watcher()
+        watcher.poll('roles')
+
+        self.assertEqual(watcher.poll('roles'), [])
+        self.assertEqual((watcher.polls, watcher.parsed), (2, 1))
+        self.assertEqual(self.mocked_parse_json.call_count, 1)
+
+    def test_reordered_lists_are_no_change(self):
+        watcher = self.watcher()
+        watcher.poll('roles')
+        self.data['roles']["role1"]["cluster"] = ["b", "a"]
+
+        self.assertEqual(watcher.poll('roles'), [])
+        self.assertEqual(watcher.parsed, 2)
+
+    def test_failed_poll_is_reported_to_on_error(self):
+        on_error = Mock()
+        self.mocked_requests_get.side_effect = lambda url, **kwargs: Mock(status_code=500, text='error')
+
+        self.watcher(on_error=on_error).start()
+
+        self.assertIsInstance(on_error.call_args_list[0][0][1], ListRolesException)
+
+    def test_callbacks_receive_events_from_background_polls(self):
+        received = threading.Event()
+        watcher = self.watcher(interval={'roles': 0.01, 'rolesmapping': 60})
+        callback = watcher.subscribe(Mock(side_effect=lambda event: received.set()))
+        watcher.start()
+
+        self.data['roles'] = {}
+        self.assertTrue(received.wait(5))
+
+        self.assertEqual(callback.call_args_list[0][0][0].kind, REMOVED)
+
+    def test_sync_iterator_yields_events_until_stopped(self):
+        watcher = self.watcher(interval=0.01)
+        iterator = iter(watcher)
+        self.data['rolesmapping'] = {}
+
+        event = next(iterator)
+        watcher.stop()
+
+        self.assertEqual((event.resource, event.kind, event.name), ('rolesmapping', REMOVED, 'role1'))
+        self.assertEqual(list(iterator), [])
+
+    def test_async_iterator_yields_events(self):
+        watcher = self.watcher(interval=0.01)
+
+        async def consume():
+            events = []
+            async for event in watcher:
+                events.append(event)
+                if len(events) == 2:
+                    watcher.stop()
+            return events
+
+        change = threading.Timer(0.05, self.data.update, kwargs={'roles': {}})
+        change.start()
+        self.addCleanup(change.cancel)
+        events = self.run_async(consume())
+
+        self.assertEqual([(event.kind, event.name) for event in events], [(REMOVED, 'role1'), (REMOVED, 'role2')])
+
+    def test_cancelled_async_wait_does_not_lose_events(self):
+        watcher = self.watcher(interval=0.01)
+
+        async def consume():
+            iterator = watcher.__aiter__()
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(iterator.__anext__(), 0.01)
+            self.data['rolesmapping'] = {}
+            return await asyncio.wait_for(iterator.__anext__(), 5)
+
+        event = self.run_async(consume())
+
+        self.assertEqual((event.kind, event.name), (REMOVED, 'role1'))
+
+    def test_full_queue_holds_polling_back(self):
+        watcher = self.watcher(interval=0.01, max_queue=1)
+        iterator = iter(watcher)
+        self.data['roles'] = {"role{}".format(i): {} for i in range(5)}
+
+        threading.Event().wait(0.2)
+
+        self.assertEqual(iterator._consumer.queue.qsize(), 1)
+        self.assertLess(watcher.polls, 10)
+
+    def test_abandoned_iterator_does_not_hold_polling_back(self):
+        watcher = self.watcher(interval=0.01, max_queue=1)
+        iter(watcher)
+        self.data['roles'] = {"role{}".format(i): {} for i in range(5)}
+
+        threading.Event().wait(0.2)
+
+        self.assertGreater(watcher.polls, 10)
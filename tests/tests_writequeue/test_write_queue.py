@@ -0,0 +1,143 @@
+#!/usr/bin/python3
+
+import os
+import shutil
+import tempfile
+from tests.helper import BaseTestCase
+from searchguard.writequeue import WriteQueue, retryable, DONE, FAILED, PENDING
+from searchguard.exceptions import WriteBehindException, ModifyRoleMappingException, UserAlreadyExistsException, \
+    CheckRoleExistsException, CircuitOpenException, RoleMappingNotFoundException, RoleNotFoundException, \
+    TransportException
+
+
+class TestWriteQueue(BaseTestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'writes.db')
+        self.queue = WriteQueue(self.path, retry_delay=0, max_attempts=2, poll_interval=0.01)
+        self.addCleanup(self.queue.close)
+
+        self.mocked_modify_rolemapping = self.set_up_patch('searchguard.writequeue.rolesmapping.modify_rolemapping')
+        self.mocked_delete_user = self.set_up_patch('searchguard.writequeue.internalusers.delete_user')
+
+    def drain(self):
+        while self.queue.run_once():
+            pass
+
+    def test_intents_are_sent_in_order(self):
+        self.queue.modify_rolemapping('role1', {'users': ['a']}, 'split')
+        self.queue.delete_user('user1')
+        self.drain()
+
+        self.mocked_modify_rolemapping.assert_called_once_with('role1', {'users': ['a']}, 'split')
+        self.mocked_delete_user.assert_called_once_with('user1')
+        self.assertEqual(self.queue.pending(), 0)
+
+    def test_merges_of_the_same_role_mapping_are_coalesced(self):
+        first = self.queue.modify_rolemapping('role1', {'users': ['b']}, 'merge')
+        second = self.queue.modify_rolemapping('role1', {'users': ['a'], 'hosts': ['h']}, 'merge')
+        self.drain()
+
+        self.mocked_modify_rolemapping.assert_called_once_with('role1', {'users': ['a', 'b'], 'hosts': ['h']}, 'merge')
+        self.assertEqual(self.queue.status(first), DONE)
+        self.assertEqual(self.queue.status(second), DONE)
+
+    def test_replace_supersedes_pending_modification(self):
+        self.queue.modify_rolemapping('role1', {'users': ['a']}, 'merge')
+        self.queue.modify_rolemapping('role1', {'users': ['b']})
+        self.drain()
+
+        self.mocked_modify_rolemapping.assert_called_once_with('role1', {'users': ['b']}, 'replace')
+
+    def test_merge_and_split_are_not_coalesced(self):
+        self.queue.modify_rolemapping('role1', {'users': ['a']}, 'merge')
+        self.queue.modify_rolemapping('role1', {'users': ['a']}, 'split')
+        self.drain()
+
+        self.assertEqual([call[0][2] for call in self.mocked_modify_rolemapping.call_args_list], ['merge', 'split'])
+
+    def test_failed_write_blocks_later_writes_to_the_same_resource(self):
+        self.mocked_modify_rolemapping.side_effect = [ModifyRoleMappingException('down'), None, None]
+        first = self.queue.modify_rolemapping('role1', {'users': ['a']}, 'merge')
+        self.queue.modify_rolemapping('role1', {'users': ['a']}, 'split')
+
+        self.queue.run_once()
+        self.assertEqual(self.queue.status(first), PENDING)
+        self.drain()
+
+        self.assertEqual([call[0][2] for call in self.mocked_modify_rolemapping.call_args_list],
+                         ['merge', 'merge', 'split'])
+
+    def test_wait_raises_when_write_failed_permanently(self):
+        self.mocked_delete_user.side_effect = IOError('connection refused')
+        intent_id = self.queue.delete_user('user1')
+        self.drain()
+
+        self.assertEqual(self.queue.status(intent_id), FAILED)
+        with self.assertRaises(WriteBehindException):
+            self.queue.wait(intent_id)
+
+    def test_wait_for_everything_raises_when_a_write_failed(self):
+        self.mocked_delete_user.side_effect = ValueError('invalid')
+        self.queue.delete_user('user1')
+        self.drain()
+        self.mocked_delete_user.side_effect = None
+        self.queue.delete_user('user2')
+        self.drain()
+
+        with self.assertRaises(WriteBehindException):
+            self.queue.wait()
+        # Reported once, later waits cover the writes queued since
+        self.assertTrue(self.queue.wait())
+
+    def test_queued_user_needs_a_password_or_hash(self):
+        with self.assertRaises(ValueError):
+            self.queue.create_user('user1', {'roles': ['admin']})
+        self.queue.create_user('user2', {'hash': '$2y$12$abc'})
+
+        self.assertEqual(self.queue.pending(), 1)
+
+    def test_write_to_missing_entity_is_not_retried(self):
+        self.mocked_modify_rolemapping.side_effect = RoleMappingNotFoundException('Mapping for role role1 does not exist')
+        intent_id = self.queue.modify_rolemapping('role1', {'users': ['a']})
+        self.queue.run_once()
+
+        self.assertEqual(self.queue.status(intent_id), FAILED)
+        self.mocked_modify_rolemapping.assert_called_once()
+
+    def test_only_transient_errors_are_retryable(self):
+        self.assertFalse(retryable(UserAlreadyExistsException('User user1 already exists')))
+        self.assertFalse(retryable(RoleNotFoundException('Role role1 does not exist')))
+        self.assertTrue(retryable(CheckRoleExistsException('Unknown error checking whether rolerole1 exists')))
+        self.assertTrue(retryable(ModifyRoleMappingException('Error modifying role1 - msg: user does not exist yet')))
+        self.assertTrue(retryable(TransportException('GET fake_api_url/roles/ failed')))
+        self.assertTrue(retryable(CircuitOpenException('open')))
+        self.assertTrue(retryable(IOError('connection refused')))
+
+    def test_wait_returns_false_on_timeout(self):
+        self.queue.delete_user('user1')
+
+        self.assertFalse(self.queue.wait(timeout=0.05))
+
+    def test_background_worker_drains_queue(self):
+        self.queue.start()
+        intent_id = self.queue.delete_user('user1')
+
+        self.assertTrue(self.queue.wait(intent_id, timeout=5))
+        self.mocked_delete_user.assert_called_once_with('user1')
+
+    def test_intents_survive_a_restart(self):
+        self.queue.delete_user('user1')
+        self.queue.close()
+
+        queue = WriteQueue(self.path)
+        self.addCleanup(queue.close)
+        queue.run_once()
+
+        self.mocked_delete_user.assert_called_once_with('user1')
+
+    def test_unknown_operation_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.queue.enqueue('roles', 'role1', 'modify')